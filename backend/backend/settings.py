@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -152,6 +154,107 @@ CELERY_BROKER_URL = os.environ.get("BROKER_URL", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = os.environ.get("RESULT_BACKEND", "redis://redis:6379/0")
 CELERY_IMPORTS = ['tasks']
 
+# Инференс и короткие I/O-задачи разведены по разным очередям и воркерам,
+# чтобы очистка и архивирование не ждали за многоминутной обработкой видео
+CELERY_TASK_DEFAULT_QUEUE = 'io'
+CELERY_TASK_ROUTES = {
+    'tasks.task_process_video': {'queue': 'inference'},
+    'tasks.task_to_zip': {'queue': 'io'},
+    'tasks.task_clear_requests': {'queue': 'io'},
+    'tasks.task_dispatch_jobs': {'queue': 'io'},
+}
+# Предел одной попытки обработки видео (секунды): по мягкому пределу задача уходит
+# на повтор с чекпоинта, через минуту после него процесс снимается жестко.
+# В пулах threads и solo пределы Celery не работают
+TASK_TIME_LIMIT = int(os.environ.get("TASK_TIME_LIMIT", 2 * 3600))
+# Приоритеты задач в Redis: 0 — самый высокий, сообщения разложены по 10 подочередям
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'queue_order_strategy': 'priority',
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    # Неподтвержденная (acks_late) задача вернется в очередь через столько секунд.
+    # Это же задержка повтора видео, чей воркер пропал: чем меньше, тем быстрее повтор,
+    # но значение должно быть больше жесткого предела задачи, иначе идущее видео возьмут дважды
+    'visibility_timeout': int(os.environ.get("CELERY_VISIBILITY_TIMEOUT") or TASK_TIME_LIMIT + 600),
+}
+if CELERY_BROKER_TRANSPORT_OPTIONS['visibility_timeout'] <= TASK_TIME_LIMIT + 60:
+    raise ImproperlyConfigured(
+        f"CELERY_VISIBILITY_TIMEOUT должен быть больше TASK_TIME_LIMIT + 60 ({TASK_TIME_LIMIT + 60})"
+    )
+# Повторы обработки видео после ошибки (продолжаются с чекпоинта)
+TASK_MAX_RETRIES = int(os.environ.get("TASK_MAX_RETRIES", 2))
+TASK_RETRY_DELAY = int(os.environ.get("TASK_RETRY_DELAY", 30))
+# Как часто сохранять чекпоинт обработки видео (секунды); 0 — не сохранять
+CHECKPOINT_INTERVAL = float(os.environ.get("CHECKPOINT_INTERVAL", 60))
+
+# Веса моделей: .pt или папка квантованной модели из manage.py quantize_models
+CAR_MODEL_PATH = os.environ.get("CAR_MODEL_PATH", "yolov8n.pt")
+WHEEL_MODEL_PATH = os.environ.get("WHEEL_MODEL_PATH", "../ml/models/wheels_yolov11.pt")
+# Загружать и прогревать модели при старте каждого дочернего процесса воркера
+PRELOAD_MODELS = bool(int(os.environ.get("PRELOAD_MODELS", 0)))
+# Потоков torch/OpenCV на процесс; 0 — поделить ядра поровну между процессами воркера
+INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS", 0))
+# Привязывать каждый процесс воркера к своему набору ядер
+INFERENCE_PIN_CPUS = bool(int(os.environ.get("INFERENCE_PIN_CPUS", 0)))
+CELERY_CONCURRENCY_COUNT = int(os.environ.get("CELERY_CONCURRENCY_COUNT", 1))
+# Процессов детекции на одну задачу (1 — все в процессе воркера) и слотов кадров между ними (0 — авто)
+INFERENCE_PROCESSES = int(os.environ.get("INFERENCE_PROCESSES", 1))
+FRAME_RING_SLOTS = int(os.environ.get("FRAME_RING_SLOTS", 0))
+# Результат: full — все видео, highlights — только опасные моменты одним видео, clips — zip с клипом на событие
+OUTPUT_MODE = os.environ.get("OUTPUT_MODE", "full")
+# Сколько секунд видео оставлять до и после каждого события в highlights/clips
+OUTPUT_CLIP_PADDING = float(os.environ.get("OUTPUT_CLIP_PADDING", 2))
+# Кадров в одном gzip-блоке выгрузки детекций: меньше — точнее Range, больше — лучше сжатие
+DETECTIONS_CHUNK_FRAMES = int(os.environ.get("DETECTIONS_CHUNK_FRAMES", 250))
+# Пропуск (секунды), который не разрывает событие опасности одного трека
+DANGER_EVENT_MAX_GAP = float(os.environ.get("DANGER_EVENT_MAX_GAP", 0.5))
+# Максимальный пропуск машины в секундах, который заполняет выравнивание (отрисовка и выгрузка детекций).
+# Раньше restore_missing_cars_with_interpolation заполняла любой пропуск и дорисовывала машину
+# на всем видео до первого и после последнего появления; 0 возвращает это поведение,
+# но тогда выравниватель держит в памяти детекции всего видео
+ALIGN_MAX_GAP = float(os.environ.get("ALIGN_MAX_GAP", 2))
+# Поиск колес: crop — по машине, frame — один проход по кадру, roi — по области опасной зоны с отступом (px)
+WHEEL_STRATEGY = os.environ.get("WHEEL_STRATEGY", "crop")
+# Те же значения, что file_requests.detection.WHEEL_STRATEGIES: опечатка в переменной
+# окружения иначе молча включила бы поиск по всему кадру
+WHEEL_STRATEGIES = ('crop', 'frame', 'roi')
+if WHEEL_STRATEGY not in WHEEL_STRATEGIES:
+    raise ImproperlyConfigured(
+        f"WHEEL_STRATEGY={WHEEL_STRATEGY!r}: ожидается одно из {', '.join(WHEEL_STRATEGIES)}"
+    )
+WHEEL_ROI_PADDING = int(os.environ.get("WHEEL_ROI_PADDING", 32))
+# Unix-сокет общего сервера инференса (manage.py run_inference_server); пусто — модели в процессе воркера
+INFERENCE_SERVER_SOCKET = os.environ.get("INFERENCE_SERVER_SOCKET", "")
+# Пачка сервера: не больше кадров и не дольше ожидания первого кадра (мс)
+INFERENCE_BATCH_SIZE = int(os.environ.get("INFERENCE_BATCH_SIZE", 8))
+INFERENCE_BATCH_DELAY_MS = float(os.environ.get("INFERENCE_BATCH_DELAY_MS", 10))
+
+# Как часто воркер сохраняет прогресс обработки в БД (секунды)
+PROGRESS_UPDATE_INTERVAL = float(os.environ.get("PROGRESS_UPDATE_INTERVAL", 2))
+
+# Окно (секунды), за которое /metrics агрегирует замеры завершенных задач
+METRICS_WINDOW = int(os.environ.get("METRICS_WINDOW", 3600))
+
+# Очистка просроченных запросов: размер пачки и бюджет времени одного запуска (секунды)
+CLEAR_REQUESTS_BATCH_SIZE = int(os.environ.get("CLEAR_REQUESTS_BATCH_SIZE", 500))
+CLEAR_REQUESTS_TIME_BUDGET = float(os.environ.get("CLEAR_REQUESTS_TIME_BUDGET", 60))
+
+# Планировщик: сколько видео обрабатывается одновременно всего и запросов у одного клиента.
+# По умолчанию — все процессы inference-воркеров: реплики × concurrency
+SCHEDULER_MAX_RUNNING = int(os.environ.get("SCHEDULER_MAX_RUNNING") or
+                            int(os.environ.get("WORKERS_COUNT", 1)) * CELERY_CONCURRENCY_COUNT)
+SCHEDULER_CLIENT_LIMIT = int(os.environ.get("SCHEDULER_CLIENT_LIMIT", 1))
+# За это время ожидания (секунды) оценка задачи уменьшается вдвое
+SCHEDULER_AGING_SECONDS = float(os.environ.get("SCHEDULER_AGING_SECONDS", 300))
+# Стоимость видео, у которого не прочитался заголовок (мегапиксель-секунды, ~1 минута 720p)
+SCHEDULER_DEFAULT_COST = float(os.environ.get("SCHEDULER_DEFAULT_COST", 55))
+# Полосы приоритета: (порог оценки, приоритет Celery); всё дороже — SCHEDULER_LOWEST_PRIORITY
+SCHEDULER_PRIORITY_LANES = ((60, 0), (600, 3), (6000, 6))
+SCHEDULER_LOWEST_PRIORITY = 9
+SCHEDULER_SCAN_LIMIT = int(os.environ.get("SCHEDULER_SCAN_LIMIT", 1000))
+# Задача без отчета дольше этого (секунды) считается потерянной и освобождает место
+SCHEDULER_JOB_TIMEOUT = int(os.environ.get("SCHEDULER_JOB_TIMEOUT", 6 * 3600))
+
 CELERY_BEAT_SCHEDULER = 'celery.beat.PersistentScheduler'
 CELERY_BEAT_SCHEDULE_FILENAME = '/tmp/celerybeat-schedule'
 CELERY_BEAT_SCHEDULE = {
@@ -159,8 +262,25 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'tasks.task_clear_requests',
         'schedule': 300.0,
     },
+    'dispatch-scheduled-jobs': {
+        'task': 'tasks.task_dispatch_jobs',
+        'schedule': float(os.environ.get("SCHEDULER_DISPATCH_INTERVAL", 15)),
+    },
 }
 
+# Кэш статусов запросов в Redis (отдельная база от брокера)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get("CACHE_URL", "redis://redis:6379/1"),
+    }
+}
+
+STATUS_CACHE_TIMEOUT = int(os.environ.get("STATUS_CACHE_TIMEOUT", 300))
+# Server-Sent Events: как часто проверять статус и сколько держать соединение (секунды)
+STATUS_STREAM_POLL_INTERVAL = float(os.environ.get("STATUS_STREAM_POLL_INTERVAL", 0.5))
+STATUS_STREAM_TIMEOUT = float(os.environ.get("STATUS_STREAM_TIMEOUT", 25))
+
 # aws settings
 AWS_ACCESS_KEY_ID = os.environ.get("MINIO_ROOT_USER", "minioadmin")
 AWS_SECRET_ACCESS_KEY = os.environ.get("MINIO_ROOT_PASSWORD", "minioadmin")
@@ -172,3 +292,16 @@ AWS_S3_CUSTOM_DOMAIN = f'{AWS_S3_ENDPOINT_URL}/{AWS_STORAGE_BUCKET_NAME}'
 PUBLIC_MEDIA_LOCATION = 'media'
 MEDIA_URL = f'{AWS_S3_CUSTOM_DOMAIN}/{PUBLIC_MEDIA_LOCATION}/'
 DEFAULT_FILE_STORAGE = 'file_requests.storage_backends.PublicMediaStorage'
+# Прямая загрузка в MinIO: срок жизни подписанной ссылки и токена финализации (секунды)
+UPLOAD_URL_EXPIRATION = int(os.environ.get("UPLOAD_URL_EXPIRATION", 3600))
+UPLOAD_TOKEN_MAX_AGE = int(os.environ.get("UPLOAD_TOKEN_MAX_AGE", 24 * 3600))
+# Ссылки на результат (секунды): срок жизни и сколько должно остаться, чтобы выдать ее повторно
+RESULT_LINK_EXPIRATION = int(os.environ.get("RESULT_LINK_EXPIRATION", 3600))
+RESULT_LINK_MIN_TTL = int(os.environ.get("RESULT_LINK_MIN_TTL", 600))
+# Результат отдает nginx из своего кэша (X-Accel-Redirect); 0 — редирект на MinIO, если nginx перед Django нет
+RESULT_ACCEL_REDIRECT = bool(int(os.environ.get("RESULT_ACCEL_REDIRECT", 1)))
+# Размер части возобновляемой загрузки (у S3 минимум 5 МБ для всех частей, кроме последней)
+CHUNKED_UPLOAD_CHUNK_SIZE = int(os.environ.get("CHUNKED_UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))
+# Размер части S3 multipart upload (не меньше 5 МБ) и блока потокового копирования
+MULTIPART_PART_SIZE = int(os.environ.get("MULTIPART_PART_SIZE", 8 * 1024 * 1024))
+STREAM_CHUNK_SIZE = int(os.environ.get("STREAM_CHUNK_SIZE", 1024 * 1024))
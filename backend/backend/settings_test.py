@@ -0,0 +1,5 @@
+from .settings import *  # noqa: F401,F403
+
+# Настройки для тестов: python manage.py test --settings=backend.settings_test.
+# Кэш статусов в памяти процесса, чтобы тестам не нужен был Redis
+CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
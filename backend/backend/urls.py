@@ -20,7 +20,10 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
-from file_requests.views import FileUploadAPIView, RequestStatusAPIView, index_view, request_page_view, request_time_processing_info
+from file_requests.views import FileUploadAPIView, PresignedUploadAPIView, FinalizeUploadAPIView, RequestStatusAPIView, \
+    ChunkedUploadStartAPIView, ChunkedUploadAPIView, ChunkedUploadPartAPIView, ChunkedUploadFinalizeAPIView, \
+    DangerEventListAPIView, DetectionsAPIView, detections_download_view, index_view, request_page_view, request_time_processing_info, metrics_view, request_status_events_view, result_link_view, \
+    result_download_view
 
 urlpatterns = [
     # admin
@@ -30,10 +33,28 @@ urlpatterns = [
     path('', index_view, name='index'),
     path('request/<str:request_id>/', request_page_view, name='request_page'),
     path('request/exec_time/<str:request_id>/', request_time_processing_info),
+    path('results/<path:name>', result_download_view, name='result_download'),
 
     
     # api
     path('api/upload/', FileUploadAPIView.as_view(), name='api_upload'),
+    path('api/upload/presign/', PresignedUploadAPIView.as_view(), name='api_upload_presign'),
+    path('api/upload/finalize/', FinalizeUploadAPIView.as_view(), name='api_upload_finalize'),
+    path('api/upload/chunked/', ChunkedUploadStartAPIView.as_view(), name='api_chunked_upload_start'),
+    path('api/upload/chunked/<uuid:upload_id>/', ChunkedUploadAPIView.as_view(), name='api_chunked_upload'),
+    path('api/upload/chunked/<uuid:upload_id>/<int:part_number>/', ChunkedUploadPartAPIView.as_view(),
+         name='api_chunked_upload_part'),
+    path('api/upload/chunked/<uuid:upload_id>/finalize/', ChunkedUploadFinalizeAPIView.as_view(),
+         name='api_chunked_upload_finalize'),
     path('api/status/<str:request_id>/', RequestStatusAPIView.as_view(), name='api_status'),
+    path('api/status/<str:request_id>/events/', request_status_events_view, name='api_status_events'),
+    path('api/status/<str:request_id>/link/', result_link_view, name='api_result_link'),
+
+    # monitoring
+    path('api/detections/<uuid:request_id>/', DetectionsAPIView.as_view(), name='api_detections'),
+    path('api/detections/<uuid:request_id>/<uuid:file_id>/', detections_download_view,
+         name='api_detections_download'),
+    path('api/events/', DangerEventListAPIView.as_view(), name='api_danger_events'),
+    path('metrics', metrics_view, name='metrics'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
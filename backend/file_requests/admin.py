@@ -1,8 +1,9 @@
 from django.contrib import admin
 
-from .models import EditedFile, Request, UploadedFile
+from .models import EditedFile, Request, UploadedFile, DangerEvent
 
 
 admin.site.register(Request)
 admin.site.register(UploadedFile)
 admin.site.register(EditedFile)
+admin.site.register(DangerEvent)
@@ -1,3 +1,5 @@
+from collections import deque
+
 from .geometry import Car, Polygon, Point
 
 def restore_missing_cars_with_interpolation(frames):
@@ -111,3 +113,89 @@ def restore_missing_cars_with_interpolation(frames):
         restored_frames.append(restored_frame)
     
     return restored_frames
+
+
+class StreamingAligner:
+    """
+    Потоковая версия restore_missing_cars_with_interpolation: кадры подаются по одному,
+    а выровненный кадр отдается, как только после него пришло max_gap кадров.
+    Сам выравниватель держит только окно из 2 * max_gap + 1 последних кадров;
+    память ограничена, только если и вызывающий код не собирает кадры в список
+    (run_pipeline сразу отдает их отрисовке и выгрузке).
+
+    Пропуск машины заполняется, только если она видна не дальше max_gap кадров
+    от него; при max_gap не меньше длины видео результат тот же, что у
+    restore_missing_cars_with_interpolation.
+    """
+
+    def __init__(self, max_gap: int):
+        self.max_gap = max_gap
+        # {id: машина} для кадров окна, первый из них — кадр номер _first_index
+        self._window = deque()
+        self._first_index = 0
+        self._next_index = 0
+
+    def push(self, frame) -> list:
+        """Добавляет кадр и возвращает кадры, которые стали окончательными"""
+        return [restored for _, restored in self.push_pairs(frame)]
+
+    def flush(self) -> list:
+        """Конец видео: отдает оставшиеся кадры"""
+        return [restored for _, restored in self.flush_pairs()]
+
+    def push_pairs(self, frame) -> list:
+        """То же, что push, но с каждым выровненным кадром отдает и исходные детекции этого кадра"""
+        self._window.append({car.id: car for car in frame})
+        ready = []
+        while self._next_index + self.max_gap < self._first_index + len(self._window):
+            ready.append(self._emit())
+        return ready
+
+    def flush_pairs(self) -> list:
+        ready = []
+        while self._next_index < self._first_index + len(self._window):
+            ready.append(self._emit())
+        return ready
+
+    def _find(self, car_id, positions):
+        for position in positions:
+            car = self._window[position].get(car_id)
+            if car is not None:
+                return position, car
+        return None, None
+
+    def _emit(self) -> tuple:
+        position = self._next_index - self._first_index
+        current = self._window[position]
+        car_ids = set().union(*self._window)
+
+        restored_frame = []
+        for car_id in sorted(car_ids):
+            if car_id in current:
+                restored_frame.append(current[car_id])
+                continue
+
+            prev_position, prev_car = self._find(car_id, range(position - 1, -1, -1))
+            next_position, next_car = self._find(car_id, range(position + 1, len(self._window)))
+
+            # Машину только с одной стороны берем без проверок: окно и так ограничено max_gap
+            if prev_car and next_car:
+                gap_middle = prev_position + (next_position - prev_position) // 2
+                source = prev_car if position <= gap_middle else next_car
+            else:
+                source = prev_car or next_car
+            restored_frame.append(Car(wheels=source.wheels, bounding_box=source.bounding_box, id=car_id))
+
+        self._next_index += 1
+        while self._first_index < self._next_index - self.max_gap:
+            self._window.popleft()
+            self._first_index += 1
+        return list(current.values()), restored_frame
+
+
+def align_stream(frames, max_gap: int):
+    """Выровненные кадры из любого итерируемого источника кадров (список, генератор детекций)"""
+    aligner = StreamingAligner(max_gap)
+    for frame in frames:
+        yield from aligner.push(frame)
+    yield from aligner.flush()
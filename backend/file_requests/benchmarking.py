@@ -0,0 +1,363 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from .geometry import Point, Polygon
+
+BACKGROUND_COLOR = (90, 90, 90)
+CAR_COLOR = (200, 120, 40)
+WHEEL_COLOR = (20, 20, 20)
+
+
+class SyntheticCase:
+    """Параметры синтетического видео для бенчмарка"""
+
+    def __init__(self, width: int, height: int, frames: int, vehicles: int, fps: int = 30,
+                 drop_rate: float = 0.1, seed: int = 0):
+        self.width = width
+        self.height = height
+        self.frames = frames
+        self.vehicles = vehicles
+        self.fps = fps
+        self.drop_rate = drop_rate
+        self.seed = seed
+
+    @property
+    def name(self):
+        return f"{self.width}x{self.height}_{self.frames}f_{self.vehicles}v"
+
+    def to_dict(self):
+        return {
+            'width': self.width,
+            'height': self.height,
+            'frames': self.frames,
+            'vehicles': self.vehicles,
+            'fps': self.fps,
+            'drop_rate': self.drop_rate,
+            'seed': self.seed,
+        }
+
+    def danger_zone(self) -> Polygon:
+        """Зона по центру кадра, которую пересекает часть машин"""
+        return Polygon.from_rectangle(Point(self.width * 0.4, self.height * 0.3), self.width * 0.2, self.height * 0.5)
+
+
+def generate_synthetic_video(case: SyntheticCase, path: str):
+    """
+    Рисует видео с прямоугольными "машинами", которые едут по горизонтали,
+    и возвращает эталонные рамки по кадрам: [[(track_id, x1, y1, x2, y2), ...], ...].
+    """
+    rng = random.Random(case.seed)
+    car_w = max(case.width // 8, 16)
+    car_h = max(case.height // 10, 12)
+
+    vehicles = []
+    for track_id in range(1, case.vehicles + 1):
+        vehicles.append({
+            'id': track_id,
+            'x': rng.uniform(-car_w, case.width),
+            'y': rng.uniform(0, case.height - car_h),
+            'speed': rng.choice([-1, 1]) * rng.uniform(1, 6) * case.width / 640,
+        })
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), case.fps, (case.width, case.height))
+    canned_boxes = []
+    for _ in range(case.frames):
+        frame = np.full((case.height, case.width, 3), BACKGROUND_COLOR, dtype=np.uint8)
+        frame_boxes = []
+        for vehicle in vehicles:
+            vehicle['x'] += vehicle['speed']
+            if vehicle['x'] > case.width:
+                vehicle['x'] = -car_w
+            elif vehicle['x'] < -car_w:
+                vehicle['x'] = case.width
+
+            x1, y1 = int(vehicle['x']), int(vehicle['y'])
+            x2, y2 = x1 + car_w, y1 + car_h
+            cv2.rectangle(frame, (x1, y1), (x2, y2), CAR_COLOR, -1)
+            wheel_r = max(car_h // 5, 2)
+            cv2.circle(frame, (x1 + car_w // 5, y2), wheel_r, WHEEL_COLOR, -1)
+            cv2.circle(frame, (x2 - car_w // 5, y2), wheel_r, WHEEL_COLOR, -1)
+
+            visible_x1, visible_x2 = max(x1, 0), min(x2, case.width)
+            if visible_x2 - visible_x1 > 1:
+                frame_boxes.append((vehicle['id'], visible_x1, y1, visible_x2, y2))
+        writer.write(frame)
+        canned_boxes.append(frame_boxes)
+    writer.release()
+    return canned_boxes
+
+
+class _Tensor:
+    """Минимальная обертка, повторяющая цепочки .cpu().numpy()/.int() из ultralytics"""
+
+    def __init__(self, data):
+        self.data = np.asarray(data)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.data
+
+    def int(self):
+        return _Tensor(self.data.astype(np.int32))
+
+
+class _Boxes:
+    def __init__(self, xyxy, conf=None, cls=None):
+        self.xyxy = _Tensor(np.asarray(xyxy, dtype=np.float32).reshape(-1, 4))
+        count = len(self.xyxy.data)
+        self.conf = _Tensor(np.full(count, 0.9, dtype=np.float32) if conf is None else conf)
+        self.cls = _Tensor(np.full(count, 2.0, dtype=np.float32) if cls is None else cls)
+
+
+class _Result:
+    def __init__(self, xyxy, conf=None, cls=None):
+        self.boxes = _Boxes(xyxy, conf, cls)
+
+
+class StubCarModel:
+    """Заглушка car_model.predict: по очереди отдает заранее известные рамки (id назначает трекер)"""
+
+    def __init__(self, canned_boxes, drop_rate: float = 0.0, seed: int = 0):
+        self.canned_boxes = canned_boxes
+        self.drop_rate = drop_rate
+        self.rng = random.Random(seed)
+        self.frame_idx = 0
+
+    def predict(self, frame, **kwargs):
+        boxes = self.canned_boxes[self.frame_idx] if self.frame_idx < len(self.canned_boxes) else []
+        self.frame_idx += 1
+        # Пропуски детекций, чтобы восстановлению в align было что делать
+        boxes = [box for box in boxes if self.rng.random() >= self.drop_rate]
+        return [_Result([box[1:] for box in boxes])]
+
+
+class StubWheelModel:
+    """Заглушка wheel_model.predict: два колеса в нижних углах кропа машины"""
+
+    def predict(self, crop, **kwargs):
+        height, width = crop.shape[:2]
+        size = max(min(width, height) // 4, 1)
+        wheels = [
+            (width // 5 - size // 2, height - size, width // 5 + size // 2, height),
+            (width - width // 5 - size // 2, height - size, width - width // 5 + size // 2, height),
+        ]
+        return [_Result(wheels)]
+
+
+class SyntheticFrameDetector:
+    """
+    Фабрика детектора для file_requests.frame_ring: находит машины синтетического
+    видео по цвету прямо на кадре, поэтому проверяет и то, что кадры дошли целыми.
+    """
+
+    def __call__(self):
+        return self.detect
+
+    @staticmethod
+    def detect(frame):
+        mask = cv2.inRange(frame, np.array(CAR_COLOR) - 30, np.array(CAR_COLOR) + 30)
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+        detections = []
+        for x, y, w, h, area in stats[1:count]:
+            if area > 4:
+                detections.append((float(x), float(y), float(x + w), float(y + h), 0.9, 2.0, []))
+        return detections, {'car_detection': 0.0, 'wheel_detection': 0.0}
+
+
+def _timing_stats(durations: list) -> dict:
+    return {
+        'runs': len(durations),
+        'min': round(min(durations), 6),
+        'median': round(statistics.median(durations), 6),
+        'mean': round(statistics.mean(durations), 6),
+    }
+
+
+def _measure(func, repeat: int):
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        durations.append(time.perf_counter() - start)
+    return result, _timing_stats(durations)
+
+
+def run_case(case: SyntheticCase, workdir: str, repeat: int = 3, real_models: bool = False) -> dict:
+    """Прогоняет этапы пайплайна на синтетическом видео и возвращает замеры"""
+    # Импорт здесь: tasks подтягивает celery-приложение
+    from tasks import process_video_traffic, draw_rectangles, get_models
+    from .align import restore_missing_cars_with_interpolation
+
+    input_path = os.path.join(workdir, f"{case.name}.mp4")
+    output_path = os.path.join(workdir, f"{case.name}_out.mp4")
+    canned_boxes = generate_synthetic_video(case, input_path)
+    danger_zone = case.danger_zone()
+
+    def detect():
+        if real_models:
+            car_model, wheel_model = get_models()
+        else:
+            car_model = StubCarModel(canned_boxes, case.drop_rate, case.seed)
+            wheel_model = StubWheelModel()
+        # Этапы меряются по отдельности, поэтому здесь кадры собираются в список, в отличие от run_pipeline
+        frames_data = []
+        process_video_traffic(input_path, output_path, car_model=car_model, wheel_model=wheel_model,
+                              sink=frames_data.append)
+        return frames_data
+
+    timings = {}
+    # Пайплайн много печатает в stdout, это не должно попадать в отчет
+    with contextlib.redirect_stdout(io.StringIO()):
+        frames_data, timings['process_video_traffic'] = _measure(detect, repeat)
+        aligned, timings['restore_missing_cars_with_interpolation'] = _measure(
+            lambda: restore_missing_cars_with_interpolation(frames_data), repeat)
+
+        cars = [car for frame in aligned for car in frame]
+        _, timings['get_danger_level'] = _measure(
+            lambda: [car.get_danger_level(danger_zone) for car in cars], repeat)
+        boxes = [car.bounding_box for car in cars]
+        _, timings['polygon_intersects'] = _measure(
+            lambda: [danger_zone.intersects(box) for box in boxes], repeat)
+
+        danger_frames, timings['draw_rectangles'] = _measure(
+            lambda: draw_rectangles(aligned, input_path, output_path, danger_zone), repeat)
+
+    return {
+        'case': case.name,
+        'params': case.to_dict(),
+        'models': 'real' if real_models else 'stub',
+        'counts': {
+            'frames': len(frames_data),
+            'detections': sum(len(frame) for frame in frames_data),
+            'aligned_cars': len(cars),
+            'danger_frames': len(danger_frames),
+        },
+        'timings': timings,
+    }
+
+
+def environment_info() -> dict:
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare_results(current: dict, baseline: dict, threshold: float = 0.1) -> list:
+    """
+    Сравнивает медианы с прошлым прогоном.
+
+    Returns:
+        Список (case, step, baseline_median, current_median, ratio, regressed)
+    """
+    baseline_cases = {result['case']: result for result in baseline.get('results', [])}
+    rows = []
+    for result in current.get('results', []):
+        old = baseline_cases.get(result['case'])
+        if old is None:
+            continue
+        for step, stats in result['timings'].items():
+            if step not in old['timings'] or not old['timings'][step]['median']:
+                continue
+            old_median = old['timings'][step]['median']
+            ratio = stats['median'] / old_median
+            rows.append((result['case'], step, old_median, stats['median'], round(ratio, 3), ratio > 1 + threshold))
+    return rows
+
+
+def save_results(path: str, results: dict):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+GOLDEN_TOLERANCES = {
+    # Относительная разница в общем числе детекций
+    'detections': 0.05,
+    # Доля кадров, где число машин отличается от эталона
+    'frame_mismatch': 0.1,
+    # Минимальный коэффициент Жаккара для множеств опасных кадров
+    'danger_jaccard': 0.9,
+    # Допустимый сдвиг границ интервалов, в кадрах
+    'interval_shift': 15,
+}
+
+
+def pipeline_snapshot(result, zone_points, fps: float) -> dict:
+    """Сводка результата run_pipeline в формате эталонного файла"""
+    return {
+        'zone': zone_points,
+        'fps': fps,
+        'frames': result.frames,
+        'detections_per_frame': result.detections_per_frame,
+        'danger_frames': sorted(set(result.danger_frames)),
+        'intervals': [list(interval) for interval in result.intervals],
+    }
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _interval_shift(expected: list, actual: list) -> int:
+    """Наибольший сдвиг границ среди пар интервалов; бесконечность, если их число не совпадает"""
+    if len(expected) != len(actual):
+        return float('inf')
+    shifts = [max(abs(e[0] - a[0]), abs(e[1] - a[1])) for e, a in zip(expected, actual)]
+    return max(shifts, default=0)
+
+
+def compare_with_golden(snapshot: dict, golden: dict, tolerances: dict = None) -> list:
+    """
+    Проверяет паритет результата с эталоном.
+
+    Returns:
+        Список словарей {check, value, limit, passed}
+    """
+    tolerances = {**GOLDEN_TOLERANCES, **(tolerances or {})}
+    checks = []
+
+    def add(check, value, limit, passed):
+        checks.append({'check': check, 'value': value, 'limit': limit, 'passed': bool(passed)})
+
+    add('frames', snapshot['frames'], golden['frames'], snapshot['frames'] == golden['frames'])
+
+    expected_total = sum(golden['detections_per_frame'])
+    actual_total = sum(snapshot['detections_per_frame'])
+    diff = abs(actual_total - expected_total) / expected_total if expected_total else float(actual_total > 0)
+    add('detections', round(diff, 4), tolerances['detections'], diff <= tolerances['detections'])
+
+    pairs = list(zip(golden['detections_per_frame'], snapshot['detections_per_frame']))
+    mismatch = sum(1 for expected, actual in pairs if expected != actual) / len(pairs) if pairs else 0.0
+    add('frame_mismatch', round(mismatch, 4), tolerances['frame_mismatch'], mismatch <= tolerances['frame_mismatch'])
+
+    jaccard = _jaccard(set(golden['danger_frames']), set(snapshot['danger_frames']))
+    add('danger_jaccard', round(jaccard, 4), tolerances['danger_jaccard'], jaccard >= tolerances['danger_jaccard'])
+
+    shift = _interval_shift(golden['intervals'], snapshot['intervals'])
+    add('interval_shift', shift, tolerances['interval_shift'], shift <= tolerances['interval_shift'])
+
+    return checks
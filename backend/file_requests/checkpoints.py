@@ -0,0 +1,101 @@
+import gzip
+import pickle
+import time
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from file_requests.storage_backends import CheckpointStorage
+
+CHECKPOINT_STORAGE = CheckpointStorage()
+
+
+class JobCheckpoint:
+    """
+    Состояние обработки одного видео в хранилище: номер кадра, детекции до него
+    и трекер. Повтор задачи после падения воркера продолжает с последнего
+    чекпоинта, а не с начала видео.
+
+    Детекции лежат сегментами в папке видео: каждое сохранение дописывает только
+    кадры, добавленные через record после предыдущего, поэтому к концу видео
+    сохранение не дорожает. Файл состояния пишется последним и знает число
+    сегментов, так что недописанный сегмент при повторе просто перезапишется.
+    """
+
+    def __init__(self, file_id, storage=None, interval: float = None):
+        self.file_id = str(file_id)
+        self.name = self.get_name(file_id)
+        self.storage = storage or CHECKPOINT_STORAGE
+        self.interval = settings.CHECKPOINT_INTERVAL if interval is None else interval
+        self._last_save = time.monotonic()
+        self._pending = []
+        self._segments = 0
+
+    @classmethod
+    def get_name(cls, file_id) -> str:
+        return f"{file_id}/state.pkl.gz"
+
+    def get_segment_name(self, index: int) -> str:
+        return f"{self.file_id}/{index:05d}.pkl.gz"
+
+    @classmethod
+    def get_stored_names(cls, file_ids, storage=None) -> list:
+        """Все объекты чекпоинтов этих видео; чекпоинты есть только у недообработанных"""
+        storage = storage or CHECKPOINT_STORAGE
+        stored = set(cls._listdir(storage, '')[0])
+        names = []
+        for file_id in map(str, file_ids):
+            if file_id in stored:
+                names.extend(f"{file_id}/{name}" for name in cls._listdir(storage, file_id)[1])
+        return names
+
+    @staticmethod
+    def _listdir(storage, path) -> tuple:
+        try:
+            return storage.listdir(path)
+        except FileNotFoundError:
+            # FileSystemStorage без папки; S3 в этом случае отдает пустые списки
+            return [], []
+
+    def _read(self, name):
+        with self.storage.open(name, 'rb') as f:
+            # Бакет закрыт для записи снаружи, поэтому pickle из него читать можно
+            return pickle.loads(gzip.decompress(f.read()))
+
+    def _write(self, name, value):
+        self.storage.save(name, ContentFile(gzip.compress(pickle.dumps(value), compresslevel=1)))
+
+    def load(self):
+        """Сохраненное состояние (без детекций, они в iter_frames) или None, если задача начинается с начала"""
+        if not self.storage.exists(self.name):
+            return None
+        state = self._read(self.name)
+        self._segments = state['segments']
+        self._pending = []
+        return state
+
+    def iter_frames(self, state):
+        """Детекции сохраненных кадров по порядку; в памяти один сегмент за раз"""
+        for index in range(state['segments']):
+            yield from self._read(self.get_segment_name(index))
+
+    def record(self, frame):
+        """Детекции очередного кадра; уйдут в хранилище со следующим save"""
+        self._pending.append(frame)
+
+    def due(self) -> bool:
+        return self.interval > 0 and time.monotonic() - self._last_save >= self.interval
+
+    def save(self, state: dict):
+        if self._pending:
+            self._write(self.get_segment_name(self._segments), self._pending)
+            self._segments += 1
+            self._pending = []
+        self._write(self.name, dict(state, segments=self._segments))
+        self._last_save = time.monotonic()
+
+    def delete(self):
+        for name in self._listdir(self.storage, self.file_id)[1]:
+            self.storage.delete(f"{self.file_id}/{name}")
+        self._pending = []
+        self._segments = 0
@@ -1,7 +1,55 @@
+import json
+
 ALLOWED_FILE_EXTENSIONS = [".mp4", ".mkv", ".mov", ".avi"]
+MAX_BATCH_FILES = 500
 
 def validate_file_extensions(extensions_list: list[str], filename: str) -> bool:
     for extension in extensions_list:
         if filename.endswith(extension):
             return True
     return False
+
+
+def parse_points(points) -> list:
+    """Точки опасной зоны из JSON-строки или списка; пустой список, если формат неверный"""
+    if isinstance(points, str):
+        try:
+            points = json.loads(points)
+        except ValueError:
+            return []
+    if not isinstance(points, list):
+        return []
+    for point in points:
+        if not isinstance(point, (list, tuple)) or len(point) != 2:
+            return []
+        if not all(isinstance(coord, (int, float)) for coord in point):
+            return []
+    return points
+
+
+def parse_zones(zones, count: int):
+    """
+    Зоны для каждого видео пачки: JSON-список длины count, где null — общая зона.
+
+    Returns:
+        Список зон (пустой список вместо null) или None, если формат неверный
+    """
+    if zones is None or zones == '':
+        return [[] for _ in range(count)]
+    if isinstance(zones, str):
+        try:
+            zones = json.loads(zones)
+        except ValueError:
+            return None
+    if not isinstance(zones, list) or len(zones) != count:
+        return None
+    result = []
+    for zone in zones:
+        if zone is None:
+            result.append([])
+            continue
+        points = parse_points(zone)
+        if not points:
+            return None
+        result.append(points)
+    return result
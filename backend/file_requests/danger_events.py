@@ -0,0 +1,65 @@
+class DangerEventCollector:
+    """
+    Собирает события опасности по трекам: отрезки кадров, на которых машина
+    была в зоне (уровень 1 или 2). Пропуск не больше max_gap кадров событие не рвет.
+    Кадры подаются по одному, в памяти только открытые события и готовый список.
+    """
+
+    def __init__(self, danger_zone, fps: float, max_gap: int = 1, zone: int = 0):
+        self.danger_zone = danger_zone
+        self.fps = fps
+        self.max_gap = max_gap
+        self.zone = zone
+        self._open_events = {}
+        self._events = []
+        self._frame_index = 0
+
+    def _close(self, event):
+        frames = event['end_frame'] - event['start_frame'] + 1
+        event.update({
+            'start_time': round(event['start_frame'] / self.fps, 3),
+            'end_time': round(event['end_frame'] / self.fps, 3),
+            'dwell_time': round(frames / self.fps, 3),
+            'danger_time': round(event.pop('danger_frames') / self.fps, 3),
+        })
+        self._events.append(event)
+
+    def push(self, cars):
+        """Детекции очередного кадра"""
+        frame_index = self._frame_index
+        self._frame_index += 1
+        for car in cars:
+            level = car.get_danger_level(self.danger_zone)
+            if not level:
+                continue
+            event = self._open_events.get(car.id)
+            if event is not None and frame_index - event['end_frame'] > self.max_gap + 1:
+                self._close(self._open_events.pop(car.id))
+                event = None
+            if event is None:
+                event = self._open_events[car.id] = {
+                    'track_id': car.id, 'zone': self.zone, 'level': level,
+                    'start_frame': frame_index, 'end_frame': frame_index, 'danger_frames': 0,
+                }
+            event['end_frame'] = frame_index
+            event['level'] = max(event['level'], level)
+            event['danger_frames'] += level == 2
+
+    def finish(self) -> list:
+        """
+        Returns:
+            Список словарей с полями DangerEvent (без запроса и камеры)
+        """
+        for event in self._open_events.values():
+            self._close(event)
+        self._open_events = {}
+        self._events.sort(key=lambda event: (event['start_frame'], event['track_id']))
+        return self._events
+
+
+def extract_danger_events(frames_data, danger_zone, fps: float, max_gap: int = 1, zone: int = 0) -> list:
+    """События опасности по уже собранным кадрам, см. DangerEventCollector"""
+    collector = DangerEventCollector(danger_zone, fps, max_gap, zone)
+    for cars in frames_data:
+        collector.push(cars)
+    return collector.finish()
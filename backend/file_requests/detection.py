@@ -0,0 +1,189 @@
+import copy
+from collections import defaultdict
+from statistics import median
+from time import perf_counter
+
+# Модуль загружается в процессах инференса (file_requests.frame_ring), поэтому без Django
+
+# Классы COCO, относящиеся к транспорту (2: car, 5: bus, 7: truck)
+VEHICLE_CLASSES = [2, 5, 7]
+# Порог уверенности, с которым model.track отдает детекции трекеру
+TRACK_CONF = 0.1
+
+# Как искать колеса: по кропу каждой машины, одним проходом по кадру
+# или одним проходом по области вокруг опасной зоны
+WHEEL_CROP = 'crop'
+WHEEL_FRAME = 'frame'
+WHEEL_ROI = 'roi'
+WHEEL_STRATEGIES = (WHEEL_CROP, WHEEL_FRAME, WHEEL_ROI)
+
+
+def detect_wheels(car_crop, frame, wheel_model, x1, x2, y1, y2):
+    wheel_results = wheel_model.predict(car_crop, verbose=False, conf=0.25)
+
+    wheels_list = []
+
+    for w_result in wheel_results:
+        w_boxes = w_result.boxes.xyxy.cpu().numpy()
+
+        for w_box in w_boxes:
+            wx1, wy1, wx2, wy2 = map(int, w_box)
+
+            global_wx1 = x1 + wx1
+            global_wy1 = y1 + wy1
+            global_wx2 = x1 + wx2
+            global_wy2 = y1 + wy2
+
+            wheels_list.append([global_wx1, global_wy1, global_wx2, global_wy2])
+
+            # Рисуем колеса (зеленым)
+            # cv2.rectangle(frame, (global_wx1, global_wy1), (global_wx2, global_wy2), (0, 255, 0), 2)
+
+    return wheels_list
+
+
+def detect_cars(frame, car_model):
+    """
+    Детекции машин на кадре без трекинга.
+
+    Returns:
+        ([(x1, y1, x2, y2, conf, cls), ...], секунды на детекцию)
+    """
+    start = perf_counter()
+    result = car_model.predict(frame, conf=TRACK_CONF, classes=VEHICLE_CLASSES, verbose=False)[0]
+    seconds = perf_counter() - start
+
+    boxes = result.boxes.xyxy.cpu().numpy()
+    confs = result.boxes.conf.cpu().numpy()
+    classes = result.boxes.cls.cpu().numpy()
+    detections = [
+        (float(box[0]), float(box[1]), float(box[2]), float(box[3]), float(conf), float(cls))
+        for box, conf, cls in zip(boxes, confs, classes)
+    ]
+    return detections, seconds
+
+
+def assign_wheels(car_boxes: list, wheel_boxes: list) -> list:
+    """
+    Раскладывает колеса по машинам: колесо достается машине, в рамку которой
+    попал его центр, а если таких несколько — той, чей низ ближе к низу колеса.
+    Рамки машин разложены по равномерной сетке, поэтому для колеса
+    проверяются только машины из его ячейки.
+
+    Returns:
+        Список колес [[x1, y1, x2, y2], ...] для каждой машины по порядку car_boxes
+    """
+    assigned = [[] for _ in car_boxes]
+    if not car_boxes or not wheel_boxes:
+        return assigned
+
+    cell = max(median(x2 - x1 for x1, _, x2, _ in car_boxes), 1)
+    grid = defaultdict(list)
+    for index, (x1, y1, x2, y2) in enumerate(car_boxes):
+        for gx in range(int(x1 // cell), int(x2 // cell) + 1):
+            for gy in range(int(y1 // cell), int(y2 // cell) + 1):
+                grid[gx, gy].append(index)
+
+    for wheel in wheel_boxes:
+        cx, cy = (wheel[0] + wheel[2]) / 2, (wheel[1] + wheel[3]) / 2
+        candidates = [
+            index for index in grid.get((int(cx // cell), int(cy // cell)), ())
+            if car_boxes[index][0] <= cx <= car_boxes[index][2] and car_boxes[index][1] <= cy <= car_boxes[index][3]
+        ]
+        if candidates:
+            best = min(candidates, key=lambda index: abs(car_boxes[index][3] - wheel[3]))
+            assigned[best].append(wheel)
+    return assigned
+
+
+def detect_car_wheels(frame, car_boxes, wheel_model, strategy: str = WHEEL_CROP, region=None):
+    """
+    Колеса для машин кадра.
+
+    Args:
+        car_boxes: [(x1, y1, x2, y2), ...] в пределах кадра
+        strategy: WHEEL_CROP — по вызову модели на машину; WHEEL_FRAME и WHEEL_ROI —
+            один вызов на кадр (или на region) и раскладка колес по машинам
+        region: (x1, y1, x2, y2) для WHEEL_ROI; без него — весь кадр
+
+    Returns:
+        Список колес для каждой машины по порядку car_boxes
+    """
+    if strategy not in WHEEL_STRATEGIES:
+        raise ValueError(f"Неизвестная стратегия поиска колес: {strategy}")
+    if strategy == WHEEL_CROP:
+        wheels = []
+        for x1, y1, x2, y2 in car_boxes:
+            car_crop = frame[y1:y2, x1:x2]
+            wheels.append(detect_wheels(car_crop, frame, wheel_model, x1, x2, y1, y2) if car_crop.size else [])
+        return wheels
+
+    if not car_boxes:
+        return []
+    height, width = frame.shape[:2]
+    x1, y1, x2, y2 = region if strategy == WHEEL_ROI and region else (0, 0, width, height)
+    crop = frame[y1:y2, x1:x2]
+    wheel_boxes = detect_wheels(crop, frame, wheel_model, x1, x2, y1, y2) if crop.size else []
+    return assign_wheels(car_boxes, wheel_boxes)
+
+
+def detect_cars_and_wheels(frame, car_model, wheel_model, wheel_strategy: str = WHEEL_CROP, wheel_region=None):
+    """
+    Детекции машин на кадре без трекинга и колеса внутри каждой машины.
+
+    Returns:
+        ([(x1, y1, x2, y2, conf, cls, wheels), ...], {'car_detection': сек, 'wheel_detection': сек})
+    """
+    height, width = frame.shape[:2]
+    timings = {}
+    cars, timings['car_detection'] = detect_cars(frame, car_model)
+
+    boxes = []
+    for car in cars:
+        x1, y1, x2, y2 = map(int, car[:4])
+        boxes.append((max(0, x1), max(0, y1), min(width, x2), min(height, y2)))
+
+    start = perf_counter()
+    wheels = detect_car_wheels(frame, boxes, wheel_model, wheel_strategy, wheel_region)
+    timings['wheel_detection'] = perf_counter() - start
+    detections = [(*car, car_wheels) for car, car_wheels in zip(cars, wheels)]
+    return detections, timings
+
+
+def share_model(model):
+    """
+    Копия YOLO для одной задачи с теми же весами. Предиктор (и его буферы)
+    у каждой копии свой, поэтому копии можно вызывать из разных потоков,
+    а память под веса не дублируется.
+    """
+    job_model = copy.copy(model)
+    job_model.predictor = None
+    return job_model
+
+
+class FrameDetector:
+    """
+    Фабрика детектора для процессов инференса: модели загружаются
+    один раз в каждом процессе, в сам объект попадают только пути.
+    """
+
+    def __init__(self, car_model_path: str, wheel_model_path: str, threads: int = 1,
+                 wheel_strategy: str = WHEEL_CROP, wheel_region=None):
+        self.car_model_path = car_model_path
+        self.wheel_model_path = wheel_model_path
+        self.threads = threads
+        self.wheel_strategy = wheel_strategy
+        self.wheel_region = wheel_region
+
+    def __call__(self):
+        import cv2
+        import torch
+        from ultralytics import YOLO
+
+        torch.set_num_threads(self.threads)
+        cv2.setNumThreads(self.threads)
+        car_model = YOLO(self.car_model_path)
+        wheel_model = YOLO(self.wheel_model_path)
+        return lambda frame: detect_cars_and_wheels(
+            frame, car_model, wheel_model, self.wheel_strategy, self.wheel_region,
+        )
@@ -0,0 +1,130 @@
+import gzip
+import json
+
+# Выгрузка детекций для аналитики: NDJSON, строка на кадр. Файл сжат блоками
+# по chunk_frames кадров, каждый блок — отдельный gzip-член. Склейка членов —
+# обычный gzip, поэтому файл целиком читается любым gunzip, а по индексу
+# [первый кадр, последний кадр, смещение, длина] можно запросить Range только
+# нужных блоков и распаковать их так же.
+
+FORMAT = 'ndjson+gzip'
+
+
+def _box(polygon) -> list:
+    return [polygon.points[0].x, polygon.points[0].y, polygon.points[2].x, polygon.points[2].y]
+
+
+def frame_record(frame_index: int, fps: float, cars: list, danger_zone, detected_ids: set) -> dict:
+    return {
+        'frame': frame_index,
+        't': round(frame_index / fps, 3) if fps else None,
+        'cars': [
+            {
+                'id': car.id,
+                'box': _box(car.bounding_box),
+                'wheels': [_box(wheel) for wheel in car.wheels or []],
+                'level': car.get_danger_level(danger_zone),
+                # Машины, дорисованные align между детекциями
+                'restored': car.id not in detected_ids,
+            }
+            for car in cars
+        ],
+    }
+
+
+class DetectionsEncoder:
+    """
+    Потоковая выгрузка: кадры подаются по одному, готовый gzip-блок отдается,
+    как только в нем набралось chunk_frames кадров. В памяти только текущий блок.
+
+    Attributes:
+        index: [первый кадр, последний кадр, смещение, длина] уже отданных блоков
+    """
+
+    def __init__(self, danger_zone, fps: float, chunk_frames: int = 100):
+        self.danger_zone = danger_zone
+        self.fps = fps
+        self.chunk_frames = chunk_frames
+        self.index = []
+        self._lines = []
+        self._first = 0
+        self._offset = 0
+
+    def push(self, cars: list, detected: list):
+        """
+        Args:
+            cars: Выровненные машины кадра
+            detected: Машины, найденные на кадре детекцией (остальные дорисованы align)
+
+        Returns:
+            Готовый блок или None
+        """
+        frame_index = self._first + len(self._lines)
+        record = frame_record(frame_index, self.fps, cars, self.danger_zone, {car.id for car in detected})
+        self._lines.append(json.dumps(record, separators=(',', ':')))
+        if len(self._lines) >= self.chunk_frames:
+            return self._block()
+        return None
+
+    def flush(self):
+        """Конец видео: последний неполный блок или None"""
+        return self._block() if self._lines else None
+
+    def _block(self) -> bytes:
+        block = gzip.compress(('\n'.join(self._lines) + '\n').encode(), mtime=0)
+        last = self._first + len(self._lines) - 1
+        self.index.append([self._first, last, self._offset, len(block)])
+        self._first = last + 1
+        self._offset += len(block)
+        self._lines = []
+        return block
+
+
+def iter_detections(frames_data, aligned_frames_data, danger_zone, fps: float, chunk_frames: int = 100,
+                    index: list = None):
+    """
+    Генератор gzip-блоков выгрузки по уже собранным кадрам, см. DetectionsEncoder.
+
+    Args:
+        index: Список, куда дописываются [первый кадр, последний кадр, смещение, длина]
+    """
+    encoder = DetectionsEncoder(danger_zone, fps, chunk_frames)
+    if index is not None:
+        encoder.index = index
+    for cars, detected in zip(aligned_frames_data, frames_data):
+        block = encoder.push(cars, detected)
+        if block is not None:
+            yield block
+    block = encoder.flush()
+    if block is not None:
+        yield block
+
+
+def write_detections(stream, frames_data, aligned_frames_data, danger_zone, fps: float, chunk_frames: int = 100) -> list:
+    """
+    Пишет выгрузку в бинарный поток (например, S3MultipartWriter).
+
+    Returns:
+        Индекс блоков [[первый кадр, последний кадр, смещение, длина], ...]
+    """
+    index = []
+    for block in iter_detections(frames_data, aligned_frames_data, danger_zone, fps, chunk_frames, index):
+        stream.write(block)
+    return index
+
+
+def iter_stream(stream, chunk_size: int):
+    """Отдает поток кусками для StreamingHttpResponse и закрывает его, даже если клиент отключился"""
+    try:
+        while chunk := stream.read(chunk_size):
+            yield chunk
+    finally:
+        stream.close()
+
+
+def get_byte_range(index: list, start_frame: int, end_frame: int):
+    """Заголовок Range для блоков с кадрами start_frame..end_frame или None, если их нет"""
+    chunks = [chunk for chunk in index if chunk[1] >= start_frame and chunk[0] <= end_frame]
+    if not chunks:
+        return None
+    return f"bytes={chunks[0][2]}-{chunks[-1][2] + chunks[-1][3] - 1}"
@@ -0,0 +1,175 @@
+import queue
+import traceback
+from multiprocessing import resource_tracker, shared_memory
+from time import perf_counter
+
+import billiard
+import cv2
+import numpy as np
+
+# Передача кадров между процессами без копирования. Декодер пишет кадр прямо
+# в слот кольцевого буфера в разделяемой памяти, процессы инференса читают его
+# по номеру слота, а по очередям ходят только номера кадров/слотов и детекции.
+# Слот освобождает главный процесс после того, как обработал кадр по порядку,
+# поэтому декодер не может уйти вперед больше чем на число слотов.
+
+# Модули, которые загружаются в дочерних процессах, не должны импортировать Django
+START_METHOD = 'spawn'
+
+DECODER_DONE = 'done'
+WORKER_ERROR = 'error'
+
+
+class FrameRing:
+    """Кольцевой буфер из slots кадров формы shape (uint8) в разделяемой памяти"""
+
+    def __init__(self, shm: shared_memory.SharedMemory, shape: tuple, slots: int, owner: bool):
+        self.shm = shm
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.owner = owner
+        self._frames = np.ndarray((slots, *self.shape), dtype=np.uint8, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, shape: tuple, slots: int):
+        size = int(np.prod(shape)) * slots
+        return cls(shared_memory.SharedMemory(create=True, size=size), shape, slots, owner=True)
+
+    @classmethod
+    def attach(cls, name: str, shape: tuple, slots: int):
+        shm = shared_memory.SharedMemory(name=name)
+        # Удаляет сегмент только создатель: иначе resource_tracker дочернего
+        # процесса уничтожит его при выходе, пока остальные еще читают
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm, shape, slots, owner=False)
+
+    @property
+    def spec(self):
+        """Все, что нужно другому процессу для attach"""
+        return self.shm.name, self.shape, self.slots
+
+    def frame(self, slot: int) -> np.ndarray:
+        """Представление слота без копирования"""
+        return self._frames[slot]
+
+    def close(self):
+        self._frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _decode(ring_spec, source, free_slots, tasks, results, workers, start_frame=0):
+    ring = FrameRing.attach(*ring_spec)
+    cap = cv2.VideoCapture(source)
+    count = start_frame
+    try:
+        # grab() пропускает кадры без перевода в BGR и точен для любого кодека
+        for _ in range(start_frame):
+            cap.grab()
+        while True:
+            # Нет свободного слота — ждем: так работает обратное давление
+            slot = free_slots.get()
+            view = ring.frame(slot)
+            start = perf_counter()
+            ret, frame = cap.read(view)
+            if not ret:
+                break
+            if frame is not view:
+                view[:] = frame
+            tasks.put((count, slot, perf_counter() - start))
+            count += 1
+        results.put((DECODER_DONE, count))
+    except Exception:
+        results.put((WORKER_ERROR, traceback.format_exc()))
+    finally:
+        for _ in range(workers):
+            tasks.put(None)
+        cap.release()
+        ring.close()
+
+
+def _infer(ring_spec, detector_factory, tasks, results):
+    ring = FrameRing.attach(*ring_spec)
+    try:
+        detector = detector_factory()
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            frame_index, slot, decode_time = task
+            detections, timings = detector(ring.frame(slot))
+            timings['decode'] = decode_time
+            results.put((frame_index, slot, detections, timings))
+    except Exception:
+        results.put((WORKER_ERROR, traceback.format_exc()))
+    finally:
+        ring.close()
+
+
+def run_ring_pipeline(source: str, shape: tuple, detector_factory, on_frame, workers: int = 2,
+                      slots: int = None, poll_interval: float = 1.0, start_frame: int = 0):
+    """
+    Декодирует видео в отдельном процессе и раздает кадры workers процессам инференса.
+
+    Args:
+        shape: (height, width, 3) кадров видео
+        detector_factory: Сериализуемый вызываемый объект; в каждом процессе
+            инференса создает detector(frame) -> (detections, timings)
+        on_frame: Вызывается в этом процессе строго по порядку кадров:
+            on_frame(frame_index, frame, detections, timings). Кадр доступен
+            только внутри вызова, после него слот переиспользуется
+        slots: Размер кольца; по умолчанию по два слота на процесс инференса
+        start_frame: С какого кадра начать (продолжение по чекпоинту)
+
+    Returns:
+        Число кадров видео, включая пропущенные до start_frame
+    """
+    ctx = billiard.get_context(START_METHOD)
+    slots = slots or 2 * workers + 2
+    ring = FrameRing.create(shape, slots)
+    free_slots, tasks, results = ctx.Queue(), ctx.Queue(), ctx.Queue()
+    for slot in range(slots):
+        free_slots.put(slot)
+
+    processes = [ctx.Process(target=_decode, args=(ring.spec, source, free_slots, tasks, results, workers,
+                                                        start_frame))]
+    processes += [ctx.Process(target=_infer, args=(ring.spec, detector_factory, tasks, results))
+                  for _ in range(workers)]
+    for process in processes:
+        process.daemon = True
+        process.start()
+
+    pending = {}
+    next_frame = start_frame
+    total = None
+    try:
+        while total is None or next_frame < total:
+            try:
+                message = results.get(timeout=poll_interval)
+            except queue.Empty:
+                if any(process.exitcode not in (None, 0) for process in processes):
+                    raise RuntimeError("Процесс конвейера кадров завершился с ошибкой")
+                continue
+
+            if message[0] == WORKER_ERROR:
+                raise RuntimeError(f"Ошибка в процессе конвейера кадров:\n{message[1]}")
+            if message[0] == DECODER_DONE:
+                total = message[1]
+                continue
+
+            frame_index, slot, detections, timings = message
+            pending[frame_index] = (slot, detections, timings)
+            # Результаты приходят вразнобой, on_frame получает их по порядку
+            while next_frame in pending:
+                slot, detections, timings = pending.pop(next_frame)
+                on_frame(next_frame, ring.frame(slot), detections, timings)
+                free_slots.put(slot)
+                next_frame += 1
+    finally:
+        for process in processes:
+            process.join(timeout=poll_interval)
+            if process.is_alive():
+                process.terminate()
+        ring.close()
+    return next_frame
@@ -1,29 +1,30 @@
-import cv2
-
-
-def get_frames_timing_bulk(video, frame_numbers):
-    video_path = f"/tmp/{video.request.id}.mp4"
-
-    with open(video_path, "wb") as tmp_file:
-        tmp_file.write(video.get_file_data())
-
-    cap = cv2.VideoCapture(video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    
+def danger_frames_to_intervals(frame_numbers, max_gap: int = 1) -> list[tuple[int, int]]:
+    """
+    Склеивает номера опасных кадров в интервалы (начало, конец).
+    Кадры, между которыми не больше max_gap, попадают в один интервал.
+    """
+    intervals = []
+    for frame in sorted(set(frame_numbers)):
+        if intervals and frame - intervals[-1][1] <= max_gap:
+            intervals[-1] = (intervals[-1][0], frame)
+        else:
+            intervals.append((frame, frame))
+    return intervals
+
+
+def get_frames_timing_bulk(fps: float, frame_numbers):
     frame_times = {}
     
     for target_frame in frame_numbers:
         time_seconds = target_frame / fps
         frame_times[target_frame] = round(time_seconds, 3)
 
-    
-    cap.release()
     return frame_times
 
 
-def frame_intervals_to_string(intervals: list[tuple[int]], file) -> str:
+def frame_intervals_to_string(intervals: list[tuple[int]], fps: float) -> str:
     flattened = [item for tup in intervals for item in tup]
-    timings_to_seconds = get_frames_timing_bulk(file, flattened)
+    timings_to_seconds = get_frames_timing_bulk(fps, flattened)
     
     result = ""
     for interval in intervals:
@@ -0,0 +1,270 @@
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+from concurrent.futures import Future
+from time import monotonic
+
+import numpy as np
+
+# Общий сервер инференса на машине воркеров. Задачи присылают кадры (или
+# кропы машин) по Unix-сокету, сервер собирает запросы разных видео в пачки
+# и прогоняет одной моделью за раз: пачка из N кадров на CPU заметно дешевле
+# N отдельных вызовов с batch=1. Пачка уходит в модель, когда набралось
+# max_batch кадров или первый кадр ждет дольше max_delay секунд.
+#
+# Протокол: заголовок '!II' (длина JSON, длина данных), затем JSON и данные.
+# Запрос: {'model': имя, 'shapes': [[h, w, c], ...]} и кадры uint8 подряд.
+# Ответ: {'results': [[(x1, y1, x2, y2, conf, cls), ...], ...]} или {'error': текст}.
+
+# Модуль загружается и вне Django (в процессе сервера), поэтому без него
+HEADER = struct.Struct('!II')
+
+
+def _recv_exactly(sock, size: int) -> bytes:
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if not count:
+            raise ConnectionError("Соединение с сервером инференса закрыто")
+        received += count
+    return bytes(data)
+
+
+def send_message(sock, header: dict, payload: bytes = b''):
+    data = json.dumps(header).encode()
+    sock.sendall(HEADER.pack(len(data), len(payload)) + data + payload)
+
+
+def recv_message(sock):
+    header_size, payload_size = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+    header = json.loads(_recv_exactly(sock, header_size))
+    payload = _recv_exactly(sock, payload_size) if payload_size else b''
+    return header, payload
+
+
+def yolo_batch_predictor(model, **predict_kwargs):
+    """Функция пачки для YOLO: список кадров -> список детекций (x1, y1, x2, y2, conf, cls) по кадрам"""
+
+    def predict(frames):
+        results = model.predict(frames, verbose=False, **predict_kwargs)
+        batch = []
+        for result in results:
+            boxes = result.boxes
+            batch.append([
+                (float(box[0]), float(box[1]), float(box[2]), float(box[3]), float(conf), float(cls))
+                for box, conf, cls in zip(boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(), boxes.cls.cpu().numpy())
+            ])
+        return batch
+
+    return predict
+
+
+class MicroBatcher:
+    """Копит кадры одной модели из разных соединений и считает их пачками в одном потоке"""
+
+    def __init__(self, predict_batch, max_batch: int = 8, max_delay: float = 0.01):
+        self.predict_batch = predict_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batch_sizes = []
+        self._pending = []
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, frames: list) -> list:
+        """Ставит кадры в очередь и возвращает Future на каждый"""
+        futures = [Future() for _ in frames]
+        with self._condition:
+            self._pending.extend((monotonic(), frame, future) for frame, future in zip(frames, futures))
+            self._condition.notify()
+        return futures
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _take_batch(self):
+        with self._condition:
+            while True:
+                if self._stopped:
+                    return None
+                if self._pending:
+                    # Дедлайн считается от самого старого кадра: ожидание ограничено для каждого
+                    wait = self._pending[0][0] + self.max_delay - monotonic()
+                    if len(self._pending) >= self.max_batch or wait <= 0:
+                        batch = self._pending[:self.max_batch]
+                        del self._pending[:self.max_batch]
+                        return batch
+                    self._condition.wait(wait)
+                else:
+                    self._condition.wait()
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            self.batch_sizes.append(len(batch))
+            try:
+                results = self.predict_batch([frame for _, frame, _ in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                header, payload = recv_message(self.request)
+            except ConnectionError:
+                return
+
+            batcher = self.server.batchers.get(header.get('model'))
+            if batcher is None:
+                send_message(self.request, {'error': f"Неизвестная модель {header.get('model')}"})
+                continue
+
+            frames, offset = [], 0
+            for shape in header['shapes']:
+                size = int(np.prod(shape))
+                frames.append(np.frombuffer(payload, dtype=np.uint8, count=size, offset=offset).reshape(shape))
+                offset += size
+            try:
+                results = [future.result() for future in batcher.submit(frames)]
+            except Exception as e:
+                send_message(self.request, {'error': str(e)})
+                continue
+            send_message(self.request, {'results': results})
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Сервер на Unix-сокете: поток на соединение (одна задача — одно соединение),
+    по MicroBatcher на модель.
+
+    Args:
+        predictors: {имя модели: функция пачки}, см. yolo_batch_predictor
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, predictors: dict, max_batch: int = 8, max_delay: float = 0.01):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.batchers = {
+            name: MicroBatcher(predict_batch, max_batch, max_delay) for name, predict_batch in predictors.items()
+        }
+        super().__init__(socket_path, _Handler)
+
+    def server_close(self):
+        super().server_close()
+        for batcher in self.batchers.values():
+            batcher.stop()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class InferenceClient:
+    """
+    Соединение с сервером инференса. Не потокобезопасно: одно на поток воркера
+    (см. get_inference_client), задачи этого потока используют его по очереди.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 60):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(socket_path)
+
+    @property
+    def closed(self) -> bool:
+        return self.sock.fileno() == -1
+
+    def predict(self, model: str, frames: list) -> list:
+        frames = [np.ascontiguousarray(frame, dtype=np.uint8) for frame in frames]
+        try:
+            send_message(
+                self.sock,
+                {'model': model, 'shapes': [list(frame.shape) for frame in frames]},
+                b''.join(frame.tobytes() for frame in frames),
+            )
+            header, _ = recv_message(self.sock)
+        except Exception:
+            # После обрыва посреди сообщения поток рассинхронизирован: соединение не переиспользуем
+            self.close()
+            raise
+        if 'error' in header:
+            raise RuntimeError(f"Ошибка сервера инференса: {header['error']}")
+        return header['results']
+
+    def close(self):
+        self.sock.close()
+
+
+_clients = threading.local()
+
+
+def get_inference_client(socket_path: str) -> InferenceClient:
+    """
+    Соединение текущего потока воркера: создается один раз и переживает задачи,
+    как модели в tasks.get_models, поэтому дескрипторы и потоки сервера не копятся.
+    Закрытое после ошибки соединение открывается заново.
+    """
+    client = getattr(_clients, 'client', None)
+    if client is None or client.closed:
+        client = _clients.client = InferenceClient(socket_path)
+    return client
+
+
+class _Array:
+    """Повторяет цепочку .cpu().numpy() тензоров ultralytics"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.data
+
+
+class _RemoteBoxes:
+    def __init__(self, detections):
+        data = np.asarray(detections, dtype=np.float32).reshape(-1, 6)
+        self.xyxy = _Array(data[:, :4])
+        self.conf = _Array(data[:, 4])
+        self.cls = _Array(data[:, 5])
+
+
+class _RemoteResult:
+    def __init__(self, detections):
+        self.boxes = _RemoteBoxes(detections)
+
+
+class RemoteModel:
+    """
+    Модель на сервере инференса с интерфейсом model.predict, как у YOLO,
+    чтобы detect_cars/detect_wheels работали без изменений. Порог и классы
+    задает сервер, аргументы predict здесь игнорируются.
+    """
+
+    def __init__(self, client: InferenceClient, name: str):
+        self.client = client
+        self.name = name
+
+    def predict(self, source, **kwargs):
+        frames = source if isinstance(source, list) else [source]
+        return [_RemoteResult(detections) for detections in self.client.predict(self.name, frames)]
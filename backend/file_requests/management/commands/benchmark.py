@@ -0,0 +1,67 @@
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from file_requests.benchmarking import (
+    SyntheticCase, run_case, environment_info, compare_results, save_results, load_results,
+)
+
+
+def _parse_list(value: str, cast=int):
+    return [cast(item) for item in value.split(',') if item]
+
+
+def _parse_resolution(value: str):
+    try:
+        width, height = value.lower().split('x')
+        return int(width), int(height)
+    except ValueError:
+        raise CommandError(f"Неверное разрешение: {value}, ожидается WIDTHxHEIGHT")
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк этапов пайплайна на синтетических видео (со стабами или настоящими моделями)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--resolutions', default='640x360,1280x720')
+        parser.add_argument('--lengths', default='150', help="Количество кадров через запятую")
+        parser.add_argument('--vehicles', default='2,8', help="Количество машин через запятую")
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--drop-rate', type=float, default=0.1, help="Доля пропущенных детекций у стаба")
+        parser.add_argument('--real-models', action='store_true', help="Использовать YOLO вместо стабов")
+        parser.add_argument('--output', default='benchmark_results.json')
+        parser.add_argument('--compare', help="JSON прошлого прогона для сравнения")
+        parser.add_argument('--threshold', type=float, default=0.1, help="Допустимое замедление (0.1 = 10%%)")
+
+    def handle(self, *args, **options):
+        cases = [
+            SyntheticCase(width, height, frames, vehicles, drop_rate=options['drop_rate'])
+            for width, height in map(_parse_resolution, options['resolutions'].split(','))
+            for frames in _parse_list(options['lengths'])
+            for vehicles in _parse_list(options['vehicles'])
+        ]
+
+        results = {'environment': environment_info(), 'results': []}
+        with tempfile.TemporaryDirectory() as workdir:
+            for case in cases:
+                self.stdout.write(f"{case.name}...")
+                result = run_case(case, workdir, repeat=options['repeat'], real_models=options['real_models'])
+                results['results'].append(result)
+                for step, stats in result['timings'].items():
+                    self.stdout.write(f"  {step:<42} median {stats['median'] * 1000:10.2f} ms")
+
+        save_results(options['output'], results)
+        self.stdout.write(self.style.SUCCESS(f"Результаты сохранены в {options['output']}"))
+
+        if options['compare']:
+            regressed = False
+            for case, step, old, new, ratio, is_regression in compare_results(
+                    results, load_results(options['compare']), options['threshold']):
+                line = f"{case:<28} {step:<42} {old * 1000:10.2f} -> {new * 1000:10.2f} ms (x{ratio})"
+                if is_regression:
+                    regressed = True
+                    self.stdout.write(self.style.ERROR(line))
+                else:
+                    self.stdout.write(line)
+            if regressed:
+                raise CommandError("Есть регрессии производительности")
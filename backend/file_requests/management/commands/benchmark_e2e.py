@@ -0,0 +1,118 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+
+import cv2
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from file_requests.benchmarking import (
+    pipeline_snapshot, compare_with_golden, environment_info, save_results, load_results, GOLDEN_TOLERANCES,
+)
+from file_requests.common import ALLOWED_FILE_EXTENSIONS, validate_file_extensions
+from file_requests.geometry import Point, Polygon
+from file_requests.metrics import JobMetrics
+
+DEFAULT_VIDEO = os.path.join(settings.BASE_DIR.parent, 'ml', 'videos', 'railway_crash.mp4')
+DEFAULT_GOLDEN_DIR = os.path.join(settings.BASE_DIR.parent, 'ml', 'golden')
+
+
+def _collect_videos(paths):
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            videos.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if validate_file_extensions(ALLOWED_FILE_EXTENSIONS, name)
+            )
+        elif os.path.isfile(path):
+            videos.append(path)
+        else:
+            raise CommandError(f"Нет такого файла или папки: {path}")
+    return videos
+
+
+class Command(BaseCommand):
+    help = ("Полный прогон пайплайна task_process_video на локальных видео без Celery и MinIO "
+            "с замером скорости и памяти по этапам и сверкой с эталоном")
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=[DEFAULT_VIDEO], help="Видео или папки с видео")
+        parser.add_argument('--golden-dir', default=DEFAULT_GOLDEN_DIR)
+        parser.add_argument('--zone', help="Опасная зона JSON-списком точек, если ее нет в эталоне")
+        parser.add_argument('--update-golden', action='store_true', help="Записать результат как новый эталон")
+        parser.add_argument('--output', default='benchmark_e2e_results.json')
+        for name, value in GOLDEN_TOLERANCES.items():
+            parser.add_argument(f'--tolerance-{name.replace("_", "-")}', type=float, default=value,
+                                dest=f'tolerance_{name}')
+
+    def handle(self, *args, **options):
+        # Импорт здесь: tasks подтягивает celery-приложение
+        from tasks import run_pipeline
+
+        tolerances = {name: options[f'tolerance_{name}'] for name in GOLDEN_TOLERANCES}
+        report = {'environment': environment_info(), 'tolerances': tolerances, 'results': []}
+        failed = []
+
+        for video_path in _collect_videos(options['paths']):
+            name = os.path.splitext(os.path.basename(video_path))[0]
+            golden_path = os.path.join(options['golden_dir'], f'{name}.json')
+            golden = load_results(golden_path) if os.path.exists(golden_path) else None
+
+            if options['zone']:
+                zone_points = json.loads(options['zone'])
+            elif golden is not None:
+                zone_points = golden['zone']
+            else:
+                raise CommandError(f"Для {name} нет эталона {golden_path}, укажите --zone")
+            danger_zone = Polygon([Point(x, y) for x, y in zone_points])
+
+            cap = cv2.VideoCapture(video_path)
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            cap.release()
+
+            self.stdout.write(f"{name}...")
+            metrics = JobMetrics(track_memory=True)
+            with tempfile.TemporaryDirectory() as workdir, contextlib.redirect_stdout(io.StringIO()):
+                result = run_pipeline(video_path, os.path.join(workdir, f'{name}_out.mp4'), danger_zone,
+                                      metrics=metrics)
+
+            summary = metrics.summary()
+            frames = result.frames
+            stages = {
+                stage: {
+                    'seconds': round(summary['stages'][stage], 3),
+                    'fps': round(frames / summary['stages'][stage], 2) if summary['stages'][stage] else None,
+                    'peak_rss_mb': summary['peak_rss_mb'].get(stage),
+                }
+                for stage in ('detection', 'alignment', 'rendering')
+            }
+            for stage, stats in stages.items():
+                self.stdout.write(f"  {stage:<10} {stats['seconds']:9.3f} s  {stats['fps']} fps  "
+                                  f"peak {stats['peak_rss_mb']} MB")
+
+            snapshot = pipeline_snapshot(result, zone_points, fps)
+            entry = {'video': video_path, 'frames': frames, 'stages': stages, 'metrics': summary}
+
+            if options['update_golden']:
+                os.makedirs(options['golden_dir'], exist_ok=True)
+                save_results(golden_path, snapshot)
+                self.stdout.write(self.style.SUCCESS(f"  эталон записан в {golden_path}"))
+            elif golden is None:
+                self.stdout.write(self.style.WARNING("  эталона нет, сверка пропущена"))
+            else:
+                entry['parity'] = compare_with_golden(snapshot, golden, tolerances)
+                for check in entry['parity']:
+                    line = f"  {check['check']:<15} {check['value']} (limit {check['limit']})"
+                    self.stdout.write(self.style.SUCCESS(line) if check['passed'] else self.style.ERROR(line))
+                if not all(check['passed'] for check in entry['parity']):
+                    failed.append(name)
+
+            report['results'].append(entry)
+
+        save_results(options['output'], report)
+        self.stdout.write(f"Отчет сохранен в {options['output']}")
+        if failed:
+            raise CommandError(f"Нет паритета с эталоном: {', '.join(failed)}")
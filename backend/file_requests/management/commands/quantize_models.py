@@ -0,0 +1,108 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import cv2
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from ultralytics import YOLO
+
+from file_requests.benchmarking import (
+    pipeline_snapshot, compare_with_golden, environment_info, save_results, load_results, GOLDEN_TOLERANCES,
+)
+from file_requests.geometry import Point, Polygon
+from file_requests.quantization import sample_calibration_frames, export_int8
+
+DEFAULT_VIDEO = os.path.join(settings.BASE_DIR.parent, 'ml', 'videos', 'railway_crash.mp4')
+DEFAULT_GOLDEN_DIR = os.path.join(settings.BASE_DIR.parent, 'ml', 'golden')
+DEFAULT_OUTPUT_DIR = os.path.join(settings.BASE_DIR.parent, 'ml', 'models', 'int8')
+
+
+class Command(BaseCommand):
+    help = ("INT8-варианты моделей машин и колес с калибровкой по кадрам нашего видео. "
+            "Модели принимаются, только если опасные кадры на видео совпадают с FP32 в пределах допусков")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--video', default=DEFAULT_VIDEO, help="Видео для калибровки и проверки")
+        parser.add_argument('--frames', type=int, default=300, help="Сколько кадров взять для калибровки")
+        parser.add_argument('--imgsz', type=int, default=640)
+        parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR)
+        parser.add_argument('--golden-dir', default=DEFAULT_GOLDEN_DIR)
+        parser.add_argument('--zone', help="Опасная зона JSON-списком точек, если ее нет в эталоне")
+        for name, value in GOLDEN_TOLERANCES.items():
+            parser.add_argument(f'--tolerance-{name.replace("_", "-")}', type=float, default=value,
+                                dest=f'tolerance_{name}')
+
+    def get_zone_points(self, options):
+        if options['zone']:
+            return json.loads(options['zone'])
+        name = os.path.splitext(os.path.basename(options['video']))[0]
+        golden_path = os.path.join(options['golden_dir'], f'{name}.json')
+        if not os.path.exists(golden_path):
+            raise CommandError(f"Для {name} нет эталона {golden_path}, укажите --zone")
+        return load_results(golden_path)['zone']
+
+    def handle(self, *args, **options):
+        # Импорт здесь: tasks подтягивает celery-приложение
+        from tasks import run_pipeline, CAR_MODEL_PATH, WHEEL_MODEL_PATH
+
+        video_path = options['video']
+        zone_points = self.get_zone_points(options)
+        danger_zone = Polygon([Point(x, y) for x, y in zone_points])
+        tolerances = {name: options[f'tolerance_{name}'] for name in GOLDEN_TOLERANCES}
+        cap = cv2.VideoCapture(video_path)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        cap.release()
+
+        def snapshot(car_model_path, wheel_model_path, workdir):
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = run_pipeline(video_path, os.path.join(workdir, 'out.mp4'), danger_zone,
+                                      car_model=YOLO(car_model_path), wheel_model=YOLO(wheel_model_path))
+            return pipeline_snapshot(result, zone_points, fps)
+
+        with tempfile.TemporaryDirectory() as workdir:
+            images_dir = os.path.join(workdir, 'images')
+            frames = sample_calibration_frames(video_path, options['frames'], images_dir)
+            self.stdout.write(f"Кадров для калибровки: {len(frames)}")
+
+            staging_dir = os.path.join(workdir, 'models')
+            quantized = {}
+            for name, model_path in (('car', CAR_MODEL_PATH), ('wheel', WHEEL_MODEL_PATH)):
+                self.stdout.write(f"Квантуем {model_path}...")
+                quantized[name] = export_int8(model_path, images_dir, staging_dir, options['imgsz'])
+
+            # Эталон — те же модели в FP32 на том же видео, а не сохраненный golden:
+            # проверяется только потеря точности от квантизации
+            self.stdout.write("Сверка с FP32...")
+            reference = snapshot(CAR_MODEL_PATH, WHEEL_MODEL_PATH, workdir)
+            checks = compare_with_golden(snapshot(quantized['car'], quantized['wheel'], workdir), reference,
+                                         tolerances)
+            for check in checks:
+                line = f"  {check['check']:<15} {check['value']} (limit {check['limit']})"
+                self.stdout.write(self.style.SUCCESS(line) if check['passed'] else self.style.ERROR(line))
+            if not all(check['passed'] for check in checks):
+                raise CommandError("INT8-модели расходятся с FP32, модели не приняты")
+
+            os.makedirs(options['output_dir'], exist_ok=True)
+            accepted = {}
+            for name, path in quantized.items():
+                target = os.path.join(options['output_dir'], os.path.basename(path))
+                if os.path.exists(target):
+                    shutil.rmtree(target)
+                shutil.move(path, target)
+                accepted[name] = target
+
+        save_results(os.path.join(options['output_dir'], 'report.json'), {
+            'environment': environment_info(),
+            'video': video_path,
+            'calibration_frames': len(frames),
+            'models': accepted,
+            'tolerances': tolerances,
+            'parity': checks,
+        })
+        self.stdout.write(self.style.SUCCESS("Модели приняты. Чтобы включить их, задайте в окружении:"))
+        self.stdout.write(f"CAR_MODEL_PATH={accepted['car']}")
+        self.stdout.write(f"WHEEL_MODEL_PATH={accepted['wheel']}")
@@ -0,0 +1,35 @@
+import torch
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from ultralytics import YOLO
+
+from file_requests.detection import TRACK_CONF, VEHICLE_CLASSES
+from file_requests.inference_server import InferenceServer, yolo_batch_predictor
+
+
+class Command(BaseCommand):
+    help = "Общий сервер инференса: собирает кадры задач воркера в пачки (см. INFERENCE_SERVER_SOCKET)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=settings.INFERENCE_SERVER_SOCKET)
+        parser.add_argument('--max-batch', type=int, default=settings.INFERENCE_BATCH_SIZE)
+        parser.add_argument('--max-delay-ms', type=float, default=settings.INFERENCE_BATCH_DELAY_MS)
+
+    def handle(self, *args, **options):
+        # Импорт здесь: tasks подтягивает celery-приложение
+        from tasks import CAR_MODEL_PATH, WHEEL_MODEL_PATH
+
+        if settings.INFERENCE_THREADS:
+            torch.set_num_threads(settings.INFERENCE_THREADS)
+        predictors = {
+            'car': yolo_batch_predictor(YOLO(CAR_MODEL_PATH), conf=TRACK_CONF, classes=VEHICLE_CLASSES),
+            'wheel': yolo_batch_predictor(YOLO(WHEEL_MODEL_PATH), conf=0.25),
+        }
+        server = InferenceServer(options['socket'], predictors, options['max_batch'], options['max_delay_ms'] / 1000)
+        self.stdout.write(f"Сервер инференса слушает {options['socket']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
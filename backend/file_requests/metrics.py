@@ -0,0 +1,227 @@
+import contextlib
+import os
+import resource
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Границы корзин гистограмм задержек (секунды), как у prometheus_client по умолчанию
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUEUE_WAIT_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+METRIC_PREFIX = 'svp'
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами, сериализуемая в JSON"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, counts=None, total=0.0, count=0):
+        self.buckets = tuple(buckets)
+        self.counts = list(counts) if counts is not None else [0] * (len(self.buckets) + 1)
+        self.sum = total
+        self.count = count
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other: 'Histogram'):
+        if other.buckets != self.buckets:
+            return
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def to_dict(self):
+        return {'buckets': list(self.buckets), 'counts': self.counts, 'sum': round(self.sum, 6), 'count': self.count}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data['buckets'], data['counts'], data['sum'], data['count'])
+
+
+def current_rss() -> int:
+    """Текущий RSS процесса в байтах"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Не Linux: только пиковое значение за всю жизнь процесса (в КБ)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakMemorySampler:
+    """Фоновый поток, который запоминает максимальный RSS внутри блока with"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+        return False
+
+
+class JobMetrics:
+    """
+    Замеры одной задачи: суммарная длительность этапов и гистограммы
+    задержек на кадр (декодирование, модель машин, модель колес, кадр целиком).
+    """
+
+    def __init__(self, track_memory: bool = False):
+        self.stages = defaultdict(float)
+        self.histograms = {}
+        self.frames = 0
+        self.track_memory = track_memory
+        self.peak_rss = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        sampler = PeakMemorySampler() if self.track_memory else contextlib.nullcontext()
+        start = time.perf_counter()
+        try:
+            with sampler:
+                yield
+        finally:
+            self.stages[name] += time.perf_counter() - start
+            if self.track_memory:
+                self.peak_rss[name] = max(self.peak_rss.get(name, 0), sampler.peak)
+
+    def observe(self, name: str, seconds: float):
+        """Учитывает одно измерение и в гистограмме, и в сумме по этапу"""
+        if name not in self.histograms:
+            self.histograms[name] = Histogram()
+        self.histograms[name].observe(seconds)
+        self.stages[name] += seconds
+
+    def summary(self, queue_wait=None):
+        detection_time = self.stages.get('detection', 0)
+        summary = {
+            'frames': self.frames,
+            'fps': round(self.frames / detection_time, 3) if detection_time else None,
+            'queue_wait': queue_wait,
+            'stages': {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            'histograms': {name: hist.to_dict() for name, hist in self.histograms.items()},
+        }
+        if self.track_memory:
+            summary['peak_rss_mb'] = {name: round(peak / 2 ** 20, 1) for name, peak in self.peak_rss.items()}
+        return summary
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+
+
+def _render_gauge(lines: list, name: str, help_text: str, samples: list):
+    """samples: [(метки, значение), ...]"""
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} gauge')
+    for labels, value in samples:
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+
+
+def _render_window_histogram(lines: list, name: str, help_text: str, histograms: dict, label: str = None):
+    """
+    Гистограмма за окно тремя gauge-семействами _bucket/_sum/_count: значения
+    уменьшаются, когда задачи уходят из окна, поэтому тип histogram (счетчик) тут
+    неверен. histogram_quantile() применяется к ним напрямую, без rate().
+
+    Args:
+        histograms: {значение метки label: Histogram}; без label — {None: Histogram}
+    """
+    buckets, sums, counts = [], [], []
+    for key in sorted(histograms, key=str):
+        histogram = histograms[key]
+        labels = {label: key} if label else {}
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            buckets.append(({**labels, 'le': bound}, cumulative))
+        buckets.append(({**labels, 'le': '+Inf'}, histogram.count))
+        sums.append((labels, round(histogram.sum, 6)))
+        counts.append((labels, histogram.count))
+    _render_gauge(lines, f'{name}_bucket', f'{help_text} Cumulative buckets.', buckets)
+    _render_gauge(lines, f'{name}_sum', f'{help_text} Sum of observations.', sums)
+    _render_gauge(lines, f'{name}_count', f'{help_text} Number of observations.', counts)
+
+
+def render_prometheus(status_counts: dict, summaries: list, window: int) -> str:
+    """
+    Собирает метрики в текстовом формате Prometheus.
+
+    Метрики задач считаются по задачам, завершенным за последние window секунд,
+    и при каждом запросе строятся заново, поэтому все они gauge с префиксом
+    svp_window_: накопительные счетчики Prometheus принял бы за сброс.
+
+    Args:
+        status_counts: Количество запросов по статусам
+        summaries: Сводки JobMetrics.summary() завершенных задач за окно наблюдения
+        window: Длина окна в секундах
+    """
+    lines = []
+    _render_gauge(lines, f'{METRIC_PREFIX}_requests', 'Number of requests by status.',
+                  [({'status': status}, count) for status, count in status_counts.items()])
+
+    window_prefix = f'{METRIC_PREFIX}_window'
+    _render_gauge(lines, f'{window_prefix}_seconds', 'Length of the window the svp_window_* metrics cover.',
+                  [({}, window)])
+
+    frames = sum(summary.get('frames', 0) for summary in summaries)
+    detection_time = sum(summary['stages'].get('detection', 0) for summary in summaries)
+    _render_gauge(lines, f'{window_prefix}_jobs', 'Jobs finished within the window.', [({}, len(summaries))])
+    _render_gauge(lines, f'{window_prefix}_frames_processed', 'Frames processed by jobs finished within the window.',
+                  [({}, frames)])
+    _render_gauge(lines, f'{window_prefix}_throughput_fps',
+                  'Detection throughput of jobs finished within the window, frames per second.',
+                  [({}, round(frames / detection_time, 3) if detection_time else 0)])
+
+    stage_totals = defaultdict(float)
+    stage_counts = defaultdict(int)
+    latencies = {}
+    queue_wait = Histogram(QUEUE_WAIT_BUCKETS)
+    for summary in summaries:
+        for stage, seconds in summary['stages'].items():
+            stage_totals[stage] += seconds
+            stage_counts[stage] += 1
+        for model, data in summary.get('histograms', {}).items():
+            histogram = Histogram.from_dict(data)
+            if model in latencies:
+                latencies[model].merge(histogram)
+            else:
+                latencies[model] = histogram
+        if summary.get('queue_wait') is not None:
+            queue_wait.observe(summary['queue_wait'])
+
+    _render_gauge(lines, f'{window_prefix}_stage_seconds_sum',
+                  'Time spent per processing stage by jobs finished within the window.',
+                  [({'stage': stage}, round(stage_totals[stage], 6)) for stage in sorted(stage_totals)])
+    _render_gauge(lines, f'{window_prefix}_stage_seconds_count',
+                  'Jobs finished within the window that ran the stage.',
+                  [({'stage': stage}, stage_counts[stage]) for stage in sorted(stage_counts)])
+    _render_window_histogram(lines, f'{window_prefix}_queue_wait_seconds',
+                             'Time between request creation and the start of processing, jobs within the window.',
+                             {None: queue_wait})
+    _render_window_histogram(lines, f'{window_prefix}_latency_seconds',
+                             'Per-frame latency of pipeline steps and models, jobs within the window.',
+                             latencies, label='step')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.4 on 2026-10-19 11:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_requests', '0002_request_danger_timings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='request',
+            name='eta_seconds',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='frames_done',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='frames_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='progress_updated',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='stage',
+            field=models.CharField(blank=True, choices=[('downloading', 'Downloading'), ('tracking', 'Tracking'), ('aligning', 'Aligning'), ('rendering', 'Rendering'), ('uploading', 'Uploading')], max_length=20, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-19 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_requests', '0003_request_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='request',
+            name='metrics',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='time_started',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
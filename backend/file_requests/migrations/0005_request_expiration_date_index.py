@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 11:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_requests', '0004_request_metrics'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='request',
+            name='expiration_date',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-19 11:49
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_requests', '0005_request_expiration_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('uploaded_name', models.CharField(max_length=100)),
+                ('name', models.CharField(max_length=250)),
+                ('upload_id', models.CharField(max_length=1024)),
+                ('size', models.BigIntegerField()),
+                ('chunk_size', models.PositiveIntegerField()),
+                ('time_begin', models.DateTimeField(auto_now_add=True)),
+                ('request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='file_requests.request')),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-19 11:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_requests', '0006_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='editedfile',
+            name='danger_timings',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='failed_files',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='request',
+            name='danger_timings',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='request',
+            name='stage',
+            field=models.CharField(blank=True, choices=[('downloading', 'Downloading'), ('tracking', 'Tracking'), ('aligning', 'Aligning'), ('rendering', 'Rendering'), ('uploading', 'Uploading'), ('batch', 'Batch')], max_length=20, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.4 on 2026-10-19 11:55
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_requests', '0007_batch_submissions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('client', models.CharField(max_length=100)),
+                ('items', models.JSONField()),
+                ('cost', models.FloatField()),
+                ('priority', models.PositiveSmallIntegerField(default=0)),
+                ('state', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done')], default='queued', max_length=10)),
+                ('time_queued', models.DateTimeField(auto_now_add=True)),
+                ('time_dispatched', models.DateTimeField(blank=True, null=True)),
+                ('request', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='job', to='file_requests.request')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['state', 'time_queued'], name='file_reques_state_a55ae3_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.4 on 2026-10-19 12:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_requests', '0009_uploadedfile_video_info'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='request',
+            name='camera',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.CreateModel(
+            name='DangerEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('camera', models.CharField(blank=True, default='', max_length=100)),
+                ('video_name', models.CharField(blank=True, default='', max_length=100)),
+                ('time_recorded', models.DateTimeField()),
+                ('track_id', models.PositiveIntegerField()),
+                ('zone', models.PositiveSmallIntegerField(default=0)),
+                ('level', models.PositiveSmallIntegerField()),
+                ('start_frame', models.PositiveIntegerField()),
+                ('end_frame', models.PositiveIntegerField()),
+                ('start_time', models.FloatField()),
+                ('end_time', models.FloatField()),
+                ('dwell_time', models.FloatField()),
+                ('danger_time', models.FloatField(default=0)),
+                ('request', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='danger_events', to='file_requests.request')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['time_recorded', 'id'], name='file_reques_time_re_f153ba_idx'), models.Index(fields=['camera', 'time_recorded', 'id'], name='file_reques_camera_4d4b8a_idx'), models.Index(fields=['level', 'time_recorded', 'id'], name='file_reques_level_24a466_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.4 on 2026-10-19 12:14
+
+import file_requests.storage_backends
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_requests', '0010_danger_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='editedfile',
+            name='detections',
+            field=models.FileField(blank=True, null=True, storage=file_requests.storage_backends.EditedStorage(), upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='editedfile',
+            name='detections_index',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='editedfile',
+            name='fps',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-19 12:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_requests', '0011_editedfile_detections'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='request',
+            name='error',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='request',
+            name='status',
+            field=models.CharField(choices=[('waiting', 'Waiting'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='waiting', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='uploadedfile',
+            name='status',
+            field=models.CharField(choices=[('waiting', 'Waiting'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='waiting', max_length=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 12:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_requests', '0012_request_failed_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='request',
+            name='url_expiration',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
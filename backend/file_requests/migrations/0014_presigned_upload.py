@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-19 12:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_requests', '0013_request_url_expiration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PresignedUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=250, unique=True)),
+                ('uploaded_name', models.CharField(max_length=100)),
+                ('time_begin', models.DateTimeField(auto_now_add=True)),
+                ('request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='presigned_uploads', to='file_requests.request')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 12:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_requests', '0014_presigned_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='request',
+            name='file_version',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_requests', '0015_request_file_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dangerevent',
+            name='video_id',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -1,11 +1,24 @@
+import base64
+import hashlib
+import math
+import os
 import uuid
-from django.db import models
+from asgiref.sync import sync_to_async
+from django.db import models, transaction
+from django.db.models import F
 from django.conf import settings
 from django.core.files.base import ContentFile
 
 from django.utils import timezone
 
-from file_requests.storage_backends import UploadedStorage, EditedStorage, ResultStorage
+from file_requests import status_cache
+from file_requests.checkpoints import JobCheckpoint, CHECKPOINT_STORAGE
+from file_requests.result_links import make_result_link
+from file_requests.storage_backends import (
+    UploadedStorage, EditedStorage, ResultStorage, open_stream, get_object_key, delete_objects,
+    generate_presigned_url, to_proxy_url, create_multipart_upload, upload_part, list_parts,
+    complete_multipart_upload, abort_multipart_upload, S3MultipartWriter,
+)
 
 RESULT_STORAGE = ResultStorage()
 
@@ -14,6 +27,18 @@ class RequestStatus(models.TextChoices):
     WAITING = 'waiting', 'Waiting'
     PROCESSING = 'processing', 'Processing'
     DONE = 'done', 'Done'
+    # Видео не обработалось и после повторов
+    FAILED = 'failed', 'Failed'
+
+
+class ProcessingStage(models.TextChoices):
+    DOWNLOADING = 'downloading', 'Downloading'
+    TRACKING = 'tracking', 'Tracking'
+    ALIGNING = 'aligning', 'Aligning'
+    RENDERING = 'rendering', 'Rendering'
+    UPLOADING = 'uploading', 'Uploading'
+    # Пачка видео: frames_done/frames_total считают готовые видео, а не кадры
+    BATCH = 'batch', 'Batch'
 
 
 class Request(models.Model):
@@ -23,18 +48,55 @@ class Request(models.Model):
     time_begin = models.DateTimeField(auto_now_add=True)
     time_end = models.DateTimeField(auto_now=True)
     url = models.CharField(max_length=250, blank=True, null=True)
-    danger_timings = models.CharField(max_length=500, blank=True, null=True)
+    url_expiration = models.DateTimeField(null=True, blank=True)
+    # Меняется при каждой записи результата: входит в ссылку и в ключ кэша nginx
+    file_version = models.CharField(max_length=32, blank=True, default='')
+    danger_timings = models.TextField(blank=True, null=True)
     file = models.FileField(storage=RESULT_STORAGE)
-    expiration_date = models.DateTimeField(null=True, blank=True)
+    expiration_date = models.DateTimeField(null=True, blank=True, db_index=True)
+    stage = models.CharField(max_length=20, choices=ProcessingStage.choices, blank=True, null=True)
+    frames_done = models.PositiveIntegerField(default=0)
+    frames_total = models.PositiveIntegerField(default=0)
+    eta_seconds = models.FloatField(null=True, blank=True)
+    progress_updated = models.DateTimeField(null=True, blank=True)
+    time_started = models.DateTimeField(null=True, blank=True)
+    metrics = models.JSONField(null=True, blank=True)
+    failed_files = models.JSONField(null=True, blank=True)
+    camera = models.CharField(max_length=100, blank=True, default='')
+    error = models.TextField(blank=True, null=True)
+
+    @classmethod
+    def create_request(cls, camera: str = ''):
+        return cls.objects.create(camera=camera)
 
     @classmethod
-    def create_request(cls):
-        return cls.objects.create()
+    async def acreate_request(cls, camera: str = ''):
+        return await cls.objects.acreate(camera=camera)
 
     @classmethod
     def get_request(cls, request_id: str):
         return cls.objects.get(id=request_id)
 
+    @classmethod
+    def get_cached_status(cls, request_id: str):
+        """Статус из кэша; при промахе читает БД и заполняет кэш"""
+        payload = status_cache.get_status(request_id)
+        if payload is None:
+            payload = cls.get_request(request_id).get_status_payload()
+            status_cache.fill_status(request_id, payload)
+        return payload
+
+    @classmethod
+    async def aget_cached_status(cls, request_id: str):
+        """get_cached_status для асинхронных view"""
+        payload = await status_cache.aget_status(request_id)
+        if payload is None:
+            request = await cls.objects.aget(id=request_id)
+            # Для готового запроса payload подписывает ссылку и сохраняет ее в БД
+            payload = await sync_to_async(request.get_status_payload)()
+            await status_cache.afill_status(request_id, payload)
+        return payload
+
     @classmethod
     def is_request_done(cls, request_id: str):
         request = cls.objects.get(id=request_id)
@@ -44,52 +106,159 @@ class Request(models.Model):
         delta = self.time_end - self.time_begin
         return delta.total_seconds()
 
-    def get_resulting_link(self, expiration=3600):
+    def get_resulting_link(self, expiration=None):
         if not self.status == RequestStatus.DONE:
             raise ValueError("Task is not done!")
         if not self.file:
             raise BrokenPipeError("There should be file if task is done")
-        if self.url:
+        # Сохраненная ссылка выдается, пока ей осталось жить не меньше RESULT_LINK_MIN_TTL,
+        # иначе подписываем новую: она попадет и в кэш статусов, и в уже открытый плеер
+        min_expiration = timezone.now() + timezone.timedelta(seconds=settings.RESULT_LINK_MIN_TTL)
+        if self.url and self.url_expiration and self.url_expiration > min_expiration:
             return self.url
 
-        s3_client = RESULT_STORAGE.connection.meta.client
-        bucket_name = settings.AWS_STORAGE_BUCKET_NAME
-        url = s3_client.generate_presigned_url(
-            ClientMethod='get_object',
-            Params={
-                'Bucket': bucket_name,
-                'Key': f"{ResultStorage.location}/{self.file.name}",
-            },
-            ExpiresIn=expiration
-        )
-        url = url[url.index('//') + 2:]
-        url = url[url.index('/'):]
-        url = '/minio' + url
+        expiration = expiration or settings.RESULT_LINK_EXPIRATION
+        url, _ = make_result_link(self.file.name, expiration, self.file_version or '0')
         self.url = url
-        self.save()
+        self.url_expiration = timezone.now() + timezone.timedelta(seconds=expiration)
+        # update, а не save: save сдвинул бы time_end (auto_now)
+        Request.objects.filter(id=self.id).update(url=self.url, url_expiration=self.url_expiration)
         return url
     
     def get_timings(self):
         return self.danger_timings
+
+    def get_status_payload(self):
+        payload = {
+            'id': str(self.id),
+            'state': self.status,
+            'time_end': self.time_end,
+        }
+        if self.status == RequestStatus.DONE:
+            payload.update({
+                'status': 'ready',
+                'link': self.get_resulting_link(),
+                'timings': self.get_timings(),
+            })
+            if self.failed_files:
+                payload['failed_files'] = self.failed_files
+        elif self.status == RequestStatus.FAILED:
+            payload.update({
+                'status': 'error',
+                'message': self.error,
+            })
+        else:
+            payload.update({
+                'status': 'processing',
+                'progress': self.get_progress(),
+            })
+        payload['url'] = self.url
+        return payload
+
+    def publish_status(self):
+        try:
+            payload = self.get_status_payload()
+        except Exception as e:
+            # Например, ссылку еще нельзя выдать: пусть веб соберет статус из БД сам
+            print(f"Не удалось опубликовать статус {self.id}: {e}")
+            status_cache.invalidate_status(self.id)
+            return
+        status_cache.publish_status(self.id, payload)
+
+    def get_queue_wait(self):
+        if self.time_started is None:
+            return None
+        return (self.time_started - self.time_begin).total_seconds()
+
+    def get_progress(self):
+        percent = None
+        if self.frames_total:
+            percent = round(100 * min(self.frames_done / self.frames_total, 1), 1)
+        return {
+            'stage': self.stage,
+            'frames_done': self.frames_done,
+            'frames_total': self.frames_total,
+            'percent': percent,
+            'eta_seconds': self.eta_seconds,
+            'updated': self.progress_updated,
+        }
+
+    def update_progress(self, stage: str, frames_done: int, frames_total: int, eta_seconds=None):
+        # update() вместо save(): не трогаем остальные поля и auto_now у time_end
+        self.stage = stage
+        self.frames_done = frames_done
+        self.frames_total = frames_total
+        self.eta_seconds = eta_seconds
+        self.progress_updated = timezone.now()
+        Request.objects.filter(id=self.id).update(
+            stage=stage,
+            frames_done=frames_done,
+            frames_total=frames_total,
+            eta_seconds=eta_seconds,
+            progress_updated=self.progress_updated,
+        )
+        self.publish_status()
+
+    def start_batch(self, items_total: int):
+        self.update_progress(ProcessingStage.BATCH, 0, items_total)
+
+    def advance_batch(self):
+        """Отмечает одно готовое видео пачки; задачи пачки выполняются параллельно, поэтому F()"""
+        Request.objects.filter(id=self.id).update(frames_done=F('frames_done') + 1, progress_updated=timezone.now())
+        self.refresh_from_db(fields=['frames_done', 'progress_updated'])
+        self.publish_status()
+
+    def update_batch_result(self, timings: str, failed_files: list):
+        self.danger_timings = timings
+        self.failed_files = failed_files or None
+        self.save()
     
     def update_file(self, name: str, data):
+        # Повтор задачи перезаписывает результат, а не оставляет рядом копию
+        if self.file:
+            self.file.delete(save=False)
         self.file = ContentFile(data, name=name)
+        self.bump_file_version()
+        self.save()
+
+    def set_file_name(self, name: str):
+        """Привязывает к запросу объект, уже загруженный в RESULT_STORAGE под этим именем"""
+        self.file.name = name
+        self.bump_file_version()
         self.save()
 
+    def bump_file_version(self):
+        # Имя объекта при перезаписи то же, поэтому старые ссылки и кэш nginx отсекает версия
+        self.file_version = uuid.uuid4().hex
+        self.url = None
+        self.url_expiration = None
+
     def update_timings(self, new_timings: str):
         self.danger_timings = new_timings
         self.save()
 
-    def update_expiration_date(self):
-        self.expiration_date = timezone.now() + timezone.timedelta(hours=1)
+    def update_expiration_date(self, lifetime: timezone.timedelta = None):
+        self.expiration_date = timezone.now() + (lifetime or timezone.timedelta(hours=1))
+        self.save()
+
+    def reset_expiration_date(self):
+        """Возвращает запрос к обычному сроку жизни, который выставит task_clear_requests"""
+        self.expiration_date = None
         self.save()
         
     def delete(self, *args, **kwargs):
         if self.file:
             self.file.delete(save=False)
+        status_cache.invalidate_status(self.id)
+
+        for chunked_upload in ChunkedUpload.objects.filter(request=self):
+            chunked_upload.abort()
+        for presigned_upload in PresignedUpload.objects.filter(request=self):
+            UploadedFile.file.field.storage.delete(presigned_upload.name)
             
         uploaded_files = UploadedFile.objects.filter(request=self)
         for uploaded_file in uploaded_files:
+            JobCheckpoint(uploaded_file.id).delete()
             uploaded_file.delete()
             
         edited_files = EditedFile.objects.filter(request=self)
@@ -98,9 +267,68 @@ class Request(models.Model):
         
         super().delete(*args, **kwargs)
     
+    @classmethod
+    def delete_bulk(cls, ids: list):
+        """
+        Удаляет запросы пачкой: все их файлы одним проходом DeleteObjects,
+        затем строки одним DELETE с каскадом, без delete() на каждую модель.
+        """
+        for chunked_upload in ChunkedUpload.objects.filter(request_id__in=ids):
+            chunked_upload.abort()
+
+        keys = []
+        for model, storage in ((cls, RESULT_STORAGE),
+                               (UploadedFile, UploadedFile.file.field.storage),
+                               (EditedFile, EditedFile.file.field.storage)):
+            lookup = 'id__in' if model is cls else 'request_id__in'
+            names = model.objects.filter(**{lookup: ids}).exclude(file='').values_list('file', flat=True)
+            keys.extend(get_object_key(storage, name) for name in names)
+        # Чекпоинт — папка сегментов, ее содержимое берем листингом; папки есть только у недообработанных видео
+        file_ids = UploadedFile.objects.filter(request_id__in=ids).values_list('id', flat=True)
+        keys.extend(get_object_key(CHECKPOINT_STORAGE, name) for name in JobCheckpoint.get_stored_names(file_ids))
+        # Загрузки по подписанной ссылке без finalize: объект мог попасть в хранилище, а UploadedFile нет
+        names = PresignedUpload.objects.filter(request_id__in=ids).values_list('name', flat=True)
+        keys.extend(get_object_key(UploadedFile.file.field.storage, name) for name in names)
+        detections = EditedFile.objects.filter(request_id__in=ids).exclude(detections__isnull=True) \
+            .exclude(detections='').values_list('detections', flat=True)
+        keys.extend(get_object_key(EditedFile.detections.field.storage, name) for name in detections)
+
+        errors = delete_objects(RESULT_STORAGE, keys)
+        for error in errors:
+            print(f"Не удалось удалить {error.get('Key')}: {error.get('Message')}")
+
+        cls.objects.filter(id__in=ids).delete()
+        for request_id in ids:
+            status_cache.invalidate_status(request_id)
+        return len(keys), errors
+
+    def update_status_processing(self):
+        self.status = RequestStatus.PROCESSING
+        # В пачке статус выставляет каждое видео, ожидание в очереди считаем по первому
+        if self.time_started is None:
+            self.time_started = timezone.now()
+        self.save()
+        self.publish_status()
+
+    def update_metrics(self, metrics: dict):
+        self.metrics = metrics
+        self.save()
+
     def update_status_done(self):
         self.status = RequestStatus.DONE
         self.save()
+        self.publish_status()
+
+    def update_status_failed(self, error: str):
+        self.status = RequestStatus.FAILED
+        self.error = error
+        self.save()
+        self.publish_status()
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Любое сохранение сбрасывает кэш, чтобы веб не отдал устаревший статус
+        status_cache.invalidate_status(self.id)
 
     def __str__(self):
         return str(self.id) + " — " + str(self.status)
@@ -113,6 +341,9 @@ class File(models.Model):
     @classmethod
     def get_by_id(cls, id):
         return cls.objects.get(id=id)
+
+    def open_stream(self):
+        return open_stream(self.file.storage, self.file.name)
     
     def delete(self, *args, **kwargs):
         if self.file:
@@ -130,27 +361,324 @@ class UploadedFile(File):
 
     file = models.FileField(storage=UploadedStorage())
 
+    # Параметры из заголовка контейнера, читаются при загрузке (file_requests.video_probe)
+    fps = models.FloatField(null=True, blank=True)
+    frame_count = models.PositiveIntegerField(null=True, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True)
+    codec = models.CharField(max_length=16, blank=True, null=True)
+
     def get_file_data(self):
         with self.file.file.open('rb') as f:
             return f.read()
 
     @classmethod
-    def create_file(cls, request: Request, uploaded_name: str, file):
+    def create_file(cls, request: Request, uploaded_name: str, file, video_info: dict = None):
         id = uuid.uuid4()
-        file.name = str(id) + "." + uploaded_name.split('.')[-1]
+        file.name = cls.make_name(id, uploaded_name)
 
-        return cls.objects.create(id=id, request=request, uploaded_name=uploaded_name, file=file)
+        return cls.objects.create(id=id, request=request, uploaded_name=uploaded_name, file=file,
+                                  **(video_info or {}))
+
+    @classmethod
+    def store_file(cls, uploaded_name: str, file) -> str:
+        """
+        Только загрузка в хранилище под новым id, без записи в БД; запись
+        потом создает create_from_storage по возвращенному имени
+        """
+        return cls.file.field.storage.save(cls.make_name(uuid.uuid4(), uploaded_name), file)
+
+    @classmethod
+    def make_name(cls, id, uploaded_name: str):
+        return str(id) + "." + uploaded_name.split('.')[-1]
+
+    @classmethod
+    def create_from_storage(cls, request: Request, uploaded_name: str, name: str, video_info: dict = None):
+        """Создает запись для файла, который клиент уже загрузил в хранилище сам"""
+        id = uuid.UUID(name.split('.')[0])
+        return cls.objects.create(id=id, request=request, uploaded_name=uploaded_name, file=name,
+                                  **(video_info or {}))
+
+    def get_cost(self):
+        """Мегапиксель-секунды видео или None, если заголовок не читали"""
+        if not (self.duration and self.width and self.height):
+            return None
+        return self.duration * self.width * self.height / 1e6
 
 
 class EditedFile(File):
     file = models.FileField(storage=EditedStorage())
+    danger_timings = models.TextField(blank=True, null=True)
+    # Покадровые детекции (file_requests.detections_export) и индекс их gzip-блоков
+    detections = models.FileField(storage=EditedStorage(), blank=True, null=True)
+    detections_index = models.JSONField(null=True, blank=True)
+    fps = models.FloatField(null=True, blank=True)
 
     @classmethod
-    def create_file(cls, request: Request, name: str, data):
+    def create_file(cls, request: Request, name: str, data, id=None):
+        """
+        Args:
+            id: Постоянный id результата (например, id исходного видео): повтор
+                задачи заменит прежний результат, а не добавит второй
+        """
+        if id is not None:
+            existing = cls.objects.filter(id=id).first()
+            if existing is not None:
+                existing.delete()
         file = ContentFile(data, name=name)
 
-        return cls.objects.create(request=request, file=file)
+        return cls.objects.create(id=id or uuid.uuid4(), request=request, file=file)
+
+    def get_display_name(self):
+        return os.path.basename(self.file.name)
+
+    def update_timings(self, timings: str):
+        self.danger_timings = timings
+        self.save()
+
+    def write_detections(self, name: str, blocks, index: list, fps: float):
+        """
+        Загружает выгрузку детекций в хранилище по мере генерации блоков,
+        не собирая файл в памяти.
+
+        Args:
+            blocks: Итератор байтов выгрузки: блоки detections_export.iter_detections
+                или куски файла, записанного DetectionsEncoder
+        """
+        storage = self.detections.storage
+        name = storage.get_available_name(self.detections.field.generate_filename(self, name))
+        with S3MultipartWriter(storage, name) as stream:
+            for block in blocks:
+                stream.write(block)
+        self.detections.name = name
+        self.detections_index = index
+        self.fps = fps
+        self.save()
+
+    def open_detections_stream(self, byte_range: str = None):
+        return open_stream(self.detections.storage, self.detections.name, byte_range)
+
+    def get_detections_link(self, expiration=3600):
+        return to_proxy_url(generate_presigned_url(self.detections.storage, self.detections.name, 'get_object', expiration))
     
     def get_file_data(self):
         with self.file.file.open('rb') as f:
             return f.read()
+
+    def delete(self, *args, **kwargs):
+        if self.detections:
+            self.detections.delete(save=False)
+        super().delete(*args, **kwargs)
+
+
+class ChunkError(Exception):
+    pass
+
+
+class PresignedUpload(models.Model):
+    """
+    Объект, на который выдана подписанная ссылка PUT, но finalize еще не было.
+    По этим записям очистка удаляет файлы брошенных загрузок вместе с запросом.
+    """
+    request = models.ForeignKey(Request, on_delete=models.CASCADE, related_name='presigned_uploads')
+    name = models.CharField(max_length=250, unique=True)
+    uploaded_name = models.CharField(max_length=100)
+    time_begin = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def create_bulk(cls, request: Request, files: list):
+        """files: [(имя в хранилище, исходное имя), ...]"""
+        return cls.objects.bulk_create([
+            cls(request=request, name=name, uploaded_name=uploaded_name) for name, uploaded_name in files
+        ])
+
+
+class ChunkedUpload(models.Model):
+    """
+    Возобновляемая загрузка: видео приходит частями фиксированного размера,
+    каждая часть сразу уходит в S3 multipart upload в uploaded/.
+    Состояние частей хранит сам S3, поэтому после обрыва связи клиент
+    узнает, что уже загружено, и продолжает со следующей части.
+    """
+    # Ограничение S3 на число частей в одной загрузке
+    MAX_PARTS = 10000
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    request = models.ForeignKey(Request, on_delete=models.CASCADE)
+    uploaded_name = models.CharField(max_length=100)
+    name = models.CharField(max_length=250)
+    upload_id = models.CharField(max_length=1024)
+    size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    time_begin = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def get_storage(cls):
+        return UploadedFile.file.field.storage
+
+    @classmethod
+    def start(cls, request: Request, uploaded_name: str, size: int):
+        name = UploadedFile.make_name(uuid.uuid4(), uploaded_name)
+        chunk_size = max(settings.CHUNKED_UPLOAD_CHUNK_SIZE, math.ceil(size / cls.MAX_PARTS))
+        upload_id = create_multipart_upload(cls.get_storage(), name)
+        return cls.objects.create(request=request, uploaded_name=uploaded_name, name=name,
+                                  upload_id=upload_id, size=size, chunk_size=chunk_size)
+
+    def get_parts_count(self):
+        return max(math.ceil(self.size / self.chunk_size), 1)
+
+    def get_expected_chunk_size(self, part_number: int):
+        if part_number < self.get_parts_count():
+            return self.chunk_size
+        return self.size - self.chunk_size * (self.get_parts_count() - 1)
+
+    def upload_chunk(self, part_number: int, data: bytes, content_md5: str) -> str:
+        """
+        Проверяет часть и отправляет ее в S3. Повторная отправка той же части
+        просто перезаписывает ее, поэтому клиент может смело повторять запрос.
+        """
+        if not 1 <= part_number <= self.get_parts_count():
+            raise ChunkError(f"Part number must be between 1 and {self.get_parts_count()}")
+        if len(data) != self.get_expected_chunk_size(part_number):
+            raise ChunkError(f"Part {part_number} must be {self.get_expected_chunk_size(part_number)} bytes")
+        if not content_md5:
+            raise ChunkError("Content-MD5 header is required")
+        if base64.b64encode(hashlib.md5(data).digest()).decode() != content_md5:
+            raise ChunkError("Checksum mismatch")
+
+        return upload_part(self.get_storage(), self.name, self.upload_id, part_number, data, content_md5)
+
+    def get_parts(self):
+        return list_parts(self.get_storage(), self.name, self.upload_id)
+
+    def get_state(self, parts=None):
+        """Какие части уже есть и сколько байт от начала файла загружено подряд"""
+        parts = self.get_parts() if parts is None else parts
+        numbers = {part['PartNumber'] for part in parts}
+        offset = 0
+        next_part = 1
+        while next_part in numbers:
+            offset += self.get_expected_chunk_size(next_part)
+            next_part += 1
+        return {
+            'id': str(self.id),
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'parts_count': self.get_parts_count(),
+            'parts': sorted(numbers),
+            'offset': offset,
+            'next_part': next_part if next_part <= self.get_parts_count() else None,
+        }
+
+    def complete(self):
+        """Собирает объект из частей; возвращает имя файла в хранилище uploaded/"""
+        parts = self.get_parts()
+        if self.get_state(parts)['offset'] != self.size:
+            raise ChunkError("Upload is incomplete")
+        complete_multipart_upload(self.get_storage(), self.name, self.upload_id, parts[:self.get_parts_count()])
+        name = self.name
+        super().delete()
+        return name
+
+    def abort(self):
+        try:
+            abort_multipart_upload(self.get_storage(), self.name, self.upload_id)
+        except Exception as e:
+            print(f"Не удалось отменить загрузку {self.upload_id}: {e}")
+        super().delete()
+
+
+class JobState(models.TextChoices):
+    QUEUED = 'queued', 'Queued'
+    RUNNING = 'running', 'Running'
+    DONE = 'done', 'Done'
+
+
+class ScheduledJob(models.Model):
+    """Запрос, ожидающий места у воркеров; очередь разбирает file_requests.scheduler"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    request = models.OneToOneField(Request, on_delete=models.CASCADE, related_name='job')
+    client = models.CharField(max_length=100)
+    # [[file_id, points], ...] — аргументы task_process_video
+    items = models.JSONField()
+    # Оценка стоимости: длительность × разрешение (мегапиксель-секунды)
+    cost = models.FloatField()
+    priority = models.PositiveSmallIntegerField(default=0)
+    state = models.CharField(max_length=10, choices=JobState.choices, default=JobState.QUEUED)
+    time_queued = models.DateTimeField(auto_now_add=True)
+    time_dispatched = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['state', 'time_queued'])]
+
+    def get_score(self, now=None):
+        """
+        Чем меньше, тем раньше запуск: короткие задачи первыми, но ожидание
+        снижает оценку, поэтому длинная задача со временем обгоняет новые короткие.
+        """
+        now = now or timezone.now()
+        wait = max((now - self.time_queued).total_seconds(), 0)
+        return self.cost / (1 + wait / settings.SCHEDULER_AGING_SECONDS)
+
+    def mark_running(self, priority: int):
+        self.state = JobState.RUNNING
+        self.priority = priority
+        self.time_dispatched = timezone.now()
+        self.save()
+
+    def __str__(self):
+        return f"{self.request_id} — {self.client} — {self.state}"
+
+
+class DangerEvent(models.Model):
+    """
+    Непрерывный отрезок, когда машина (трек) была в опасной зоне. Пишется пачкой
+    в конце задачи и переживает очистку запроса: отчеты строятся по этой таблице,
+    а не по строкам danger_timings.
+    """
+    request = models.ForeignKey(Request, on_delete=models.SET_NULL, null=True, blank=True, related_name='danger_events')
+    camera = models.CharField(max_length=100, blank=True, default='')
+    video_name = models.CharField(max_length=100, blank=True, default='')
+    # id загруженного видео (UploadedFile, у результата тот же id). Не внешний ключ:
+    # видео удаляется вместе с запросом, а события остаются. Имена в пачке могут совпадать
+    video_id = models.UUIDField(null=True, blank=True, db_index=True)
+    # Время постановки запроса: по нему события выбираются за период
+    time_recorded = models.DateTimeField()
+    track_id = models.PositiveIntegerField()
+    zone = models.PositiveSmallIntegerField(default=0)
+    # Наибольший уровень за событие: 1 — рамка машины в зоне, 2 — колеса в зоне
+    level = models.PositiveSmallIntegerField()
+    start_frame = models.PositiveIntegerField()
+    end_frame = models.PositiveIntegerField()
+    start_time = models.FloatField()
+    end_time = models.FloatField()
+    dwell_time = models.FloatField()
+    # Сколько секунд из dwell_time машина была на уровне 2
+    danger_time = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['time_recorded', 'id']),
+            models.Index(fields=['camera', 'time_recorded', 'id']),
+            models.Index(fields=['level', 'time_recorded', 'id']),
+        ]
+
+    @classmethod
+    def create_bulk(cls, request: Request, video_name: str, events: list, video_id=None):
+        """events — словари из file_requests.danger_events.extract_danger_events"""
+        return cls.objects.bulk_create([
+            cls(request=request, camera=request.camera, video_name=video_name, video_id=video_id,
+                time_recorded=request.time_begin, **event)
+            for event in events
+        ], batch_size=1000)
+
+    @classmethod
+    def replace(cls, video: UploadedFile, events: list):
+        """create_bulk, который при повторе задачи заменяет события того же видео"""
+        with transaction.atomic():
+            cls.objects.filter(video_id=video.id).delete()
+            return cls.create_bulk(video.request, video.uploaded_name, events, video_id=video.id)
+
+    def __str__(self):
+        return f"{self.camera or self.request_id} — трек {self.track_id} — уровень {self.level}"
@@ -0,0 +1,45 @@
+import time
+
+from django.conf import settings
+
+
+class ProgressReporter:
+    """
+    Публикует прогресс обработки запроса по этапам.
+
+    Вызывается из горячих циклов на каждом кадре, но пишет в БД не чаще,
+    чем раз в `interval` секунд, чтобы не добавлять UPDATE на каждый кадр.
+    """
+
+    def __init__(self, request, interval: float = None):
+        self.request = request
+        self.interval = settings.PROGRESS_UPDATE_INTERVAL if interval is None else interval
+        self.stage = None
+        self.frames_done = 0
+        self.frames_total = 0
+        self._stage_started = None
+        self._last_flush = None
+
+    def start_stage(self, stage: str, frames_total: int = 0):
+        self.stage = stage
+        self.frames_done = 0
+        self.frames_total = max(int(frames_total), 0)
+        self._stage_started = time.monotonic()
+        self.flush()
+
+    def advance(self, frames: int = 1):
+        self.frames_done += frames
+        if time.monotonic() - self._last_flush >= self.interval:
+            self.flush()
+
+    def get_eta(self):
+        """Оценка оставшегося времени текущего этапа в секундах"""
+        if not self.frames_total or not self.frames_done:
+            return None
+        elapsed = time.monotonic() - self._stage_started
+        remaining = max(self.frames_total - self.frames_done, 0)
+        return round(elapsed / self.frames_done * remaining, 1)
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        self.request.update_progress(self.stage, self.frames_done, self.frames_total, self.get_eta())
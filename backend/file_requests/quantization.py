@@ -0,0 +1,76 @@
+import os
+import shutil
+
+import cv2
+from ultralytics import YOLO
+from ultralytics.utils import YAML
+
+# INT8-варианты моделей для воркеров без GPU. Экспорт идет через OpenVINO:
+# ultralytics калибрует его статической квантизацией (NNCF) по нашим кадрам,
+# а YOLO(путь) загружает результат так же, как .pt, поэтому пайплайн не меняется.
+
+QUANTIZED_FORMAT = 'openvino'
+
+
+def sample_calibration_frames(video_path: str, count: int, output_dir: str) -> list:
+    """
+    Равномерно выбирает count кадров видео и сохраняет их в output_dir как jpg.
+
+    Returns:
+        Пути сохраненных кадров
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Не удалось открыть видео {video_path}")
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    step = max(total // count, 1) if total > 0 else 1
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    frame_index = 0
+    while len(paths) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if frame_index % step == 0:
+            path = os.path.join(output_dir, f"frame_{frame_index:06d}.jpg")
+            cv2.imwrite(path, frame)
+            paths.append(path)
+        frame_index += 1
+    cap.release()
+    return paths
+
+
+def write_calibration_dataset(path: str, images_dir: str, names: dict) -> str:
+    """
+    Описание датасета для калибровки: только изображения, разметка не нужна.
+
+    Args:
+        names: Классы модели (model.names), их ждет загрузчик ultralytics
+    """
+    YAML.save(path, {'path': images_dir, 'train': images_dir, 'val': images_dir, 'names': dict(names)})
+    return path
+
+
+def export_int8(model_path: str, images_dir: str, output_dir: str, imgsz: int = 640) -> str:
+    """
+    Экспортирует модель в INT8 с калибровкой по кадрам из images_dir
+    (см. sample_calibration_frames).
+
+    Returns:
+        Путь к папке квантованной модели в output_dir
+    """
+    model = YOLO(model_path)
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    data = write_calibration_dataset(
+        os.path.join(os.path.dirname(os.path.normpath(images_dir)), f'{name}_calibration.yaml'),
+        images_dir, model.names,
+    )
+    exported = model.export(format=QUANTIZED_FORMAT, int8=True, data=data, imgsz=imgsz, batch=1)
+
+    os.makedirs(output_dir, exist_ok=True)
+    target = os.path.join(output_dir, os.path.basename(os.path.normpath(exported)))
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    shutil.move(exported, target)
+    return target
@@ -0,0 +1,54 @@
+import time
+from urllib.parse import urlencode, urlsplit
+
+from django.core import signing
+from django.utils.crypto import constant_time_compare
+
+from file_requests.storage_backends import generate_presigned_url
+
+# Ссылки на результаты: /results/<имя>?v=...&expires=...&signature=... Подпись
+# проверяет Django без обращения к БД, а файл отдает nginx (X-Accel-Redirect
+# во внутренний location с кэшем), поэтому популярные результаты не идут в MinIO.
+# v — версия объекта (Request.file_version): результат перезаписывается под тем же
+# именем, и версия в ключе кэша не дает nginx отдать старый файл.
+
+RESULT_LINK_SALT = 'file_requests.result_link'
+INTERNAL_PREFIX = '/internal/minio'
+# Подписанный запрос nginx к MinIO нужен только на время промаха кэша
+UPSTREAM_URL_EXPIRATION = 300
+
+
+def _signature(name: str, version: str, expires: int) -> str:
+    return signing.Signer(salt=RESULT_LINK_SALT).signature(f'{name}:{version}:{expires}')
+
+
+def make_result_link(name: str, expiration: int, version: str):
+    """
+    Returns:
+        (ссылка, unix-время, до которого она действует)
+    """
+    expires = int(time.time()) + expiration
+    query = urlencode({'v': version, 'expires': expires, 'signature': _signature(name, version, expires)})
+    return f'/results/{name}?{query}', expires
+
+
+def check_result_link(name: str, version: str, expires, signature: str) -> bool:
+    """False для чужой подписи; ValueError, если срок ссылки истек"""
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if not constant_time_compare(_signature(name, version or '', expires), signature or ''):
+        return False
+    if expires < time.time():
+        raise ValueError("Result link expired")
+    return True
+
+
+def get_accel_path(storage, name: str, version: str) -> str:
+    """
+    Внутренний путь nginx для объекта: версия, путь и подпись S3 из presigned URL.
+    Подпись в ключ кэша не входит, поэтому кэш общий для всех ссылок на одну версию объекта.
+    """
+    url = urlsplit(generate_presigned_url(storage, name, 'get_object', UPSTREAM_URL_EXPIRATION))
+    return f'{INTERNAL_PREFIX}/{version}{url.path}?{url.query}'
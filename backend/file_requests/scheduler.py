@@ -0,0 +1,213 @@
+import secrets
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from celery import chord, group
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import ScheduledJob, JobState, UploadedFile
+
+# Планировщик задач обработки. Запрос не уходит в брокер сразу: он ждет в
+# ScheduledJob, пока не освободится место. Из очереди первыми берутся дешевые
+# задачи (стоимость = длительность × разрешение) с поправкой на время ожидания,
+# у одного клиента одновременно не больше SCHEDULER_CLIENT_LIMIT задач.
+# Пачка видео занимает столько мест, сколько в ней видео: chord раздает их параллельно.
+# Разбор очереди запускается при постановке, по завершении задачи и по beat.
+
+LOCK_KEY = 'scheduler-lock'
+LOCK_TIMEOUT = 30
+
+
+# Снимает блокировку, только если в ней все еще наш токен: после LOCK_TIMEOUT
+# блокировку мог взять другой процесс, и ее нельзя удалять
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def get_client_id(request) -> str:
+    """
+    Клиент для ограничения параллельности — адрес, который проставил nginx.
+    Заголовкам, которые присылает сам клиент (X-Client-Id, начало X-Forwarded-For),
+    верить нельзя: сменив их, клиент обошел бы SCHEDULER_CLIENT_LIMIT.
+    """
+    client = request.headers.get('X-Real-IP') or request.META.get('REMOTE_ADDR', '')
+    return client[:100] or 'unknown'
+
+
+def get_slots(job: ScheduledJob) -> int:
+    """Сколько мест занимает задача: по одному на видео, но не больше всех мест"""
+    return min(max(len(job.items), 1), settings.SCHEDULER_MAX_RUNNING)
+
+
+def estimate_cost(uploaded_file) -> float:
+    """Мегапиксель-секунды видео из параметров, прочитанных при загрузке"""
+    cost = uploaded_file.get_cost()
+    return settings.SCHEDULER_DEFAULT_COST if cost is None else cost
+
+
+def get_priority(score: float) -> int:
+    """Полоса приоритета Celery по оценке задачи (0 — самая срочная)"""
+    for threshold, priority in settings.SCHEDULER_PRIORITY_LANES:
+        if score <= threshold:
+            return priority
+    return settings.SCHEDULER_LOWEST_PRIORITY
+
+
+@contextmanager
+def scheduler_lock(wait: float = 5):
+    """Один разборщик очереди на весь кластер: блокировка через общий кэш (Redis)"""
+    token = secrets.randbits(62)
+    deadline = time.monotonic() + wait
+    acquired = cache.add(LOCK_KEY, token, LOCK_TIMEOUT)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(0.05)
+        acquired = cache.add(LOCK_KEY, token, LOCK_TIMEOUT)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            release_lock(token)
+
+
+def release_lock(token: int):
+    backend = getattr(cache, '_cache', None)
+    if hasattr(backend, 'get_client'):
+        # RedisCache хранит int как есть, поэтому токен сравнивается строкой прямо в Redis
+        key = cache.make_and_validate_key(LOCK_KEY)
+        backend.get_client(key, write=True).eval(RELEASE_LOCK_SCRIPT, 1, key, str(token))
+    elif cache.get(LOCK_KEY) == token:
+        cache.delete(LOCK_KEY)
+
+
+def enqueue_job(job: ScheduledJob):
+    """
+    Отправляет задачу в брокер: одно видео обрабатывается как раньше,
+    пачка раздается параллельно через chord и собирается task_to_zip.
+    """
+    # Импорт здесь: tasks подтягивает celery-приложение и сам импортирует планировщик
+    from tasks import task_process_video, task_to_zip
+
+    if len(job.items) == 1:
+        file_id, points = job.items[0]
+        task_process_video.apply_async((file_id, points), priority=job.priority)
+        return
+
+    job.request.start_batch(len(job.items))
+    header = [
+        task_process_video.s(file_id, points, finalize=False).set(priority=job.priority)
+        for file_id, points in job.items
+    ]
+    chord(group(header))(task_to_zip.s().set(priority=job.priority))
+
+
+def create_job(request, items: list, client: str) -> ScheduledJob:
+    """
+    Записывает запрос в очередь планировщика, не разбирая ее (только ORM).
+
+    Args:
+        items: Список (file_id, points)
+    """
+    cost = 0
+    for file_id, _ in items:
+        cost += estimate_cost(UploadedFile.get_by_id(file_id))
+    return ScheduledJob.objects.create(
+        request=request,
+        client=client,
+        items=[[str(file_id), points] for file_id, points in items],
+        cost=cost,
+    )
+
+
+def submit_job(request, items: list, client: str) -> ScheduledJob:
+    """
+    Ставит запрос в очередь планировщика и сразу разбирает ее. Блокировку
+    очереди не ждет: вызывается из веб-запроса. Async-view вместо этого зовет
+    create_job и request_dispatch, чтобы брокер не занимал общий sync-поток.
+    """
+    job = create_job(request, items, client)
+    dispatch(wait=0)
+    return job
+
+
+def request_dispatch():
+    """Разбор очереди на io-воркере: вызывающий только отправляет сообщение в брокер, без ORM"""
+    # Импорт здесь: tasks подтягивает celery-приложение и сам импортирует планировщик
+    from tasks import task_dispatch_jobs
+    task_dispatch_jobs.delay()
+
+
+def dispatch(wait: float = 5) -> int:
+    """
+    Запускает задачи из очереди, пока есть свободные места.
+
+    Args:
+        wait: Сколько секунд ждать блокировку очереди
+
+    Returns:
+        Сколько задач отправлено в брокер
+    """
+    with scheduler_lock(wait) as acquired:
+        if not acquired:
+            if not wait:
+                # Очередь разбирает другой процесс и мог не увидеть новую задачу:
+                # разбор повторит io-воркер, не дожидаясь beat
+                request_dispatch()
+            # Иначе пропущенное подберет beat
+            return 0
+
+        now = timezone.now()
+        # Задачи, которые не отчитались (например, упал воркер), не должны вечно занимать место
+        ScheduledJob.objects.filter(
+            state=JobState.RUNNING,
+            time_dispatched__lt=now - timezone.timedelta(seconds=settings.SCHEDULER_JOB_TIMEOUT),
+        ).update(state=JobState.DONE)
+
+        running = Counter()
+        free = settings.SCHEDULER_MAX_RUNNING
+        for job in ScheduledJob.objects.filter(state=JobState.RUNNING).only('client', 'items'):
+            running[job.client] += 1
+            free -= get_slots(job)
+        if free <= 0:
+            return 0
+
+        queued = list(
+            ScheduledJob.objects.filter(state=JobState.QUEUED)
+            .select_related('request')
+            .order_by('time_queued')[:settings.SCHEDULER_SCAN_LIMIT]
+        )
+        queued.sort(key=lambda job: job.get_score(now))
+
+        dispatched = 0
+        for job in queued:
+            if free <= 0:
+                break
+            if running[job.client] >= settings.SCHEDULER_CLIENT_LIMIT:
+                continue
+            slots = get_slots(job)
+            if slots > free:
+                # Пачку не обгоняют задачи ниже по очереди, иначе она ждала бы вечно
+                break
+            job.mark_running(get_priority(job.get_score(now)))
+            try:
+                enqueue_job(job)
+            except Exception as e:
+                print(f"Не удалось отправить задачу {job.request_id}: {e}")
+                ScheduledJob.objects.filter(id=job.id).update(state=JobState.QUEUED)
+                break
+            running[job.client] += 1
+            free -= slots
+            dispatched += 1
+        return dispatched
+
+
+def finish_job(request_id):
+    """Освобождает место задачи запроса и запускает следующие"""
+    ScheduledJob.objects.filter(request_id=request_id, state=JobState.RUNNING).update(state=JobState.DONE)
+    dispatch()
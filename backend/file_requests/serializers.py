@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Request, UploadedFile
+from .models import Request, UploadedFile, DangerEvent
 
 class RequestSerializer(serializers.ModelSerializer):
     class Meta:
@@ -11,4 +11,11 @@ class UploadedFileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UploadedFile
         fields = ['id', 'request', 'status', 'uploaded_name']
-        read_only_fields = ['id', 'request', 'status'] 
\ No newline at end of file
+        read_only_fields = ['id', 'request', 'status'] 
+
+class DangerEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DangerEvent
+        fields = ['id', 'request', 'camera', 'video_name', 'video_id', 'time_recorded', 'track_id', 'zone',
+                  'level', 'start_frame', 'end_frame', 'start_time', 'end_time', 'dwell_time', 'danger_time']
+        read_only_fields = fields
@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.core.cache import cache
+
+# Кэш статусов запросов. Воркер публикует статус при каждом изменении,
+# веб читает его без обращения к БД. Ошибки кэша не должны ломать статус:
+# при недоступном Redis все запросы просто идут в БД.
+
+
+def _key(request_id) -> str:
+    return f'request-status:{request_id}'
+
+
+def get_status(request_id):
+    try:
+        return cache.get(_key(request_id))
+    except Exception as e:
+        print(f"Кэш статусов недоступен: {e}")
+        return None
+
+
+async def aget_status(request_id):
+    try:
+        return await cache.aget(_key(request_id))
+    except Exception as e:
+        print(f"Кэш статусов недоступен: {e}")
+        return None
+
+
+def publish_status(request_id, payload: dict):
+    try:
+        cache.set(_key(request_id), payload, settings.STATUS_CACHE_TIMEOUT)
+    except Exception as e:
+        print(f"Кэш статусов недоступен: {e}")
+
+
+def fill_status(request_id, payload: dict):
+    """
+    Кладет статус, прочитанный из БД, только если в кэше пусто: иначе можно
+    затереть более свежий статус, который воркер опубликовал в это время.
+    """
+    try:
+        cache.add(_key(request_id), payload, settings.STATUS_CACHE_TIMEOUT)
+    except Exception as e:
+        print(f"Кэш статусов недоступен: {e}")
+
+
+async def afill_status(request_id, payload: dict):
+    try:
+        await cache.aadd(_key(request_id), payload, settings.STATUS_CACHE_TIMEOUT)
+    except Exception as e:
+        print(f"Кэш статусов недоступен: {e}")
+
+
+def invalidate_status(request_id):
+    try:
+        cache.delete(_key(request_id))
+    except Exception as e:
+        print(f"Кэш статусов недоступен: {e}")
@@ -1,5 +1,8 @@
+import io
+
 from django.conf import settings
 from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
 
 
 class UploadedStorage(S3Boto3Storage):
@@ -18,3 +21,173 @@ class ResultStorage(S3Boto3Storage):
     location = 'result'
     default_acl = 'public-read'
     file_overwrite = False
+
+
+class CheckpointStorage(S3Boto3Storage):
+    # Чекпоинт задачи перезаписывается на месте и наружу не отдается
+    location = 'checkpoints'
+    default_acl = 'private'
+    file_overwrite = True
+
+
+def get_object_key(storage: S3Boto3Storage, name: str) -> str:
+    """Полный ключ объекта в бакете с учетом location хранилища"""
+    return storage._normalize_name(clean_name(name))
+
+
+def generate_presigned_url(storage: S3Boto3Storage, name: str, method: str = 'get_object',
+                           expiration: int = 3600) -> str:
+    client = storage.connection.meta.client
+    return client.generate_presigned_url(
+        ClientMethod=method,
+        Params={'Bucket': storage.bucket_name, 'Key': get_object_key(storage, name)},
+        ExpiresIn=expiration,
+    )
+
+
+def to_proxy_url(url: str) -> str:
+    """Переписывает ссылку MinIO на путь /minio/..., который проксирует nginx"""
+    url = url[url.index('//') + 2:]
+    url = url[url.index('/'):]
+    return '/minio' + url
+
+
+def delete_objects(storage: S3Boto3Storage, keys: list, batch_size: int = 1000) -> list:
+    """
+    Удаляет объекты пачками через DeleteObjects (не больше 1000 ключей за вызов).
+
+    Returns:
+        Ошибки удаления, которые вернул S3
+    """
+    client = storage.connection.meta.client
+    errors = []
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        response = client.delete_objects(
+            Bucket=storage.bucket_name,
+            Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True},
+        )
+        errors.extend(response.get('Errors', []))
+    return errors
+
+
+def open_stream(storage: S3Boto3Storage, name: str, byte_range: str = None):
+    """
+    Поток чтения объекта напрямую из S3, без загрузки целиком в память.
+
+    Args:
+        byte_range: Заголовок Range, чтобы читать только часть объекта
+    """
+    client = storage.connection.meta.client
+    params = {'Range': byte_range} if byte_range else {}
+    response = client.get_object(Bucket=storage.bucket_name, Key=get_object_key(storage, name), **params)
+    return response['Body']
+
+
+def create_multipart_upload(storage: S3Boto3Storage, name: str) -> str:
+    client = storage.connection.meta.client
+    return client.create_multipart_upload(
+        Bucket=storage.bucket_name, Key=get_object_key(storage, name), **storage._get_write_parameters(name),
+    )['UploadId']
+
+
+def upload_part(storage: S3Boto3Storage, name: str, upload_id: str, part_number: int, data: bytes,
+                content_md5: str = None) -> str:
+    """Загружает одну часть; с content_md5 S3 сам отклонит часть, поврежденную по дороге"""
+    client = storage.connection.meta.client
+    params = {'ContentMD5': content_md5} if content_md5 else {}
+    response = client.upload_part(
+        Bucket=storage.bucket_name, Key=get_object_key(storage, name), UploadId=upload_id,
+        PartNumber=part_number, Body=data, **params,
+    )
+    return response['ETag']
+
+
+def list_parts(storage: S3Boto3Storage, name: str, upload_id: str) -> list:
+    """Все уже загруженные части: [{'PartNumber', 'ETag', 'Size'}, ...] по возрастанию номера"""
+    client = storage.connection.meta.client
+    parts = []
+    paginator = client.get_paginator('list_parts')
+    for page in paginator.paginate(Bucket=storage.bucket_name, Key=get_object_key(storage, name), UploadId=upload_id):
+        parts.extend(page.get('Parts', []))
+    return sorted(parts, key=lambda part: part['PartNumber'])
+
+
+def complete_multipart_upload(storage: S3Boto3Storage, name: str, upload_id: str, parts: list):
+    client = storage.connection.meta.client
+    client.complete_multipart_upload(
+        Bucket=storage.bucket_name, Key=get_object_key(storage, name), UploadId=upload_id,
+        MultipartUpload={'Parts': [{'ETag': part['ETag'], 'PartNumber': part['PartNumber']} for part in parts]},
+    )
+
+
+def abort_multipart_upload(storage: S3Boto3Storage, name: str, upload_id: str):
+    client = storage.connection.meta.client
+    client.abort_multipart_upload(Bucket=storage.bucket_name, Key=get_object_key(storage, name), UploadId=upload_id)
+
+
+class S3MultipartWriter(io.RawIOBase):
+    """
+    Файлоподобный объект только на запись: копит данные до размера части
+    и отправляет их в S3 multipart upload. В памяти не больше одной части.
+    """
+
+    def __init__(self, storage: S3Boto3Storage, name: str, part_size: int = None):
+        super().__init__()
+        self.client = storage.connection.meta.client
+        self.bucket = storage.bucket_name
+        self.key = get_object_key(storage, name)
+        self.part_size = part_size or settings.MULTIPART_PART_SIZE
+        self._buffer = bytearray()
+        self._parts = []
+        self._upload_id = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=self.key, **storage._get_write_parameters(name),
+        )['UploadId']
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer.extend(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def _upload_part(self, data: bytes):
+        part_number = len(self._parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, PartNumber=part_number, Body=data,
+        )
+        self._parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+
+    def close(self):
+        if self.closed:
+            return
+        # Последняя часть может быть меньше part_size; пустой объект — одна пустая часть
+        try:
+            if self._buffer or not self._parts:
+                self._upload_part(bytes(self._buffer))
+                self._buffer.clear()
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, MultipartUpload={'Parts': self._parts},
+            )
+        except Exception:
+            # Незавершенный upload иначе хранил бы загруженные части в MinIO
+            self.abort()
+            raise
+        super().close()
+
+    def abort(self):
+        if self.closed:
+            return
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+        self._buffer.clear()
+        super().close()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+        return False
@@ -1,18 +1,70 @@
 import os
+import asyncio
+import gzip
+import json
+import pickle
+import base64
+import hashlib
 import uuid
+import runpy
+import tempfile
+import zipfile
+import threading
+import time
 from unittest.mock import patch, MagicMock
-from io import BytesIO
+from io import BytesIO, StringIO
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from types import SimpleNamespace
 
-from django.test import TestCase, Client, override_settings
+import cv2
+import numpy as np
+import torch
+from asgiref.sync import sync_to_async
+
+from django.test import TestCase, Client, RequestFactory, override_settings
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.utils import timezone
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.exceptions import ImproperlyConfigured
+from django.conf import settings
 
 from rest_framework.test import APITestCase
 from rest_framework import status
 
-from .models import Request, UploadedFile, EditedFile, RequestStatus
-from tasks import task_image_edit, task_to_zip, task_clear_requests
+from .models import (
+    Request, UploadedFile, EditedFile, RequestStatus, ProcessingStage, ChunkedUpload, ScheduledJob, JobState, DangerEvent,
+    PresignedUpload,
+)
+from .views import finalize_upload, UPLOAD_TOKEN_SALT
+from .danger_events import extract_danger_events
+from .detections_export import write_detections, get_byte_range
+from .checkpoints import JobCheckpoint
+from .result_links import make_result_link, check_result_link
+from .quantization import sample_calibration_frames, write_calibration_dataset
+from .align import restore_missing_cars_with_interpolation, StreamingAligner, align_stream
+from .geometry import Point, Polygon, Car
+from . import scheduler
+from .progress import ProgressReporter
+from .metrics import JobMetrics
+from .benchmarking import (
+    SyntheticCase, run_case, compare_results, compare_with_golden, generate_synthetic_video, SyntheticFrameDetector,
+    StubCarModel, StubWheelModel,
+)
+from .frame_ring import FrameRing, run_ring_pipeline
+from .frames_to_times import danger_frames_to_intervals, frame_intervals_to_string
+from .video_probe import probe_video
+from .tracking import JobTracker
+from .inference_server import InferenceServer, InferenceClient, RemoteModel, get_inference_client
+from .detection import detect_cars, detect_car_wheels, assign_wheels, WHEEL_CROP, WHEEL_FRAME, WHEEL_ROI, \
+    WHEEL_STRATEGIES
+from tasks import (
+    task_process_video, task_to_zip, task_clear_requests, process_video_traffic, run_pipeline, get_clip_ranges,
+    get_output_name, StreamingRenderer, OUTPUT_FULL, OUTPUT_HIGHLIGHTS, OUTPUT_CLIPS,
+)
 
 
 class ModelTests(TestCase):
@@ -52,6 +104,66 @@ class ModelTests(TestCase):
         self.assertGreater(request.expiration_date, timezone.now())
 
 
+class ProgressTests(TestCase):
+    def test_progress_reporter_throttles_writes(self):
+        request = Request.create_request()
+        reporter = ProgressReporter(request, interval=3600)
+
+        with patch.object(Request, "update_progress", wraps=request.update_progress) as mock_update:
+            reporter.start_stage(ProcessingStage.TRACKING, 100)
+            for _ in range(50):
+                reporter.advance()
+            self.assertEqual(mock_update.call_count, 1)
+
+            reporter.flush()
+            self.assertEqual(mock_update.call_count, 2)
+
+        request.refresh_from_db()
+        self.assertEqual(request.stage, ProcessingStage.TRACKING)
+        self.assertEqual(request.frames_done, 50)
+        self.assertEqual(request.frames_total, 100)
+        self.assertEqual(request.get_progress()["percent"], 50.0)
+        self.assertIsNotNone(request.eta_seconds)
+
+
+class MetricsTests(TestCase):
+    def test_job_metrics_summary(self):
+        metrics = JobMetrics()
+        with metrics.stage("detection"):
+            for _ in range(3):
+                metrics.observe("car_tracking", 0.02)
+                metrics.frames += 1
+
+        summary = metrics.summary(queue_wait=4.0)
+        self.assertEqual(summary["frames"], 3)
+        self.assertEqual(summary["queue_wait"], 4.0)
+        self.assertIn("detection", summary["stages"])
+        self.assertAlmostEqual(summary["stages"]["car_tracking"], 0.06)
+        self.assertEqual(summary["histograms"]["car_tracking"]["count"], 3)
+
+    def test_metrics_endpoint(self):
+        metrics = JobMetrics()
+        metrics.frames = 10
+        metrics.stages["detection"] = 2.0
+        metrics.observe("car_tracking", 0.02)
+
+        request = Request.create_request()
+        request.update_metrics(metrics.summary(queue_wait=3.0))
+        request.update_status_done()
+        Request.create_request()
+
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('svp_requests{status="waiting"} 1', body)
+        self.assertIn("svp_window_frames_processed 10", body)
+        self.assertIn('svp_window_latency_seconds_bucket{step="car_tracking",le="0.025"} 1', body)
+        self.assertIn('svp_window_queue_wait_seconds_count 1', body)
+        # Значения за окно убывают, поэтому ни счетчиков, ни histogram/summary в выдаче нет
+        types = {line.split()[-1] for line in body.splitlines() if line.startswith("# TYPE")}
+        self.assertEqual(types, {"gauge"})
+
+
 class UploadedFileTests(TestCase):
     def setUp(self):
         self.request = Request.create_request()
@@ -69,6 +181,9 @@ class UploadedFileTests(TestCase):
         self.assertEqual(uploaded_file.status, RequestStatus.WAITING)
 
 
+VIDEO_INFO = {"fps": 25.0, "frame_count": 250, "width": 1280, "height": 720, "duration": 10.0, "codec": "avc1"}
+
+
 class ApiTests(APITestCase):
     def setUp(self):
         self.client = Client()
@@ -89,17 +204,83 @@ class ApiTests(APITestCase):
         )
 
         self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
-        self.assertIn("id", response.data)
-        self.assertIn("status", response.data)
-        self.assertIn("status_url", response.data)
+        self.assertIn("id", response.json())
+        self.assertIn("status", response.json())
+        self.assertIn("status_url", response.json())
 
         mock_group.assert_called_once()
         mock_chord.assert_called_once()
 
+    @patch("file_requests.views.probe_uploaded_file", return_value=VIDEO_INFO)
+    @patch("file_requests.scheduler.estimate_cost", return_value=1.0)
+    @patch("file_requests.scheduler.UploadedFile.get_by_id")
+    @patch("file_requests.views.UploadedFile.store_file", side_effect=lambda name, file: f"{uuid.uuid4()}.mp4")
+    @patch("file_requests.views.UploadedFile.create_from_storage")
+    @patch("file_requests.views.request_dispatch")
+    @patch("tasks.task_to_zip")
+    @patch("tasks.task_process_video")
+    @patch("file_requests.scheduler.chord")
+    def test_batch_upload_fans_out_with_zones(self, mock_chord, mock_task, mock_zip, mock_request_dispatch,
+                                              mock_create_file, mock_store_file, mock_get_by_id, mock_cost,
+                                              mock_probe):
+        mock_create_file.side_effect = lambda request, name, stored, video_info: MagicMock(id=uuid.uuid4())
+        files = [SimpleUploadedFile(name=f"clip{i}.mp4", content=b"video", content_type="video/mp4") for i in range(3)]
+        shared, own = [[0, 0], [5, 0], [5, 5]], [[1, 1], [2, 1], [2, 2]]
+
+        response = self.client.post(self.upload_url, {
+            "file": files,
+            "points": json.dumps(shared),
+            "zones": json.dumps([None, own, None]),
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(mock_store_file.call_count, 3)
+        # Сам view в брокер задачи не отправляет: очередь разбирает io-воркер
+        mock_request_dispatch.assert_called_once_with()
+        mock_chord.assert_not_called()
+        scheduler.dispatch()
+        mock_task.apply_async.assert_not_called()
+        mock_chord.assert_called_once()
+        zones = [call.args[1] for call in mock_task.s.call_args_list]
+        self.assertEqual(zones, [shared, own, shared])
+        self.assertTrue(all(call.kwargs == {"finalize": False} for call in mock_task.s.call_args_list))
+
+        request = Request.objects.get(id=response.json()["id"])
+        self.assertEqual(request.get_progress()["stage"], ProcessingStage.BATCH)
+        self.assertEqual(request.get_progress()["frames_total"], 3)
+
+        response = self.client.post(self.upload_url, {
+            "file": [SimpleUploadedFile(name="clip.mp4", content=b"video", content_type="video/mp4")],
+            "zones": json.dumps([None]),
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_corrupt_video_is_rejected_before_storage(self):
+        broken = SimpleUploadedFile(name="broken.mp4", content=b"not a video", content_type="video/mp4")
+        requests_before = Request.objects.count()
+
+        response = self.client.post(self.upload_url, {"file": [broken], "points": json.dumps([[0, 0], [1, 0], [1, 1]])})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()["files"], ["broken.mp4"])
+        self.assertEqual(Request.objects.count(), requests_before)
+
+    def test_probe_reads_header(self):
+        case = SyntheticCase(160, 90, frames=12, vehicles=1, fps=24)
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, "probe.mp4")
+            generate_synthetic_video(case, path)
+            info = probe_video(path)
+
+        self.assertEqual((info["width"], info["height"], info["frame_count"]), (160, 90, 12))
+        self.assertAlmostEqual(info["fps"], 24)
+        self.assertAlmostEqual(info["duration"], 0.5)
+        self.assertEqual(frame_intervals_to_string([(0, 12)], info["fps"]), "from: 00:00.000, to: 00:00.500; ")
+
     def test_file_upload_api_no_files(self):
         response = self.client.post(self.upload_url, {}, format="multipart")
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
-        self.assertIn("error", response.data)
+        self.assertIn("error", response.json())
 
     def test_request_status_api(self):
         request = Request.create_request()
@@ -107,7 +288,16 @@ class ApiTests(APITestCase):
 
         response = self.client.get(status_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data["status"], "processing")
+        self.assertEqual(response.json()["status"], "processing")
+        self.assertEqual(response.json()["state"], RequestStatus.WAITING)
+
+        request.update_status_processing()
+        request.update_progress(ProcessingStage.RENDERING, 10, 40, 3.0)
+        response = self.client.get(status_url)
+        self.assertEqual(response.json()["state"], RequestStatus.PROCESSING)
+        self.assertEqual(response.json()["progress"]["stage"], ProcessingStage.RENDERING)
+        self.assertEqual(response.json()["progress"]["percent"], 25.0)
+        self.assertEqual(response.json()["progress"]["eta_seconds"], 3.0)
 
         request.status = RequestStatus.DONE
         request.save()
@@ -116,8 +306,16 @@ class ApiTests(APITestCase):
             mock_link.return_value = "/test/link"
             response = self.client.get(status_url)
             self.assertEqual(response.status_code, status.HTTP_200_OK)
-            self.assertEqual(response.data["status"], "ready")
-            self.assertEqual(response.data["link"], "/test/link")
+            self.assertEqual(response.json()["status"], "ready")
+            self.assertEqual(response.json()["link"], "/test/link")
+
+    async def test_status_polls_run_concurrently(self):
+        requests = [await Request.acreate_request() for _ in range(20)]
+        responses = await asyncio.gather(*(
+            self.async_client.get(reverse("api_status", args=[str(request.id)])) for request in requests
+        ))
+        self.assertEqual([response.json()["id"] for response in responses], [str(request.id) for request in requests])
+        self.assertTrue(all(response.json()["status"] == "processing" for response in responses))
 
     def test_request_status_api_not_found(self):
         status_url = reverse("api_status", args=[str(uuid.uuid4())])
@@ -125,6 +323,288 @@ class ApiTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
+class StatusCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.request = Request.create_request()
+        self.status_url = reverse("api_status", args=[str(self.request.id)])
+
+    def test_status_is_served_from_cache(self):
+        self.client.get(self.status_url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.status_url)
+        self.assertEqual(response.json()["state"], RequestStatus.WAITING)
+
+    def test_status_changes_invalidate_cache(self):
+        self.client.get(self.status_url)
+        self.request.update_status_processing()
+        self.request.update_progress(ProcessingStage.TRACKING, 5, 10)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.status_url)
+        self.assertEqual(response.json()["state"], RequestStatus.PROCESSING)
+        self.assertEqual(response.json()["progress"]["frames_done"], 5)
+
+        self.request.status = RequestStatus.DONE
+        self.request.save()
+        with patch("file_requests.models.Request.get_resulting_link", return_value="/test/link"):
+            response = self.client.get(self.status_url)
+        self.assertEqual(response.json()["status"], "ready")
+
+    async def read_events(self, request_id):
+        response = await self.async_client.get(reverse("api_status_events", args=[request_id]))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        return b"".join([chunk async for chunk in response.streaming_content]).decode()
+
+    @override_settings(STATUS_STREAM_POLL_INTERVAL=0, STATUS_STREAM_TIMEOUT=5)
+    async def test_status_events_stream_until_ready(self):
+        await sync_to_async(self.request.update_status_done)()
+        with patch("file_requests.models.Request.get_resulting_link", return_value="/test/link"):
+            body = await self.read_events(str(self.request.id))
+        self.assertTrue(body.startswith("data: "))
+        self.assertEqual(json.loads(body[len("data: "):])["status"], "ready")
+
+    @override_settings(STATUS_STREAM_POLL_INTERVAL=0, STATUS_STREAM_TIMEOUT=5)
+    async def test_status_events_stop_on_failure(self):
+        await sync_to_async(self.request.update_status_failed)("нет файла")
+        events = (await self.read_events(str(self.request.id))).split("\n\n")
+        self.assertEqual(json.loads(events[0][len("data: "):])["status"], "error")
+        self.assertEqual(events[1:], [""])
+
+    async def test_status_events_not_found(self):
+        self.assertIn("event: not_found", await self.read_events(str(uuid.uuid4())))
+
+class DirectUploadTests(APITestCase):
+    @patch("file_requests.views.generate_presigned_url")
+    def presign(self, mock_presign, filename="video.mp4"):
+        mock_presign.return_value = "http://minio:9000/files/uploaded/x.mp4?X-Amz-Signature=abc"
+        return self.client.post(reverse("api_upload_presign"), {"filename": filename}, format="json")
+
+    def test_presign_returns_proxied_put_url(self):
+        response = self.presign()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["upload_url"], "/minio/files/uploaded/x.mp4?X-Amz-Signature=abc")
+        self.assertTrue(Request.objects.filter(id=response.data["id"]).exists())
+
+        self.assertEqual(self.presign(filename="video.exe").status_code, status.HTTP_400_BAD_REQUEST)
+
+    @patch("file_requests.views.probe_video", return_value=VIDEO_INFO)
+    @patch("file_requests.scheduler.estimate_cost", return_value=1.0)
+    @patch("tasks.task_process_video")
+    @patch("file_requests.views.UPLOADED_STORAGE")
+    def test_finalize_enqueues_processing_once(self, mock_storage, mock_task, mock_cost, mock_probe):
+        token = self.presign().data["upload_token"]
+        data = {"upload_token": token, "points": [[0, 0], [1, 0], [1, 1]]}
+        finalize_url = reverse("api_upload_finalize")
+
+        mock_storage.exists.return_value = False
+        response = self.client.post(finalize_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        mock_storage.exists.return_value = True
+        response = self.client.post(finalize_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        uploaded_file = UploadedFile.objects.get(request_id=response.data["id"])
+        self.assertEqual(uploaded_file.uploaded_name, "video.mp4")
+        self.assertEqual(uploaded_file.frame_count, 250)
+        self.assertEqual(uploaded_file.get_cost(), 10.0 * 1280 * 720 / 1e6)
+        mock_task.apply_async.assert_called_once_with((str(uploaded_file.id), data["points"]), priority=0)
+
+        response = self.client.post(finalize_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        response = self.client.post(finalize_url, {**data, "upload_token": token + "x"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        upload = signing.loads(token, salt=UPLOAD_TOKEN_SALT)
+        self.assertFalse(PresignedUpload.objects.filter(request_id=upload["request_id"]).exists())
+
+    @patch("file_requests.views.probe_video", return_value=VIDEO_INFO)
+    @patch("file_requests.views.submit_job")
+    def test_finalize_checks_duplicates_under_lock(self, mock_submit, mock_probe):
+        # Второй finalize, прошедший проверку во view одновременно с первым
+        token = self.presign().data["upload_token"]
+        upload = signing.loads(token, salt=UPLOAD_TOKEN_SALT)
+        req = Request.get_request(upload["request_id"])
+        zones = [[[0, 0], [1, 0], [1, 1]]]
+
+        self.assertEqual(finalize_upload(req, upload["files"], zones, "client").status_code,
+                         status.HTTP_202_ACCEPTED)
+        self.assertEqual(finalize_upload(req, upload["files"], zones, "client").status_code,
+                         status.HTTP_409_CONFLICT)
+        mock_submit.assert_called_once()
+
+    @patch.object(JobCheckpoint, "get_stored_names", new=MagicMock(return_value=[]))
+    @patch("file_requests.models.delete_objects", return_value=[])
+    def test_abandoned_presigned_upload_is_cleaned_up(self, mock_delete_objects):
+        token = self.presign().data["upload_token"]
+        upload = signing.loads(token, salt=UPLOAD_TOKEN_SALT)
+        name = upload["files"][0][0]
+        self.assertTrue(PresignedUpload.objects.filter(name=name).exists())
+
+        Request.delete_bulk([upload["request_id"]])
+
+        self.assertIn(f"uploaded/{name}", mock_delete_objects.call_args[0][1])
+        self.assertFalse(PresignedUpload.objects.filter(name=name).exists())
+
+
+class FakeMultipartStorage:
+    """Части multipart upload в памяти вместо MinIO"""
+
+    def __init__(self):
+        self.parts = {}
+        self.completed = None
+        self.aborted = False
+
+    def upload_part(self, storage, name, upload_id, part_number, data, content_md5=None):
+        self.parts[part_number] = data
+        return f'"etag-{part_number}"'
+
+    def list_parts(self, storage, name, upload_id):
+        return [{"PartNumber": number, "ETag": f'"etag-{number}"', "Size": len(data)}
+                for number, data in sorted(self.parts.items())]
+
+    def complete(self, storage, name, upload_id, parts):
+        self.completed = b"".join(self.parts[part["PartNumber"]] for part in parts)
+
+    def abort(self, storage, name, upload_id):
+        self.aborted = True
+
+
+@override_settings(CHUNKED_UPLOAD_CHUNK_SIZE=4)
+class ChunkedUploadTests(APITestCase):
+    def setUp(self):
+        self.storage = FakeMultipartStorage()
+        for target, fake in (("create_multipart_upload", lambda storage, name: "upload-1"),
+                             ("upload_part", self.storage.upload_part),
+                             ("list_parts", self.storage.list_parts),
+                             ("complete_multipart_upload", self.storage.complete),
+                             ("abort_multipart_upload", self.storage.abort)):
+            patcher = patch(f"file_requests.models.{target}", side_effect=fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def put_part(self, upload_id, part_number, data, checksum=None):
+        checksum = checksum or base64.b64encode(hashlib.md5(data).digest()).decode()
+        return self.client.put(
+            reverse("api_chunked_upload_part", args=[upload_id, part_number]),
+            data, content_type="application/octet-stream", HTTP_CONTENT_MD5=checksum,
+        )
+
+    @patch("file_requests.views.probe_video", return_value=VIDEO_INFO)
+    @patch("file_requests.scheduler.estimate_cost", return_value=1.0)
+    @patch("tasks.task_process_video")
+    def test_resume_and_finalize(self, mock_task, mock_cost, mock_probe):
+        video = b"0123456789"
+        response = self.client.post(reverse("api_chunked_upload_start"),
+                                    {"filename": "video.mp4", "size": len(video)}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["parts_count"], 3)
+        upload_id = response.data["id"]
+
+        self.assertEqual(self.put_part(upload_id, 1, video[:4]).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.put_part(upload_id, 2, video[4:8], checksum="bad").status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.put_part(upload_id, 3, video[8:]).status_code, status.HTTP_200_OK)
+
+        # После обрыва клиент спрашивает состояние и догружает недостающее
+        state = self.client.get(reverse("api_chunked_upload", args=[upload_id])).data
+        self.assertEqual(state["parts"], [1, 3])
+        self.assertEqual(state["offset"], 4)
+        self.assertEqual(state["next_part"], 2)
+
+        finalize_url = reverse("api_chunked_upload_finalize", args=[upload_id])
+        points = [[0, 0], [1, 0], [1, 1]]
+        response = self.client.post(finalize_url, {"points": points}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        self.put_part(upload_id, 2, video[4:8])
+        response = self.client.post(finalize_url, {"points": points}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.storage.completed, video)
+        self.assertFalse(ChunkedUpload.objects.exists())
+        uploaded_file = UploadedFile.objects.get(request_id=response.data["id"])
+        mock_task.apply_async.assert_called_once_with((str(uploaded_file.id), points), priority=0)
+
+    @patch.object(JobCheckpoint, "get_stored_names", new=MagicMock(return_value=[]))
+    @patch("file_requests.models.delete_objects", return_value=[])
+    def test_expired_request_aborts_upload(self, mock_delete_objects):
+        request = Request.create_request()
+        ChunkedUpload.start(request, "video.mp4", 10)
+        Request.delete_bulk([request.id])
+        self.assertTrue(self.storage.aborted)
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+
+@override_settings(SCHEDULER_MAX_RUNNING=2, SCHEDULER_CLIENT_LIMIT=1, SCHEDULER_AGING_SECONDS=60)
+class SchedulerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = patch("file_requests.scheduler.enqueue_job")
+        self.mock_enqueue = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def queue(self, client, cost, waited=0):
+        job = ScheduledJob.objects.create(request=Request.create_request(), client=client, items=[], cost=cost)
+        ScheduledJob.objects.filter(id=job.id).update(time_queued=timezone.now() - timezone.timedelta(seconds=waited))
+        return job
+
+    def running_clients(self):
+        return sorted(ScheduledJob.objects.filter(state=JobState.RUNNING).values_list("client", flat=True))
+
+    def test_shortest_job_first_with_client_limit(self):
+        self.queue("a", cost=1000)
+        self.queue("a", cost=1)
+        self.queue("b", cost=500)
+        short_c = self.queue("c", cost=10)
+
+        self.assertEqual(scheduler.dispatch(), 2)
+        # У клиента a сначала запускается короткая задача, b ждет: c дешевле
+        self.assertEqual(self.running_clients(), ["a", "c"])
+        self.assertEqual(ScheduledJob.objects.get(cost=1).state, JobState.RUNNING)
+
+        scheduler.finish_job(short_c.request_id)
+        self.assertEqual(self.running_clients(), ["a", "b"])
+        self.assertEqual(ScheduledJob.objects.get(cost=1000).state, JobState.QUEUED)
+
+    def test_aging_lets_long_jobs_run(self):
+        long_job = self.queue("a", cost=600, waited=3600)
+        self.queue("b", cost=20)
+        self.queue("c", cost=30)
+
+        self.assertEqual(scheduler.dispatch(), 2)
+        self.assertEqual(ScheduledJob.objects.get(id=long_job.id).state, JobState.RUNNING)
+        self.assertEqual(self.running_clients(), ["a", "b"])
+
+    def test_lost_jobs_release_slots(self):
+        stale = self.queue("a", cost=1)
+        stale.mark_running(0)
+        ScheduledJob.objects.filter(id=stale.id).update(time_dispatched=timezone.now() - timezone.timedelta(days=1))
+        self.queue("a", cost=1)
+
+        self.assertEqual(scheduler.dispatch(), 1)
+        self.assertEqual(ScheduledJob.objects.get(id=stale.id).state, JobState.DONE)
+
+    def test_batch_takes_slot_per_video(self):
+        batch = ScheduledJob.objects.create(request=Request.create_request(), client="a",
+                                            items=[["1", []], ["2", []]], cost=1)
+        self.queue("b", cost=10)
+
+        self.assertEqual(scheduler.dispatch(), 1)
+        self.assertEqual(ScheduledJob.objects.get(id=batch.id).state, JobState.RUNNING)
+        self.assertEqual(self.running_clients(), ["a"])
+
+    def test_lock_release_keeps_foreign_lock(self):
+        with scheduler.scheduler_lock() as acquired:
+            self.assertTrue(acquired)
+            # Блокировка истекла, и ее взял другой процесс
+            cache.set(scheduler.LOCK_KEY, 42)
+        self.assertEqual(cache.get(scheduler.LOCK_KEY), 42)
+
+    def test_client_id_ignores_client_headers(self):
+        request = RequestFactory().get("/", HTTP_X_CLIENT_ID="spoofed", HTTP_X_FORWARDED_FOR="1.1.1.1, 10.0.0.2",
+                              HTTP_X_REAL_IP="10.0.0.2")
+        self.assertEqual(scheduler.get_client_id(request), "10.0.0.2")
+
+
 class WebViewTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -157,45 +637,6 @@ class CeleryTasksTests(TestCase):
             self.request, "test.jpg", self.test_image
         )
 
-    @patch("file_requests.cutom_image_handler.ImageHandler.edit")
-    @patch("file_requests.models.EditedFile.create_file")
-    def test_task_image_edit(self, mock_create_file, mock_edit):
-        mock_edit.return_value = b"edited_content"
-        mock_edited_file = MagicMock()
-        mock_edited_file.id = uuid.uuid4()
-        mock_create_file.return_value = mock_edited_file
-
-        result = task_image_edit(str(self.uploaded_file.id))
-
-        self.assertEqual(result, (mock_edited_file.id, True))
-        mock_edit.assert_called_once()
-        mock_create_file.assert_called_once()
-
-    @patch("file_requests.models.EditedFile.get_by_id")
-    @patch("file_requests.models.Request.update_file")
-    @patch("file_requests.models.Request.update_status_done")
-    @patch("file_requests.models.Request.update_expiration_date")
-    def test_task_to_zip(
-        self,
-        mock_update_expiration,
-        mock_update_status,
-        mock_update_file,
-        mock_get_by_id,
-    ):
-        edited_file_id = uuid.uuid4()
-        mock_edited_file = MagicMock()
-        mock_edited_file.request = self.request
-        mock_edited_file.file.name = "test_edited.jpg"
-        mock_edited_file.get_file_data.return_value = b"edited_content"
-        mock_get_by_id.return_value = mock_edited_file
-
-        result = task_to_zip([(edited_file_id, True)])
-
-        self.assertTrue(result)
-        mock_update_file.assert_called_once()
-        mock_update_status.assert_called_once()
-        mock_update_expiration.assert_called_once()
-
     def test_task_clear_requests(self):
         Request.objects.all().delete()
 
@@ -231,6 +672,165 @@ class CeleryTasksTests(TestCase):
             self.assertIsNotNone(Request.objects.get(id=request_valid.id))
 
 
+class FakeS3Client:
+    """Multipart upload S3 в памяти: собранные объекты лежат в objects"""
+
+    def __init__(self):
+        self.objects = {}
+        self._uploads = {}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self._uploads[Key] = {}
+        return {"UploadId": Key}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self._uploads[UploadId][PartNumber] = Body
+        return {"ETag": f'"etag-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self._uploads.pop(UploadId)
+        self.objects[Key] = b"".join(parts[part["PartNumber"]] for part in MultipartUpload["Parts"])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._uploads.pop(UploadId)
+
+
+class FakeResultStorage:
+    bucket_name = "files"
+
+    def __init__(self, client):
+        self.connection = MagicMock()
+        self.connection.meta.client = client
+
+    def get_available_name(self, name):
+        return name
+
+    def _normalize_name(self, name):
+        return f"result/{name}"
+
+    def _get_write_parameters(self, name):
+        return {}
+
+
+class ClosingStream(BytesIO):
+    closed_count = 0
+
+    def close(self):
+        ClosingStream.closed_count += 1
+        super().close()
+
+
+@override_settings(MULTIPART_PART_SIZE=64, STREAM_CHUNK_SIZE=16)
+class ZipTaskTests(TestCase):
+    @patch("tasks.scheduler.finish_job")
+    @patch("file_requests.models.EditedFile.get_by_id")
+    def test_task_to_zip_streams_archive_through_multipart_upload(self, mock_get_by_id, mock_finish_job):
+        request = Request.create_request()
+        failed = UploadedFile.objects.create(request=request, uploaded_name="broken.mp4", file="broken.mp4")
+        contents = {"first.mp4": os.urandom(150), "second.mp4": os.urandom(40)}
+        edited_files = {}
+        for name, data in contents.items():
+            edited = MagicMock(id=uuid.uuid4(), request=request, danger_timings="")
+            edited.file.name = name
+            edited.get_display_name.return_value = name
+            edited.open_stream.side_effect = lambda data=data: ClosingStream(data)
+            edited_files[edited.id] = edited
+        mock_get_by_id.side_effect = edited_files.get
+
+        client = FakeS3Client()
+        ClosingStream.closed_count = 0
+        with patch("tasks.RESULT_STORAGE", FakeResultStorage(client)), \
+                patch("file_requests.models.Request.update_expiration_date"):
+            result = task_to_zip([(file_id, True) for file_id in edited_files] + [(failed.id, False)])
+
+        self.assertTrue(result)
+        self.assertEqual(ClosingStream.closed_count, len(contents))
+        request.refresh_from_db()
+        self.assertEqual(request.status, RequestStatus.DONE)
+        self.assertEqual(request.failed_files, ["broken.mp4"])
+        self.assertEqual(request.file.name, f"{request.id}.zip")
+
+        with zipfile.ZipFile(BytesIO(client.objects[f"result/{request.id}.zip"])) as archive:
+            self.assertEqual(archive.namelist(), list(contents))
+            for name, data in contents.items():
+                self.assertEqual(archive.getinfo(name).compress_type, zipfile.ZIP_STORED)
+                self.assertEqual(archive.read(name), data)
+        mock_finish_job.assert_called_once_with(request.id)
+
+    @patch("tasks.scheduler.finish_job")
+    @patch("file_requests.models.EditedFile.get_by_id")
+    def test_failed_upload_fails_request_and_frees_slot(self, mock_get_by_id, mock_finish_job):
+        request = Request.create_request()
+        edited = MagicMock(id=uuid.uuid4(), request=request, danger_timings="")
+        edited.file.name = "first.mp4"
+        edited.open_stream.side_effect = lambda: ClosingStream(os.urandom(150))
+        mock_get_by_id.return_value = edited
+
+        client = FakeS3Client()
+        with patch.object(client, "upload_part", side_effect=IOError("MinIO недоступен")), \
+                patch("tasks.RESULT_STORAGE", FakeResultStorage(client)), \
+                patch("file_requests.models.Request.update_expiration_date"), redirect_stdout(StringIO()):
+            result = task_to_zip([(edited.id, True)])
+
+        self.assertFalse(result)
+        request.refresh_from_db()
+        self.assertEqual(request.status, RequestStatus.FAILED)
+        self.assertEqual(request.error, "MinIO недоступен")
+        # Upload отменен, объект не появился
+        self.assertEqual((client.objects, client._uploads), ({}, {}))
+        mock_finish_job.assert_called_once_with(request.id)
+
+
+class TaskRoutingTests(TestCase):
+    def test_tasks_are_routed_to_separate_queues(self):
+        from backend.celery import app
+
+        def queue_of(name):
+            return app.amqp.router.route({}, name)["queue"].name
+
+        self.assertEqual(queue_of("tasks.task_process_video"), "inference")
+        self.assertEqual(queue_of("tasks.task_to_zip"), "io")
+        self.assertEqual(queue_of("tasks.task_clear_requests"), "io")
+
+
+class BulkCleanupTests(TestCase):
+    @patch("file_requests.models.delete_objects", return_value=[])
+    def test_delete_bulk_removes_files_and_rows(self, mock_delete_objects):
+        expired = Request.create_request()
+        Request.objects.filter(id=expired.id).update(file="result.mp4")
+        video = UploadedFile.objects.create(request=expired, uploaded_name="video.mp4", file="source.mp4")
+        EditedFile.objects.create(request=expired, file="edited.mp4")
+        kept = Request.create_request()
+
+        stored = [f"{video.id}/state.pkl.gz", f"{video.id}/00000.pkl.gz"]
+        with patch.object(JobCheckpoint, "get_stored_names", return_value=stored):
+            Request.delete_bulk([expired.id])
+
+        keys = mock_delete_objects.call_args[0][1]
+        self.assertCountEqual(keys, ["result/result.mp4", "uploaded/source.mp4", "edited/edited.mp4",
+                                     f"checkpoints/{video.id}/state.pkl.gz", f"checkpoints/{video.id}/00000.pkl.gz"])
+        self.assertFalse(Request.objects.filter(id=expired.id).exists())
+        self.assertFalse(UploadedFile.objects.filter(request_id=expired.id).exists())
+        self.assertTrue(Request.objects.filter(id=kept.id).exists())
+
+    @patch.object(JobCheckpoint, "get_stored_names", new=MagicMock(return_value=[]))
+    @patch("file_requests.models.delete_objects", return_value=[])
+    def test_task_clear_requests_batches_and_budget(self, mock_delete_objects):
+        past = timezone.now() - timezone.timedelta(days=1)
+        for _ in range(5):
+            request = Request.create_request()
+            Request.objects.filter(id=request.id).update(expiration_date=past)
+
+        with override_settings(CLEAR_REQUESTS_TIME_BUDGET=0):
+            task_clear_requests()
+        self.assertEqual(Request.objects.count(), 5)
+
+        with override_settings(CLEAR_REQUESTS_BATCH_SIZE=2):
+            task_clear_requests()
+        self.assertEqual(Request.objects.count(), 0)
+        self.assertEqual(mock_delete_objects.call_count, 3)
+
+
 class IntegrationTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -251,11 +851,11 @@ class IntegrationTests(TestCase):
         )
 
         self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
-        request_id = response.data["id"]
+        request_id = response.json()["id"]
 
         response = self.client.get(reverse("api_status", args=[request_id]))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data["status"], "processing")
+        self.assertEqual(response.json()["status"], "processing")
 
         request = Request.get_request(request_id)
         request.status = RequestStatus.DONE
@@ -265,5 +865,683 @@ class IntegrationTests(TestCase):
             mock_link.return_value = "/test/result.zip"
             response = self.client.get(reverse("api_status", args=[request_id]))
             self.assertEqual(response.status_code, status.HTTP_200_OK)
-            self.assertEqual(response.data["status"], "ready")
-            self.assertEqual(response.data["link"], "/test/result.zip")
+            self.assertEqual(response.json()["status"], "ready")
+            self.assertEqual(response.json()["link"], "/test/result.zip")
+
+
+class BenchmarkTests(TestCase):
+    def test_run_case_with_stub_models(self):
+        case = SyntheticCase(160, 90, frames=20, vehicles=2, drop_rate=0.2)
+        with tempfile.TemporaryDirectory() as workdir:
+            result = run_case(case, workdir, repeat=1)
+
+        self.assertEqual(result["models"], "stub")
+        self.assertEqual(result["counts"]["frames"], 20)
+        self.assertGreater(result["counts"]["detections"], 0)
+        for step in ("process_video_traffic", "restore_missing_cars_with_interpolation",
+                     "get_danger_level", "polygon_intersects", "draw_rectangles"):
+            self.assertIn(step, result["timings"])
+
+        slower = {"results": [{**result, "timings": {
+            step: {**stats, "median": stats["median"] * 2 + 1} for step, stats in result["timings"].items()
+        }}]}
+        rows = compare_results(slower, {"results": [result]})
+        self.assertTrue(all(row[-1] for row in rows))
+
+    def test_compare_with_golden(self):
+        golden = {
+            "frames": 4,
+            "detections_per_frame": [1, 2, 2, 1],
+            "danger_frames": [1, 2, 3],
+            "intervals": [[1, 3]],
+        }
+        checks = compare_with_golden(dict(golden), golden)
+        self.assertTrue(all(check["passed"] for check in checks))
+
+        worse = {**golden, "detections_per_frame": [0, 0, 2, 1], "danger_frames": [3], "intervals": [[3, 3]]}
+        failed = {check["check"] for check in compare_with_golden(worse, golden) if not check["passed"]}
+        self.assertEqual(failed, {"detections", "frame_mismatch", "danger_jaccard"})
+
+    def test_danger_frames_to_intervals(self):
+        self.assertEqual(danger_frames_to_intervals([5, 1, 2, 2, 3, 9, 10]), [(1, 3), (5, 5), (9, 10)])
+        self.assertEqual(danger_frames_to_intervals([1, 3, 8], max_gap=2), [(1, 3), (8, 8)])
+        self.assertEqual(danger_frames_to_intervals([]), [])
+
+
+class FrameRingTests(TestCase):
+    def test_ring_slots_share_memory(self):
+        ring = FrameRing.create((4, 6, 3), slots=2)
+        other = FrameRing.attach(*ring.spec)
+        ring.frame(1)[:] = 7
+        self.assertEqual(int(other.frame(1).sum()), 7 * 4 * 6 * 3)
+        self.assertEqual(int(other.frame(0).sum()), 0)
+        other.close()
+        ring.close()
+
+    def test_pipeline_delivers_frames_in_order(self):
+        case = SyntheticCase(160, 90, frames=30, vehicles=3, seed=1)
+        seen = []
+
+        def on_frame(frame_index, frame, detections, timings):
+            # Кадр в слоте не должен быть перезаписан, пока его не обработали
+            seen.append((frame_index, len(detections), SyntheticFrameDetector.detect(frame)[0] == detections))
+
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, "ring.mp4")
+            canned_boxes = generate_synthetic_video(case, path)
+            total = run_ring_pipeline(path, (90, 160, 3), SyntheticFrameDetector(), on_frame, workers=2, slots=3)
+
+        self.assertEqual(total, 30)
+        self.assertEqual([frame_index for frame_index, _, _ in seen], list(range(30)))
+        self.assertEqual([count for _, count, _ in seen], [len(boxes) for boxes in canned_boxes])
+        self.assertTrue(all(intact for _, _, intact in seen))
+
+    def test_pipeline_resumes_from_start_frame(self):
+        case = SyntheticCase(160, 90, frames=30, vehicles=3, seed=1)
+        seen = []
+
+        def on_frame(frame_index, frame, detections, timings):
+            seen.append((frame_index, len(detections)))
+
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, "ring.mp4")
+            canned_boxes = generate_synthetic_video(case, path)
+            total = run_ring_pipeline(path, (90, 160, 3), SyntheticFrameDetector(), on_frame, workers=2, slots=3,
+                                      start_frame=12)
+
+        self.assertEqual(total, 30)
+        self.assertEqual(seen, [(index, len(canned_boxes[index])) for index in range(12, 30)])
+
+
+class JobTrackerTests(TestCase):
+    def test_track_ids_are_per_job(self):
+        detections = [(10.0, 10.0, 50.0, 40.0, 0.9, 2.0), (80.0, 20.0, 120.0, 60.0, 0.9, 2.0)]
+        frame = np.zeros((90, 160, 3), dtype=np.uint8)
+        first = JobTracker()
+        first.update(detections, frame)
+        # Новый трекер соседней задачи не должен сбрасывать и занимать id первой
+        second = JobTracker()
+        second_ids = sorted(track_id for track_id, _, _ in second.update(detections[:1], frame))
+        first_ids = sorted(track_id for track_id, _, _ in first.update(detections, frame))
+
+        self.assertEqual(first_ids, [1, 2])
+        self.assertEqual(second_ids, [1])
+
+    def test_concurrent_videos_do_not_share_tracks(self):
+        case = SyntheticCase(160, 90, frames=20, vehicles=3, seed=2)
+
+        def run(path, canned_boxes):
+            frames_data = []
+            process_video_traffic(path, os.devnull, car_model=StubCarModel(canned_boxes),
+                                  wheel_model=StubWheelModel(), sink=frames_data.append)
+            return [[car.id for car in frame] for frame in frames_data]
+
+        with tempfile.TemporaryDirectory() as workdir, redirect_stdout(StringIO()):
+            path = os.path.join(workdir, "tracks.mp4")
+            canned_boxes = generate_synthetic_video(case, path)
+            alone = run(path, canned_boxes)
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                together = list(executor.map(lambda _: run(path, canned_boxes), range(3)))
+
+        self.assertTrue(any(alone))
+        self.assertEqual(together, [alone] * 3)
+
+
+class InferenceServerTests(TestCase):
+    @staticmethod
+    def brightness_detector(frames):
+        # Одна "машина" на кадр, в conf — яркость кадра: по ней видно, чей это ответ
+        return [[(0.0, 0.0, float(frame.shape[1]), float(frame.shape[0]), float(frame[0, 0, 0]), 2.0)]
+                for frame in frames]
+
+    def start_server(self, workdir, predictors, **kwargs):
+        server = InferenceServer(os.path.join(workdir, "inference.sock"), predictors, **kwargs)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_concurrent_jobs_are_batched(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            server = self.start_server(workdir, {"car": self.brightness_detector}, max_batch=4, max_delay=0.2)
+            socket_path = server.server_address
+
+            def job(value):
+                model = RemoteModel(InferenceClient(socket_path), "car")
+                frame = np.full((9, 16, 3), value, dtype=np.uint8)
+                detections, _ = detect_cars(frame, model)
+                model.client.close()
+                return detections
+
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                results = list(executor.map(job, [10, 20, 30, 40]))
+
+        self.assertEqual([detections[0][4] for detections in results], [10.0, 20.0, 30.0, 40.0])
+        self.assertEqual(results[0][0][:4], (0.0, 0.0, 16.0, 9.0))
+        # Четыре кадра разных задач ушли в модель одной пачкой
+        self.assertEqual(server.batchers["car"].batch_sizes, [4])
+
+    def test_errors_are_returned_to_caller(self):
+        def broken(frames):
+            raise ValueError("модель упала")
+
+        with tempfile.TemporaryDirectory() as workdir:
+            server = self.start_server(workdir, {"car": broken}, max_delay=0.001)
+            client = InferenceClient(server.server_address)
+            with self.assertRaisesRegex(RuntimeError, "модель упала"):
+                client.predict("car", [np.zeros((4, 4, 3), dtype=np.uint8)])
+            with self.assertRaisesRegex(RuntimeError, "Неизвестная модель"):
+                client.predict("wheel", [np.zeros((4, 4, 3), dtype=np.uint8)])
+            client.close()
+
+    def test_worker_thread_reuses_one_connection(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            server = self.start_server(workdir, {"car": self.brightness_detector}, max_delay=0.001)
+            client = get_inference_client(server.server_address)
+            self.addCleanup(client.close)
+            self.assertIs(get_inference_client(server.server_address), client)
+            self.assertEqual(len(client.predict("car", [np.zeros((4, 4, 3), dtype=np.uint8)])), 1)
+
+            # Закрытое соединение (например, после обрыва) заменяется новым
+            client.close()
+            fresh = get_inference_client(server.server_address)
+            self.addCleanup(fresh.close)
+            self.assertIsNot(fresh, client)
+            # У другого потока свое соединение
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                other = executor.submit(get_inference_client, server.server_address).result()
+            self.addCleanup(other.close)
+            self.assertIsNot(other, fresh)
+
+
+class WheelStrategyTests(TestCase):
+    def test_unknown_strategy_is_rejected(self):
+        self.assertEqual(set(settings.WHEEL_STRATEGIES), set(WHEEL_STRATEGIES))
+        with patch.dict(os.environ, {"WHEEL_STRATEGY": "rio"}), self.assertRaises(ImproperlyConfigured):
+            runpy.run_module("backend.settings")
+        with self.assertRaises(ValueError):
+            detect_car_wheels(np.zeros((4, 4, 3), dtype=np.uint8), [(0, 0, 2, 2)], None, "rio")
+
+    def test_assign_wheels_by_containment(self):
+        cars = [(0, 0, 100, 60), (80, 10, 200, 80), (300, 300, 340, 330)]
+        wheels = [[10, 45, 30, 60], [95, 60, 115, 80], [150, 60, 170, 80], [250, 250, 260, 260]]
+        # Второе колесо внутри обеих рамок, достается машине, чей низ ближе; последнее — ничье
+        self.assertEqual(assign_wheels(cars, wheels), [[[10, 45, 30, 60]], [[95, 60, 115, 80], [150, 60, 170, 80]], []])
+        self.assertEqual(assign_wheels([], wheels), [])
+
+    def test_single_pass_matches_crop_strategy(self):
+        frame = np.zeros((90, 160, 3), dtype=np.uint8)
+        cars = [(10, 10, 60, 50), (90, 20, 150, 70)]
+        wheel_model = StubWheelModel()
+        crop_wheels = detect_car_wheels(frame, cars, wheel_model, WHEEL_CROP)
+
+        class FrameWheelModel:
+            calls = 0
+
+            def predict(self, image, **kwargs):
+                # Те же колеса, что нашла бы модель в каждом кропе, но за один вызов
+                self.calls += 1
+                offset_x, offset_y = image_offsets[image.shape[:2]]
+                wheels = [[x1 - offset_x, y1 - offset_y, x2 - offset_x, y2 - offset_y]
+                          for car_wheels in crop_wheels for x1, y1, x2, y2 in car_wheels]
+                return [SimpleNamespace(boxes=SimpleNamespace(xyxy=torch.tensor(wheels)))]
+
+        image_offsets = {(90, 160): (0, 0), (70, 150): (0, 10)}
+        model = FrameWheelModel()
+        self.assertEqual(detect_car_wheels(frame, cars, model, WHEEL_FRAME), crop_wheels)
+        self.assertEqual(detect_car_wheels(frame, cars, model, WHEEL_ROI, region=(0, 10, 150, 80)), crop_wheels)
+        self.assertEqual(model.calls, 2)
+
+
+class OutputModeTests(TestCase):
+    def test_clip_ranges_are_padded_and_merged(self):
+        self.assertEqual(get_clip_ranges([(5, 8), (12, 14), (40, 41)], 2, 42), [(3, 16), (38, 41)])
+        self.assertEqual(get_clip_ranges([(0, 1)], 5, 4), [(0, 3)])
+        self.assertEqual(get_clip_ranges([], 5, 100), [])
+
+    def test_output_names(self):
+        self.assertEqual(get_output_name("road.avi", OUTPUT_FULL), "road.avi")
+        self.assertEqual(get_output_name("road.avi", OUTPUT_HIGHLIGHTS), "road_highlights.mp4")
+        self.assertEqual(get_output_name("road.avi", OUTPUT_CLIPS), "road_clips.zip")
+
+    @override_settings(OUTPUT_CLIP_PADDING=0.1, INFERENCE_PROCESSES=1)
+    def test_only_danger_intervals_are_rendered(self):
+        case = SyntheticCase(160, 90, frames=60, vehicles=2, seed=3)
+
+        def run(workdir, output_mode, suffix):
+            output = os.path.join(workdir, f"{output_mode}{suffix}")
+            result = run_pipeline(path, output, case.danger_zone(), car_model=StubCarModel(canned_boxes),
+                                  wheel_model=StubWheelModel(), output_mode=output_mode)
+            return result, output
+
+        with tempfile.TemporaryDirectory() as workdir, redirect_stdout(StringIO()):
+            path = os.path.join(workdir, "input.mp4")
+            canned_boxes = generate_synthetic_video(case, path)
+            full, _ = run(workdir, OUTPUT_FULL, ".mp4")
+            highlights, highlights_path = run(workdir, OUTPUT_HIGHLIGHTS, ".mp4")
+            clips, clips_path = run(workdir, OUTPUT_CLIPS, ".zip")
+
+            ranges = get_clip_ranges(full.intervals, 3, 60)
+            self.assertTrue(ranges)
+            self.assertEqual(highlights.intervals, full.intervals)
+            self.assertEqual(clips.intervals, full.intervals)
+            self.assertEqual(probe_video(highlights_path)["frame_count"], sum(end - start + 1 for start, end in ranges))
+            with zipfile.ZipFile(clips_path) as archive:
+                self.assertEqual(len(archive.namelist()), len(ranges))
+                archive.extract("event_001.mp4", workdir)
+            start, end = ranges[0]
+            self.assertEqual(probe_video(os.path.join(workdir, "event_001.mp4"))["frame_count"], end - start + 1)
+
+
+    @override_settings(INFERENCE_PROCESSES=1, ALIGN_MAX_GAP=0.1, DETECTIONS_CHUNK_FRAMES=8)
+    def test_pipeline_streams_frames_to_rendering_and_export(self):
+        case = SyntheticCase(160, 90, frames=60, vehicles=2, seed=3)
+        zone = case.danger_zone()
+        render = StreamingRenderer.push
+        detected_when_rendered = []
+
+        def spy(renderer, cars):
+            detected_when_rendered.append(car_model.frame_idx)
+            render(renderer, cars)
+
+        with tempfile.TemporaryDirectory() as workdir, redirect_stdout(StringIO()):
+            path = os.path.join(workdir, "input.mp4")
+            detections_path = os.path.join(workdir, "detections.ndjson.gz")
+            canned_boxes = generate_synthetic_video(case, path)
+            car_model = StubCarModel(canned_boxes)
+            with patch.object(StreamingRenderer, "push", spy):
+                result = run_pipeline(path, os.path.join(workdir, "output.mp4"), zone, car_model=car_model,
+                                      wheel_model=StubWheelModel(), detections_path=detections_path)
+            frames_data = []
+            process_video_traffic(path, os.devnull, car_model=StubCarModel(canned_boxes),
+                                  wheel_model=StubWheelModel(), sink=frames_data.append)
+            with open(detections_path, "rb") as f:
+                records = [json.loads(line) for line in gzip.decompress(f.read()).splitlines()]
+
+        # Кадр рисуется через max_gap кадров после своей детекции, а не после всего видео
+        self.assertEqual(detected_when_rendered[:3], [4, 5, 6])
+        self.assertEqual(len(detected_when_rendered), 60)
+        self.assertEqual(result.frames, 60)
+        self.assertEqual(result.detections_per_frame, [len(frame) for frame in frames_data])
+        self.assertEqual([record["frame"] for record in records], list(range(60)))
+        self.assertEqual([chunk[:2] for chunk in result.detections_index][-1], [56, 59])
+
+        aligned = list(align_stream(frames_data, 3))
+        self.assertTrue(result.danger_frames)
+        self.assertEqual(result.danger_frames, [
+            frame_index for frame_index, cars in enumerate(aligned)
+            if any(car.get_danger_level(zone) == 2 for car in cars)
+        ])
+        self.assertEqual(result.danger_events, extract_danger_events(
+            frames_data, zone, result.fps, max_gap=round(settings.DANGER_EVENT_MAX_GAP * result.fps),
+        ))
+
+
+class DangerEventTests(APITestCase):
+    @staticmethod
+    def car(track_id, x, wheels=True):
+        box = Polygon.from_rectangle(Point(x, 0), 10, 10)
+        return Car(wheels=[Polygon.from_rectangle(Point(x, 8), 2, 2)] if wheels else None, bounding_box=box, id=track_id)
+
+    def test_extract_events_per_track(self):
+        zone = Polygon([Point(0, 0), Point(20, 0), Point(20, 20), Point(0, 20)])
+        frames = [
+            [self.car(1, 0, wheels=False), self.car(2, 100)],
+            [self.car(1, 0)],
+            [],
+            [self.car(1, 0, wheels=False)],
+            [], [], [],
+            [self.car(1, 5)],
+        ]
+        events = extract_danger_events(frames, zone, fps=10, max_gap=1)
+
+        self.assertEqual([(e["track_id"], e["start_frame"], e["end_frame"], e["level"]) for e in events],
+                         [(1, 0, 3, 2), (1, 7, 7, 2)])
+        self.assertEqual(events[0]["dwell_time"], 0.4)
+        self.assertEqual(events[0]["danger_time"], 0.1)
+        self.assertEqual(events[0]["end_time"], 0.3)
+
+    @patch.object(JobCheckpoint, "get_stored_names", new=MagicMock(return_value=[]))
+    def test_events_api_filters_and_survives_cleanup(self):
+        first = Request.create_request(camera="gate-1")
+        second = Request.create_request(camera="gate-2")
+        event = {"track_id": 1, "zone": 0, "start_frame": 0, "end_frame": 9,
+                 "start_time": 0.0, "end_time": 0.9, "dwell_time": 1.0, "danger_time": 0.0}
+        DangerEvent.create_bulk(first, "a.mp4", [{**event, "level": 1}, {**event, "track_id": 2, "level": 2}])
+        DangerEvent.create_bulk(second, "b.mp4", [{**event, "level": 2}])
+
+        url = reverse("api_danger_events")
+        response = self.client.get(url, {"camera": "gate-1"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(item["track_id"] for item in response.data["results"]), [1, 2])
+
+        response = self.client.get(url, {"level": 2, "page_size": 1})
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertIsNotNone(response.data["next"])
+        response = self.client.get(response.data["next"])
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertIsNone(response.data["next"])
+
+        later = (timezone.now() + timezone.timedelta(minutes=1)).isoformat()
+        self.assertEqual(self.client.get(url, {"time_from": later}).data["results"], [])
+        self.assertEqual(self.client.get(url, {"time_from": "yesterday"}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {"request": "not-a-uuid"}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(self.client.get(url, {"request": str(second.id)}).data["results"]), 1)
+
+        Request.delete_bulk([first.id])
+        self.assertEqual(DangerEvent.objects.filter(camera="gate-1", request__isnull=True).count(), 2)
+
+    def test_replace_keeps_events_of_same_named_video(self):
+        request = Request.create_request()
+        first = UploadedFile.objects.create(request=request, uploaded_name="cam.mp4", file="uploaded/1.mp4")
+        second = UploadedFile.objects.create(request=request, uploaded_name="cam.mp4", file="uploaded/2.mp4")
+        event = {"track_id": 1, "zone": 0, "level": 2, "start_frame": 0, "end_frame": 9,
+                 "start_time": 0.0, "end_time": 0.9, "dwell_time": 1.0, "danger_time": 0.0}
+        DangerEvent.replace(first, [event])
+        DangerEvent.replace(second, [event, {**event, "track_id": 2}])
+        # Повтор задачи первого видео заменяет только его события
+        DangerEvent.replace(first, [{**event, "track_id": 3}])
+
+        self.assertEqual(sorted(DangerEvent.objects.filter(video_id=first.id).values_list("track_id", flat=True)), [3])
+        self.assertEqual(DangerEvent.objects.filter(video_id=second.id).count(), 2)
+
+
+class DetectionsExportTests(APITestCase):
+    def test_ranges_decode_to_requested_frames(self):
+        zone = Polygon([Point(0, 0), Point(20, 0), Point(20, 20), Point(0, 20)])
+        car = DangerEventTests.car
+        frames = [[car(1, 0)] if i % 2 else [] for i in range(10)]
+        aligned = [[car(1, 0)] for _ in range(10)]
+        stream = BytesIO()
+        index = write_detections(stream, frames, aligned, zone, fps=10, chunk_frames=4)
+        data = stream.getvalue()
+
+        self.assertEqual([chunk[:2] for chunk in index], [[0, 3], [4, 7], [8, 9]])
+        records = [json.loads(line) for line in gzip.decompress(data).splitlines()]
+        self.assertEqual([record["frame"] for record in records], list(range(10)))
+        self.assertEqual(records[2]["cars"], [{"id": 1, "box": [0, 0, 10, 10], "wheels": [[0, 8, 2, 10]],
+                                               "level": 2, "restored": True}])
+        self.assertFalse(records[3]["cars"][0]["restored"])
+
+        byte_range = get_byte_range(index, 5, 8)
+        first, last = map(int, byte_range[len("bytes="):].split("-"))
+        frames_in_range = [json.loads(line)["frame"] for line in gzip.decompress(data[first:last + 1]).splitlines()]
+        self.assertEqual(frames_in_range, [4, 5, 6, 7, 8, 9])
+        self.assertIsNone(get_byte_range(index, 20, 30))
+
+    @patch("file_requests.models.generate_presigned_url", return_value="http://minio:9000/bucket/d.ndjson.gz")
+    def test_detections_api(self, mock_presign):
+        req = Request.create_request()
+        EditedFile.objects.create(request=req, file="edited/a.mp4", detections="edited/a.ndjson.gz",
+                                  detections_index=[[0, 249, 0, 1000], [250, 299, 1000, 300]], fps=25.0)
+        url = reverse("api_detections", args=[req.id])
+
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_409_CONFLICT)
+        Request.objects.filter(id=req.id).update(status=RequestStatus.DONE)
+
+        response = self.client.get(url, {"start": 260, "end": 270})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        item = response.data["files"][0]
+        self.assertEqual(item["frames"], 300)
+        self.assertEqual(item["range"], "bytes=1000-1299")
+        self.assertEqual(item["url"], "/minio/bucket/d.ndjson.gz")
+        self.assertEqual(item["download"], reverse("api_detections_download", args=[req.id, item["id"]]))
+        self.assertEqual(self.client.get(url, {"start": "x"}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(STREAM_CHUNK_SIZE=4)
+    def test_download_streams_requested_blocks(self):
+        req = Request.create_request()
+        file = EditedFile.objects.create(request=req, file="edited/a.mp4", detections="edited/a.ndjson.gz",
+                                         detections_index=[[0, 249, 0, 10], [250, 299, 10, 6]], fps=25.0)
+        stream = ClosingStream(b"second")
+        url = reverse("api_detections_download", args=[req.id, file.id])
+
+        with patch.object(EditedFile, "open_detections_stream", return_value=stream) as mock_open:
+            response = self.client.get(url, {"start": 260})
+            self.assertEqual(b"".join(response.streaming_content), b"second")
+        mock_open.assert_called_once_with("bytes=10-15")
+        self.assertTrue(stream.closed)
+        self.assertEqual(self.client.get(url, {"start": 400}).status_code, status.HTTP_204_NO_CONTENT)
+
+
+class OverwritingStorage(FileSystemStorage):
+    """FileSystemStorage(allow_overwrite=True) в Django 5.1 пишет поверх файла без усечения"""
+
+    def _save(self, name, content):
+        self.delete(name)
+        return super()._save(name, content)
+
+
+class CheckpointTests(TestCase):
+    class CrashingCarModel(StubCarModel):
+        def __init__(self, canned_boxes, crash_at):
+            super().__init__(canned_boxes)
+            self.crash_at = crash_at
+
+        def predict(self, frame, **kwargs):
+            if self.frame_idx == self.crash_at:
+                raise RuntimeError("воркер упал")
+            return super().predict(frame, **kwargs)
+
+    def test_resume_matches_uninterrupted_run(self):
+        case = SyntheticCase(160, 90, frames=30, vehicles=3, seed=4)
+
+        def tracks(frames_data):
+            return [[(car.id, car.bounding_box.points[0].x) for car in frame] for frame in frames_data]
+
+        with tempfile.TemporaryDirectory() as workdir, redirect_stdout(StringIO()):
+            path = os.path.join(workdir, "input.mp4")
+            canned_boxes = generate_synthetic_video(case, path)
+            expected, resumed = [], []
+            process_video_traffic(path, os.devnull, car_model=StubCarModel(canned_boxes),
+                                  wheel_model=StubWheelModel(), sink=expected.append)
+
+            storage = OverwritingStorage(location=os.path.join(workdir, "checkpoints"), allow_overwrite=True)
+            checkpoint = JobCheckpoint(uuid.uuid4(), storage=storage, interval=1e-9)
+            with self.assertRaises(RuntimeError):
+                process_video_traffic(path, os.devnull, car_model=self.CrashingCarModel(canned_boxes, 17),
+                                      wheel_model=StubWheelModel(), checkpoint=checkpoint)
+            self.assertEqual(checkpoint.load()["frame"], 17)
+
+            # Повтор задачи: модель продолжает с того же кадра, что и видео
+            car_model = StubCarModel(canned_boxes)
+            car_model.frame_idx = 17
+            # Кадры до чекпоинта отдаются в sink из сохраненных сегментов, без детекции
+            process_video_traffic(path, os.devnull, car_model=car_model, wheel_model=StubWheelModel(),
+                                  checkpoint=checkpoint, sink=resumed.append)
+
+        self.assertEqual(car_model.frame_idx, 30)
+        self.assertEqual(tracks(resumed), tracks(expected))
+
+    def test_save_appends_only_new_frames(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            storage = OverwritingStorage(location=workdir, allow_overwrite=True)
+            file_id = uuid.uuid4()
+            checkpoint = JobCheckpoint(file_id, storage=storage)
+            for frame in range(3):
+                checkpoint.record([frame])
+            checkpoint.save({'frame': 3})
+            checkpoint.save({'frame': 3})
+            checkpoint.record([3])
+            checkpoint.save({'frame': 4})
+
+            self.assertCountEqual(storage.listdir(str(file_id))[1], ["state.pkl.gz", "00000.pkl.gz", "00001.pkl.gz"])
+            with storage.open(checkpoint.get_segment_name(1), 'rb') as f:
+                self.assertEqual(pickle.loads(gzip.decompress(f.read())), [[3]])
+
+            resumed = JobCheckpoint(file_id, storage=storage)
+            state = resumed.load()
+            self.assertEqual(state, {'frame': 4, 'segments': 2})
+            self.assertEqual(list(resumed.iter_frames(state)), [[0], [1], [2], [3]])
+            self.assertEqual(JobCheckpoint.get_stored_names([file_id, uuid.uuid4()], storage=storage),
+                             [f"{file_id}/{name}" for name in storage.listdir(str(file_id))[1]])
+
+            resumed.delete()
+            self.assertIsNone(JobCheckpoint(file_id, storage=storage).load())
+
+    def test_visibility_timeout_outlasts_task(self):
+        self.assertGreater(settings.CELERY_BROKER_TRANSPORT_OPTIONS['visibility_timeout'], task_process_video.time_limit)
+        with patch.dict(os.environ, {"TASK_TIME_LIMIT": "3600", "CELERY_VISIBILITY_TIMEOUT": "3600"}), \
+                self.assertRaises(ImproperlyConfigured):
+            runpy.run_module("backend.settings")
+
+    @patch("tasks.scheduler.finish_job")
+    def test_failed_task_marks_request_failed(self, mock_finish_job):
+        req = Request.create_request()
+        video = UploadedFile.objects.create(request=req, uploaded_name="a.mp4", file="uploaded/missing.mp4")
+        with patch.object(UploadedFile, "get_file_data", side_effect=IOError("нет файла")), \
+                redirect_stdout(StringIO()):
+            result = task_process_video.apply(args=(str(video.id), [[0, 0], [1, 0], [1, 1]]),
+                                              retries=task_process_video.max_retries)
+
+        self.assertEqual(result.result, (str(video.id), False))
+        req.refresh_from_db()
+        self.assertEqual(req.status, RequestStatus.FAILED)
+        self.assertEqual(req.get_status_payload()["status"], "error")
+        self.assertEqual(req.get_status_payload()["message"], "нет файла")
+        mock_finish_job.assert_called_once_with(req.id)
+
+
+class StreamingAlignerTests(TestCase):
+    @staticmethod
+    def layout(frames):
+        return [sorted((car.id, car.bounding_box.points[0].x) for car in frame) for frame in frames]
+
+    def test_matches_batch_alignment_with_wide_window(self):
+        car = DangerEventTests.car
+        frames = [
+            [car(1, 0)], [], [], [car(1, 5), car(2, 50)], [car(2, 51)],
+            [], [car(1, 9)], [], [car(2, 60)], [],
+        ]
+        expected = restore_missing_cars_with_interpolation(frames)
+        self.assertEqual(self.layout(align_stream(frames, len(frames))), self.layout(expected))
+
+    def test_window_is_bounded_and_long_gaps_stay_empty(self):
+        car = DangerEventTests.car
+        aligner = StreamingAligner(max_gap=2)
+        frames = [[car(1, 0)]] + [[] for _ in range(6)] + [[car(1, 70)]]
+        aligned = []
+        for frame in frames:
+            aligned.extend(aligner.push(frame))
+            self.assertLessEqual(len(aligner._window), 2 * aligner.max_gap + 1)
+        # Кадр отдается, когда пришли max_gap следующих
+        self.assertEqual(len(aligned), len(frames) - 2)
+        aligned.extend(aligner.flush())
+
+        self.assertEqual(self.layout(aligned), [
+            [(1, 0)], [(1, 0)], [(1, 0)], [], [], [(1, 70)], [(1, 70)], [(1, 70)],
+        ])
+
+    def test_default_max_gap_changes_filled_cars(self):
+        # ALIGN_MAX_GAP=2 с при 25 fps: кадр дальше 50 кадров от обоих появлений машины
+        # больше не заполняется, и машину не дорисовывают по всему видео до и после появлений
+        car = DangerEventTests.car
+        frames = [[car(1, 0)]] + [[] for _ in range(120)] + [[car(1, 70), car(2, 30)]] + [[] for _ in range(60)]
+        batch = self.layout(restore_missing_cars_with_interpolation(frames))
+        stream = self.layout(align_stream(frames, round(2 * 25)))
+
+        self.assertEqual(batch[60], [(1, 0), (2, 30)])
+        self.assertEqual(stream[60], [])
+        self.assertEqual(batch[0], [(1, 0), (2, 30)])
+        self.assertEqual(stream[0], [(1, 0)])
+        self.assertEqual(batch[-1], [(1, 70), (2, 30)])
+        self.assertEqual(stream[-1], [])
+        # В пределах max_gap машины дорисовываются так же, как раньше
+        self.assertEqual(stream[121:172], batch[121:172])
+
+class QuantizationTests(TestCase):
+    def test_calibration_frames_and_dataset(self):
+        case = SyntheticCase(160, 90, frames=30, vehicles=1)
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, "input.mp4")
+            generate_synthetic_video(case, path)
+            images_dir = os.path.join(workdir, "images")
+
+            frames = sample_calibration_frames(path, 10, images_dir)
+            self.assertEqual([os.path.basename(frame) for frame in frames],
+                             [f"frame_{index:06d}.jpg" for index in range(0, 30, 3)])
+            self.assertEqual(cv2.imread(frames[0]).shape, (90, 160, 3))
+
+            data = write_calibration_dataset(os.path.join(workdir, "calibration.yaml"), images_dir, {0: "wheel"})
+            with open(data) as f:
+                content = f.read()
+        self.assertIn("val: " + images_dir, content)
+        self.assertIn("0: wheel", content)
+
+
+class ResultLinkTests(TestCase):
+    @staticmethod
+    def params(link):
+        return dict(pair.split("=") for pair in link.split("?")[1].split("&"))
+
+    def test_link_signature_and_expiry(self):
+        link, expires = make_result_link("abc.mp4", 60, "v1")
+        params = self.params(link)
+        self.assertTrue(link.startswith("/results/abc.mp4?v=v1&"))
+        self.assertTrue(check_result_link("abc.mp4", "v1", params["expires"], params["signature"]))
+        self.assertFalse(check_result_link("other.mp4", "v1", params["expires"], params["signature"]))
+        self.assertFalse(check_result_link("abc.mp4", "v2", params["expires"], params["signature"]))
+        self.assertFalse(check_result_link("abc.mp4", "v1", expires + 1, params["signature"]))
+
+        link, _ = make_result_link("abc.mp4", -1, "v1")
+        params = self.params(link)
+        with self.assertRaises(ValueError):
+            check_result_link("abc.mp4", "v1", params["expires"], params["signature"])
+
+    @patch("file_requests.result_links.generate_presigned_url",
+           return_value="http://minio:9000/files/result/abc.mp4?X-Amz-Signature=s")
+    def test_download_is_handed_to_nginx(self, mock_presign):
+        link, _ = make_result_link("abc.mp4", 60, "v1")
+        response = self.client.get(link, HTTP_RANGE="bytes=0-99")
+        # Версия объекта — часть пути, а значит и ключа кэша nginx
+        self.assertEqual(response["X-Accel-Redirect"], "/internal/minio/v1/files/result/abc.mp4?X-Amz-Signature=s")
+
+        self.assertEqual(self.client.get(link.replace("abc", "abd")).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get(link.replace("v=v1", "v=v2")).status_code, status.HTTP_403_FORBIDDEN)
+        expired, _ = make_result_link("abc.mp4", -1, "v1")
+        self.assertEqual(self.client.get(expired).status_code, 410)
+
+    def test_rewritten_result_gets_new_version(self):
+        request = Request.create_request()
+        Request.objects.filter(id=request.id).update(status=RequestStatus.DONE, file="result.mp4")
+        request = Request.get_request(request.id)
+        link = request.get_resulting_link()
+
+        # Повтор задачи записал результат под тем же именем: старая ссылка не годится
+        request.set_file_name("result.mp4")
+        request = Request.get_request(request.id)
+        self.assertIsNone(request.url)
+        self.assertNotEqual(self.params(request.get_resulting_link())["v"], self.params(link)["v"])
+
+    def test_link_refresh_endpoint(self):
+        request = Request.create_request()
+        url = reverse("api_result_link", args=[request.id])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.client.get(reverse("api_result_link", args=[uuid.uuid4()])).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+        Request.objects.filter(id=request.id).update(status=RequestStatus.DONE, file="result.mp4")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.json()["link"].startswith("/results/result.mp4?"))
+        self.assertEqual(response.json()["link"], Request.get_request(request.id).url)
+
+    @override_settings(RESULT_LINK_EXPIRATION=3600, RESULT_LINK_MIN_TTL=600)
+    def test_stale_link_is_regenerated(self):
+        request = Request.create_request()
+        Request.objects.filter(id=request.id).update(status=RequestStatus.DONE, file="result.mp4")
+        request = Request.get_request(request.id)
+        time_end = request.time_end
+
+        link = request.get_resulting_link()
+        self.assertEqual(Request.get_request(request.id).get_resulting_link(), link)
+        self.assertEqual(Request.get_request(request.id).time_end, time_end)
+
+        Request.objects.filter(id=request.id).update(url_expiration=timezone.now() + timezone.timedelta(seconds=60))
+        request = Request.get_request(request.id)
+        with patch("file_requests.result_links.time.time", return_value=time.time() + 1):
+            fresh = request.get_resulting_link()
+        self.assertNotEqual(fresh, link)
+        self.assertGreater(Request.get_request(request.id).url_expiration, timezone.now() + timezone.timedelta(seconds=3000))
@@ -0,0 +1,81 @@
+import numpy as np
+from ultralytics.engine.results import Boxes
+from ultralytics.trackers.track import TRACKER_MAP
+from ultralytics.utils import IterableSimpleNamespace, YAML
+from ultralytics.utils.checks import check_yaml
+
+# Тот же конфиг, что использует model.track по умолчанию
+DEFAULT_TRACKER = 'botsort.yaml'
+
+
+def _iou(a, b) -> float:
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(x2 - x1, 0) * max(y2 - y1, 0)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class _IdCounter:
+    def __init__(self):
+        self.last = 0
+
+    def __call__(self) -> int:
+        self.last += 1
+        return self.last
+
+
+class _InitTrackWithOwnIds:
+    """init_track трекера, после которого треки берут id из счетчика задачи (сериализуется вместе с трекером)"""
+
+    def __init__(self, tracker, counter: _IdCounter):
+        self.tracker = tracker
+        self.counter = counter
+
+    def __call__(self, *args, **kwargs):
+        tracks = type(self.tracker).init_track(self.tracker, *args, **kwargs)
+        for track in tracks:
+            track.next_id = self.counter
+        return tracks
+
+
+class JobTracker:
+    """
+    Трекер одного видео поверх уже посчитанных детекций: то же, что делает
+    model.track, но детекции можно получать где угодно (например, в других процессах).
+
+    Все состояние трекера принадлежит объекту, поэтому в одном процессе
+    параллельно могут идти несколько видео с общими моделями.
+    """
+
+    def __init__(self, config: str = DEFAULT_TRACKER, frame_rate: int = 30):
+        cfg = IterableSimpleNamespace(**YAML.load(check_yaml(config)))
+        self.tracker = TRACKER_MAP[cfg.tracker_type](args=cfg, frame_rate=frame_rate)
+        # У ultralytics счетчик id общий на процесс и сбрасывается каждым новым
+        # трекером, поэтому id видео выдаем сами: с 1, независимо от соседних задач
+        self.tracker.init_track = _InitTrackWithOwnIds(self.tracker, _IdCounter())
+
+    def update(self, detections: list, frame: np.ndarray) -> list:
+        """
+        Args:
+            detections: [(x1, y1, x2, y2, conf, cls, ...), ...]
+            frame: Кадр (нужен BOT-SORT для компенсации движения камеры)
+
+        Returns:
+            [(track_id, (x1, y1, x2, y2), индекс детекции или None), ...]
+        """
+        data = np.array([detection[:6] for detection in detections], dtype=np.float32).reshape(-1, 6)
+        tracks = self.tracker.update(Boxes(data, frame.shape[:2]), frame)
+
+        result = []
+        for track in tracks:
+            box = tuple(float(value) for value in track[:4])
+            # Индекс внутри трекера считается по отфильтрованным детекциям, поэтому
+            # исходную детекцию находим по наибольшему перекрытию
+            best, best_iou = None, 0.0
+            for index, detection in enumerate(detections):
+                iou = _iou(box, detection[:4])
+                if iou > best_iou:
+                    best, best_iou = index, iou
+            result.append((int(track[4]), box, best))
+        return result
@@ -0,0 +1,60 @@
+import os
+import tempfile
+
+import cv2
+
+
+def _fourcc_to_str(fourcc: float) -> str:
+    code = int(fourcc)
+    return ''.join(chr((code >> 8 * i) & 0xFF) for i in range(4)).strip('\x00 ')
+
+
+def probe_video(source: str):
+    """
+    Читает параметры видео из заголовка контейнера, не декодируя кадры.
+
+    Args:
+        source: Путь к файлу или ссылка, которую умеет открыть OpenCV (FFmpeg)
+
+    Returns:
+        Словарь fps, frame_count, width, height, duration, codec
+        или None, если файл поврежден или не поддерживается
+    """
+    capture = cv2.VideoCapture(source)
+    try:
+        if not capture.isOpened():
+            return None
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        codec = _fourcc_to_str(capture.get(cv2.CAP_PROP_FOURCC))
+    finally:
+        capture.release()
+
+    if fps <= 0 or width <= 0 or height <= 0:
+        return None
+    # Контейнеры без индекса (часть mkv/avi) не знают число кадров, это не ошибка
+    frame_count = frame_count if frame_count > 0 else None
+    return {
+        'fps': fps,
+        'frame_count': frame_count,
+        'width': width,
+        'height': height,
+        'duration': frame_count / fps if frame_count else None,
+        'codec': codec,
+    }
+
+
+def probe_uploaded_file(file):
+    """probe_video для файла из request.FILES: большие уже лежат на диске, маленькие пишем во временный"""
+    if hasattr(file, 'temporary_file_path'):
+        return probe_video(file.temporary_file_path())
+
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(file.name)[1]) as tfile:
+        for chunk in file.chunks():
+            tfile.write(chunk)
+        tfile.flush()
+        info = probe_video(tfile.name)
+    file.seek(0)
+    return info
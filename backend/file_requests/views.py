@@ -1,9 +1,23 @@
-from django.http import JsonResponse, HttpResponseNotFound
+from django.http import JsonResponse, HttpResponseNotFound, HttpResponse, StreamingHttpResponse, \
+    HttpResponseForbidden, HttpResponseRedirect
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core import signing
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 from django.shortcuts import render, get_object_or_404
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
 
 
-from .models import Request, UploadedFile, UploadedFile, EditedFile
+from .models import Request, UploadedFile, UploadedFile, EditedFile, RequestStatus, ChunkedUpload, ChunkError, DangerEvent, \
+    PresignedUpload, RESULT_STORAGE
 from tasks import task_process_video, task_to_zip
 from celery import chord, group
 
@@ -11,16 +25,35 @@ from django.views.generic.edit import FormView
 from .forms import FileFieldForm
 from .common import *
 from django.core.files.storage import FileSystemStorage
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ObjectDoesNotExist, ValidationError as DjangoValidationError
 
 from rest_framework.views import APIView
+from rest_framework.generics import ListAPIView
+from rest_framework.pagination import CursorPagination
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework import status
 
-from .serializers import RequestSerializer
+from .serializers import RequestSerializer, DangerEventSerializer
+from .metrics import render_prometheus
+from .storage_backends import generate_presigned_url, to_proxy_url
+from .scheduler import submit_job, create_job, request_dispatch, get_client_id
+from .video_probe import probe_video, probe_uploaded_file
+from .detections_export import FORMAT as DETECTIONS_FORMAT, get_byte_range, iter_stream
+from .result_links import check_result_link, get_accel_path
 
+import asyncio
+import os
 import json
+import uuid
+
+UPLOADED_STORAGE = UploadedFile.file.field.storage
+UPLOAD_TOKEN_SALT = 'file_requests.direct_upload'
+# Ссылка для чтения заголовка загруженного видео нужна всего на несколько секунд
+PROBE_URL_EXPIRATION = 300
+# Статусы, после которых поток событий статуса завершается
+FINAL_STATUSES = ('ready', 'error')
 
 
 def get_task_status(request_id):
@@ -42,13 +75,10 @@ def request_page_view(request, request_id):
     return render(request, 'request.html', {'request_id': request_id})
 
 
-def request_time_processing_info(request, request_id):
+async def request_time_processing_info(request, request_id):
     stats = {}
     try:
-        req = Request.get_request(request_id)
-        if req is None:
-            return HttpResponseNotFound("404, No request")
-
+        req = await Request.objects.aget(id=request_id)
         stats['seconds'] = req.get_processing_time()
     except Exception as e:
         return HttpResponseNotFound(f"404, {e}")
@@ -56,69 +86,483 @@ def request_time_processing_info(request, request_id):
     return JsonResponse(stats)
 
 
-class FileUploadAPIView(APIView):
-    parser_classes = (MultiPartParser, FormParser)
-    
-    def post(self, request, format=None):
+def result_download_view(request, name):
+    """
+    Скачивание результата по подписанной ссылке (Request.get_resulting_link).
+    Сам файл, включая Range-запросы плеера, отдает nginx из кэша.
+    """
+    version = request.GET.get('v')
+    try:
+        if not check_result_link(name, version, request.GET.get('expires'), request.GET.get('signature')):
+            return HttpResponseForbidden("403, Invalid link")
+    except ValueError:
+        # Новую ссылку страница берет из result_link_view
+        return HttpResponse("410, Link expired", status=410)
+
+    if not settings.RESULT_ACCEL_REDIRECT:
+        return HttpResponseRedirect(to_proxy_url(
+            generate_presigned_url(RESULT_STORAGE, name, 'get_object', settings.RESULT_LINK_MIN_TTL)
+        ))
+    response = HttpResponse()
+    response['X-Accel-Redirect'] = get_accel_path(RESULT_STORAGE, name, version)
+    return response
+
+
+def result_link_view(request, request_id):
+    """
+    Действующая ссылка на результат. Статус после 'ready' больше не опрашивается,
+    поэтому плеер, получив 410 на истекшую ссылку, берет новую здесь.
+    """
+    try:
+        req = Request.get_request(request_id)
+        link = req.get_resulting_link()
+    except (ObjectDoesNotExist, DjangoValidationError):
+        return JsonResponse({'error': 'Request not found'}, status=404)
+    except ValueError:
+        return JsonResponse({'error': 'Task is not done'}, status=409)
+    return JsonResponse({'link': link, 'expires': req.url_expiration})
+
+
+def metrics_view(request):
+    status_counts = dict(Request.objects.values_list('status').annotate(count=Count('id')).order_by())
+    since = timezone.now() - timezone.timedelta(seconds=settings.METRICS_WINDOW)
+    summaries = Request.objects.filter(
+        status=RequestStatus.DONE, time_end__gte=since, metrics__isnull=False,
+    ).values_list('metrics', flat=True)
+
+    return HttpResponse(render_prometheus(status_counts, list(summaries), settings.METRICS_WINDOW),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def get_accepted_data(req):
+    serializer = RequestSerializer(req)
+    response_data = serializer.data
+    response_data.update({
+        'status_url': f'/api/status/{str(req.id)}/'
+    })
+    return response_data
+
+
+def accepted_response(req):
+    return Response(get_accepted_data(req), status=status.HTTP_202_ACCEPTED)
+
+
+def get_zones(data, count: int):
+    """Зона для каждого видео: своя из zones или общая из points; None, если какой-то нет"""
+    points = parse_points(data.get('points', []))
+    zones = parse_zones(data.get('zones'), count)
+    if zones is None:
+        return None
+    zones = [zone or points for zone in zones]
+    if not all(zones):
+        return None
+    return zones
+
+
+def get_camera(data) -> str:
+    """Необязательный идентификатор камеры: по нему фильтруются события опасности"""
+    return str(data.get('camera') or '')[:100]
+
+
+# Загрузка и статус — асинхронные view для ASGI: ожидание клиента и хранилища
+# не держит поток, поэтому один процесс обслуживает тысячи опросов и загрузок.
+# DRF не умеет async, поэтому это обычные view Django с ответами JsonResponse.
+@method_decorator(csrf_exempt, name='dispatch')
+class FileUploadAPIView(View):
+    async def post(self, request, format=None):
         print("get request")
-        files = request.FILES.getlist('file')
+        # Тело запроса ASGI-сервер уже дочитал, но разбор multipart пишет файлы на диск
+        files = await sync_to_async(request.FILES.getlist)('file')
         print(files)
 
-        points = request.data.get('points', [])
-        points = json.loads(points)
-        print(points)
+        if not files:
+            return JsonResponse({'error': 'No files provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(files) > MAX_BATCH_FILES:
+            return JsonResponse({'error': 'Too many files'}, status=status.HTTP_400_BAD_REQUEST)
+
+        zones = get_zones(request.POST, len(files))
+        if zones is None:
+            return JsonResponse({'error': 'No points provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Заголовки читаются до загрузки в хранилище: битый файл не займет ни место, ни воркер
+        accepted = [(file, zone) for file, zone in zip(files, zones)
+                    if validate_file_extensions(ALLOWED_FILE_EXTENSIONS, file.name)]
+        video_infos = await asyncio.gather(*(
+            sync_to_async(probe_uploaded_file, thread_sensitive=False)(file) for file, zone in accepted
+        ))
 
-        if not files or not points:
-            return Response({'error': 'No files provided'}, status=status.HTTP_400_BAD_REQUEST)
-            
-        req = Request.create_request()
-        file_ids = []
+        corrupt = [file.name for (file, zone), video_info in zip(accepted, video_infos) if video_info is None]
+        if corrupt:
+            return JsonResponse({'error': 'Unsupported or corrupt video', 'files': corrupt},
+                                status=status.HTTP_400_BAD_REQUEST)
 
-        if len(files) > 1:
+        if not accepted:
+            return JsonResponse({'error': 'No valid image files were uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+
+        req = await Request.acreate_request(get_camera(request.POST))
+        items = []
+        for (file, zone), video_info in zip(accepted, video_infos):
+            # Загрузка в хранилище (boto3) идет вне общего sync-потока, в нем только запись в БД
+            name = await sync_to_async(UploadedFile.store_file, thread_sensitive=False)(file.name, file)
+            uploaded = await sync_to_async(UploadedFile.create_from_storage)(req, file.name, name, video_info)
+            items.append((uploaded.id, zone))
+
+        await sync_to_async(create_job)(req, items, get_client_id(request))
+        # Очередь разберет io-воркер: здесь только сообщение в брокер, общий sync-поток ему не нужен
+        await sync_to_async(request_dispatch, thread_sensitive=False)()
+
+        return JsonResponse(get_accepted_data(req), status=status.HTTP_202_ACCEPTED)
+
+
+class PresignedUploadAPIView(APIView):
+    """
+    Первый шаг прямой загрузки: выдает подписанные ссылки PUT в uploaded/,
+    по которым клиент отправляет видео в MinIO, минуя Django.
+    Принимает filename для одного видео или filenames для пачки.
+    """
+
+    def post(self, request, format=None):
+        filenames = request.data.get('filenames') or [request.data.get('filename', '')]
+        if not isinstance(filenames, list) or len(filenames) > MAX_BATCH_FILES:
             return Response({'error': 'Too many files'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        for file in files:
-            if validate_file_extensions(ALLOWED_FILE_EXTENSIONS, file.name):
-                file_ids.append(UploadedFile.create_file(req, file.name, file).id)
-            else:
-                continue
-                
-        if not file_ids:
-            return Response({'error': 'No valid image files were uploaded'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        task_process_video.delay(file_ids[0], points)
-        
-        serializer = RequestSerializer(req)
-        response_data = serializer.data
+        for filename in filenames:
+            if not filename or not validate_file_extensions(ALLOWED_FILE_EXTENSIONS, filename):
+                return Response({'error': 'Unsupported file extension'}, status=status.HTTP_400_BAD_REQUEST)
+
+        req = Request.create_request(get_camera(request.data))
+        # Пока клиент грузит файлы, запрос не должен попасть под очистку
+        req.update_expiration_date(timezone.timedelta(seconds=settings.UPLOAD_TOKEN_MAX_AGE))
+        uploads = []
+        for filename in filenames:
+            name = UploadedFile.make_name(uuid.uuid4(), filename)
+            upload_url = generate_presigned_url(
+                UPLOADED_STORAGE, name, 'put_object', settings.UPLOAD_URL_EXPIRATION,
+            )
+            uploads.append({'filename': filename, 'name': name, 'upload_url': to_proxy_url(upload_url)})
+        PresignedUpload.create_bulk(req, [(upload['name'], upload['filename']) for upload in uploads])
+        token = signing.dumps(
+            {'request_id': str(req.id), 'files': [[upload['name'], upload['filename']] for upload in uploads]},
+            salt=UPLOAD_TOKEN_SALT,
+        )
+
+        response_data = {
+            'id': str(req.id),
+            'upload_method': 'PUT',
+            'upload_token': token,
+            'expires_in': settings.UPLOAD_URL_EXPIRATION,
+            'finalize_url': '/api/upload/finalize/',
+        }
+        if request.data.get('filenames'):
+            response_data['uploads'] = [
+                {'filename': upload['filename'], 'upload_url': upload['upload_url']} for upload in uploads
+            ]
+        else:
+            response_data['upload_url'] = uploads[0]['upload_url']
+        return Response(response_data, status=status.HTTP_201_CREATED)
+
+
+def finalize_upload(req, files: list, zones: list, client: str):
+    """
+    Общий последний шаг для загрузок мимо Django: проверка заголовков,
+    запись UploadedFile и постановка в очередь.
+
+    Args:
+        files: Список (имя в хранилище, исходное имя файла)
+        zones: Зона для каждого файла
+    """
+    video_infos = [
+        probe_video(generate_presigned_url(UPLOADED_STORAGE, name, 'get_object', PROBE_URL_EXPIRATION))
+        for name, uploaded_name in files
+    ]
+    corrupt = [(name, uploaded_name) for (name, uploaded_name), video_info in zip(files, video_infos)
+               if video_info is None]
+    if corrupt:
+        # Битые объекты удаляются сразу; по той же ссылке можно загрузить файл заново
+        for name, uploaded_name in corrupt:
+            UPLOADED_STORAGE.delete(name)
+        return Response({'error': 'Unsupported or corrupt video', 'files': [name for _, name in corrupt]},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    with transaction.atomic():
+        # Строка запроса заблокирована до конца транзакции: из двух одновременных
+        # finalize второй увидит уже созданные файлы и получит 409
+        req = Request.objects.select_for_update().get(id=req.id)
+        if UploadedFile.objects.filter(request=req).exists():
+            return Response({'error': 'Upload already finalized'}, status=status.HTTP_409_CONFLICT)
+        items = []
+        for (name, uploaded_name), zone, video_info in zip(files, zones, video_infos):
+            items.append((UploadedFile.create_from_storage(req, uploaded_name, name, video_info).id, zone))
+        PresignedUpload.objects.filter(request=req).delete()
+        req.reset_expiration_date()
+    # После коммита: воркер должен увидеть записи UploadedFile
+    submit_job(req, items, client)
+    return accepted_response(req)
+
+
+class FinalizeUploadAPIView(APIView):
+    def post(self, request, format=None):
+        try:
+            upload = signing.loads(
+                request.data.get('upload_token', ''), salt=UPLOAD_TOKEN_SALT, max_age=settings.UPLOAD_TOKEN_MAX_AGE,
+            )
+        except signing.BadSignature:
+            return Response({'error': 'Invalid or expired upload token'}, status=status.HTTP_400_BAD_REQUEST)
+
+        zones = get_zones(request.data, len(upload['files']))
+        if zones is None:
+            return Response({'error': 'No points provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            req = Request.get_request(upload['request_id'])
+        except ObjectDoesNotExist:
+            return Response({'error': 'Request not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        if UploadedFile.objects.filter(request=req).exists():
+            return Response({'error': 'Upload already finalized'}, status=status.HTTP_409_CONFLICT)
+        missing = [uploaded_name for name, uploaded_name in upload['files'] if not UPLOADED_STORAGE.exists(name)]
+        if missing:
+            return Response({'error': 'File was not uploaded', 'files': missing}, status=status.HTTP_400_BAD_REQUEST)
+
+        return finalize_upload(req, upload['files'], zones, get_client_id(request))
+
+
+def get_chunked_upload(upload_id):
+    try:
+        return ChunkedUpload.objects.get(id=upload_id)
+    except ObjectDoesNotExist:
+        return None
+
+
+class ChunkedUploadStartAPIView(APIView):
+    """
+    Возобновляемая загрузка: клиент объявляет имя и размер файла
+    и получает размер части, который нужно соблюдать.
+    """
+
+    def post(self, request, format=None):
+        filename = request.data.get('filename', '')
+        if not filename or not validate_file_extensions(ALLOWED_FILE_EXTENSIONS, filename):
+            return Response({'error': 'Unsupported file extension'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            size = -1
+        if size <= 0:
+            return Response({'error': 'File size is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        req = Request.create_request(get_camera(request.data))
+        req.update_expiration_date(timezone.timedelta(seconds=settings.UPLOAD_TOKEN_MAX_AGE))
+        upload = ChunkedUpload.start(req, filename, size)
+
+        response_data = upload.get_state(parts=[])
         response_data.update({
-            'status_url': f'/api/status/{str(req.id)}/'
+            'request_id': str(req.id),
+            'upload_url': f'/api/upload/chunked/{upload.id}/',
         })
-        
-        return Response(response_data, status=status.HTTP_202_ACCEPTED)
+        return Response(response_data, status=status.HTTP_201_CREATED)
+
+
+class ChunkedUploadAPIView(APIView):
+    def get(self, request, upload_id, format=None):
+        upload = get_chunked_upload(upload_id)
+        if upload is None:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(upload.get_state())
+
 
+class ChunkedUploadPartAPIView(APIView):
+    def put(self, request, upload_id, part_number, format=None):
+        upload = get_chunked_upload(upload_id)
+        if upload is None:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        # Тело части читается из потока напрямую: request.body ограничен DATA_UPLOAD_MAX_MEMORY_SIZE
+        data = request.stream.read(upload.chunk_size + 1) if request.stream is not None else b''
+        try:
+            etag = upload.upload_chunk(part_number, data, request.headers.get('Content-MD5'))
+        except ChunkError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'part': part_number, 'size': len(data), 'etag': etag})
+
+
+class ChunkedUploadFinalizeAPIView(APIView):
+    def post(self, request, upload_id, format=None):
+        upload = get_chunked_upload(upload_id)
+        if upload is None:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        points = parse_points(request.data.get('points', []))
+        if not points:
+            return Response({'error': 'No points provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+        req, uploaded_name = upload.request, upload.uploaded_name
+        try:
+            name = upload.complete()
+        except ChunkError as e:
+            return Response({'error': str(e), **upload.get_state()}, status=status.HTTP_409_CONFLICT)
+
+        return finalize_upload(req, [(name, uploaded_name)], [points], get_client_id(request))
+
+
+class RequestStatusAPIView(View):
+    async def get(self, request, request_id, format=None):
+        try:
+            payload = await Request.aget_cached_status(request_id)
+        except ObjectDoesNotExist:
+            return JsonResponse({'error': 'Request not found'}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            return JsonResponse({'status': 'pending', 'message': str(e)})
+        return JsonResponse(payload)
+
+
+def get_frame_range(params):
+    """(start, end) из параметров запроса или None; ValueError, если это не номера кадров"""
+    if not params.get('start') and not params.get('end'):
+        return None
+    return int(params.get('start', 0)), int(params.get('end', 2 ** 31))
+
+
+class DetectionsAPIView(APIView):
+    """
+    Покадровые детекции видео запроса (NDJSON в gzip-блоках). Файл отдает MinIO
+    по ссылке url или Django потоком по ссылке download; с параметрами start/end
+    (номера кадров) ответ содержит заголовок Range, который вернет только блоки
+    с этими кадрами.
+    """
 
-class RequestStatusAPIView(APIView):
     def get(self, request, request_id, format=None):
         try:
-            task = Request.get_request(request_id)
-            serializer = RequestSerializer(task)
-            response_data = serializer.data
-            
-            if task.status == 'done':
-                url = task.get_resulting_link()
-                timings = task.get_timings()
-                response_data.update({
-                    'status': 'ready',
-                    'link': f'{url}',
-                    'timings': timings,
-                })
-            else:
-                response_data.update({
-                    'status': 'processing',
-                })
-                
-            return Response(response_data)
+            req = Request.get_request(request_id)
         except ObjectDoesNotExist:
             return Response({'error': 'Request not found'}, status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
-            return Response({'status': 'pending', 'message': str(e)})
+        if req.status != RequestStatus.DONE:
+            return Response({'error': 'Task is not done'}, status=status.HTTP_409_CONFLICT)
+
+        try:
+            frame_range = get_frame_range(request.query_params)
+        except ValueError:
+            return Response({'error': 'start and end must be frame numbers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        files = []
+        for file in EditedFile.objects.filter(request=req).exclude(detections='').exclude(detections__isnull=True):
+            index = file.detections_index or []
+            item = {
+                'id': str(file.id),
+                'name': file.get_display_name(),
+                'fps': file.fps,
+                'frames': index[-1][1] + 1 if index else 0,
+                'url': file.get_detections_link(),
+                'download': reverse('api_detections_download', args=[req.id, file.id]),
+                'chunks': index,
+            }
+            if frame_range is not None:
+                item['range'] = get_byte_range(index, *frame_range)
+            files.append(item)
+        return Response({'format': DETECTIONS_FORMAT, 'files': files})
+
+
+def detections_download_view(request, request_id, file_id):
+    """
+    Выгрузка детекций одного видео потоком из хранилища: в памяти только текущий
+    кусок. С start/end отдаются только gzip-блоки с этими кадрами.
+    """
+    file = get_object_or_404(EditedFile, id=file_id, request_id=request_id)
+    if not file.detections:
+        return HttpResponseNotFound("404, Detections not found")
+    try:
+        frame_range = get_frame_range(request.GET)
+    except ValueError:
+        return JsonResponse({'error': 'start and end must be frame numbers'}, status=400)
+
+    byte_range = None
+    if frame_range is not None:
+        byte_range = get_byte_range(file.detections_index or [], *frame_range)
+        if byte_range is None:
+            return HttpResponse(status=204)
+
+    stream = file.open_detections_stream(byte_range)
+    response = StreamingHttpResponse(iter_stream(stream, settings.STREAM_CHUNK_SIZE), content_type='application/gzip')
+    name = os.path.basename(file.detections.name)
+    response['Content-Disposition'] = f'attachment; filename="{name}"'
+    return response
+
+
+async def _status_events(request_id):
+    """
+    Отправляет статус при каждом изменении, пока задача не завершится или не выйдет таймаут.
+    Асинхронный генератор: ожидание между опросами не занимает поток воркера.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.STATUS_STREAM_TIMEOUT
+    last_payload = None
+    last_sent = loop.time()
+    while loop.time() < deadline:
+        try:
+            payload = await Request.aget_cached_status(request_id)
+        except (ObjectDoesNotExist, DjangoValidationError):
+            yield f"event: not_found\ndata: {json.dumps({'error': 'Request not found'})}\n\n"
+            return
+
+        data = json.dumps(payload, cls=DjangoJSONEncoder)
+        if data != last_payload:
+            yield f"data: {data}\n\n"
+            last_payload = data
+            last_sent = loop.time()
+            if payload['status'] in FINAL_STATUSES:
+                # Последнее событие: дальше статус не изменится, клиент закрывает поток
+                return
+        elif loop.time() - last_sent > 15:
+            # Комментарий-пинг, чтобы прокси не закрыли простаивающее соединение
+            yield ": ping\n\n"
+            last_sent = loop.time()
+
+        await asyncio.sleep(settings.STATUS_STREAM_POLL_INTERVAL)
+
+
+async def request_status_events_view(request, request_id):
+    response = StreamingHttpResponse(_status_events(request_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class DangerEventPagination(CursorPagination):
+    # Курсор вместо номера страницы: выборка идет по индексу и не замедляется к концу
+    ordering = ('-time_recorded', '-id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class DangerEventListAPIView(ListAPIView):
+    """
+    События опасности по всем запросам. Фильтры: camera, level (не ниже),
+    request, time_from/time_to (ISO 8601, по времени постановки запроса).
+    """
+    serializer_class = DangerEventSerializer
+    pagination_class = DangerEventPagination
+
+    def get_queryset(self):
+        params = self.request.query_params
+        events = DangerEvent.objects.all()
+        if params.get('camera'):
+            events = events.filter(camera=params['camera'])
+        if params.get('request'):
+            try:
+                events = events.filter(request_id=uuid.UUID(params['request']))
+            except ValueError:
+                raise ValidationError({'request': 'Expected UUID'})
+        if params.get('level'):
+            try:
+                events = events.filter(level__gte=int(params['level']))
+            except ValueError:
+                raise ValidationError({'level': 'Expected integer'})
+        for param, lookup in (('time_from', 'time_recorded__gte'), ('time_to', 'time_recorded__lt')):
+            if params.get(param):
+                value = parse_datetime(params[param])
+                if value is None:
+                    raise ValidationError({param: 'Expected ISO 8601 datetime'})
+                events = events.filter(**{lookup: value})
+        return events
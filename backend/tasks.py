@@ -1,59 +1,144 @@
-from file_requests.models import Request, UploadedFile, EditedFile
+from file_requests.models import Request, UploadedFile, EditedFile, DangerEvent, ProcessingStage, JobState, RESULT_STORAGE
+from file_requests import scheduler
+from file_requests.storage_backends import S3MultipartWriter
+from file_requests.progress import ProgressReporter
+from file_requests.metrics import JobMetrics
+from file_requests.detection import detect_cars, detect_car_wheels, share_model, FrameDetector, WHEEL_ROI
+from file_requests.frame_ring import run_ring_pipeline
+from file_requests.danger_events import DangerEventCollector
+from file_requests.detections_export import DetectionsEncoder, iter_stream
+from file_requests.checkpoints import JobCheckpoint
+from file_requests.tracking import JobTracker
+from file_requests.inference_server import get_inference_client, RemoteModel
 from time import sleep
 from file_requests.cutom_image_handler import ImageHandler
 from file_requests.frames_to_times import *
-from file_requests.align import restore_missing_cars_with_interpolation
+from file_requests.align import StreamingAligner
 
+import bisect
+import contextlib
+import shutil
+import sys
+import threading
 import zipfile
-from io import BytesIO
+from collections import deque
+from time import perf_counter, monotonic
 
+from django.conf import settings
 from django.utils import timezone
 
 from backend.celery import app
+from celery.signals import worker_process_init
+from billiard.process import current_process
 
 from ultralytics import YOLO
 import numpy as np
 import cv2
+import os
 import tempfile
+import torch
 
 from file_requests.geometry import Point, Polygon, Car
 
-WHEEL_MODEL_PATH = "../ml/models/wheels_yolov11.pt"
-
-print("типа начали загружаться модели................")
-car_model = YOLO('yolov8n.pt') 
-wheel_model = YOLO(WHEEL_MODEL_PATH)
-print("типа загрузились модели....................")
-
-
-def detect_wheels(car_crop, frame, wheel_model, x1, x2, y1, y2):
-    wheel_results = wheel_model.predict(car_crop, verbose=False, conf=0.25)
-                
-    wheels_list = []
-    
-    for w_result in wheel_results:
-        w_boxes = w_result.boxes.xyxy.cpu().numpy()
-        
-        for w_box in w_boxes:
-            wx1, wy1, wx2, wy2 = map(int, w_box)
-            
-            global_wx1 = x1 + wx1
-            global_wy1 = y1 + wy1
-            global_wx2 = x1 + wx2
-            global_wy2 = y1 + wy2
-            
-            wheels_list.append([global_wx1, global_wy1, global_wx2, global_wy2])
-
-            # Рисуем колеса (зеленым)
-            # cv2.rectangle(frame, (global_wx1, global_wy1), (global_wx2, global_wy2), (0, 255, 0), 2)
-    
-    return wheels_list
-
-
-def process_video_traffic(input_video_path, output_video_path):
-
-    # Классы COCO, относящиеся к транспорту (2: car, 5: bus, 7: truck)
-    vehicle_classes = [2, 5, 7] 
+# Что получает пользователь: все видео с разметкой, только моменты опасности
+# одним видео или по клипу на каждое событие (архивом)
+OUTPUT_FULL = 'full'
+OUTPUT_HIGHLIGHTS = 'highlights'
+OUTPUT_CLIPS = 'clips'
+
+CAR_MODEL_PATH = settings.CAR_MODEL_PATH
+WHEEL_MODEL_PATH = settings.WHEEL_MODEL_PATH
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_models():
+    """Загружает модели при первом обращении, чтобы импорт tasks не требовал весов"""
+    with _models_lock:
+        if not _models:
+            print("типа начали загружаться модели................")
+            _models['car'] = YOLO(CAR_MODEL_PATH)
+            _models['wheel'] = YOLO(WHEEL_MODEL_PATH)
+            print("типа загрузились модели....................")
+    return _models['car'], _models['wheel']
+
+
+def get_job_models():
+    """Модели для одной задачи: веса общие на процесс, предикторы свои (задачи могут идти в потоках)"""
+    if settings.INFERENCE_SERVER_SOCKET:
+        # Кадры всех задач машины уходят на общий сервер и считаются там пачками
+        client = get_inference_client(settings.INFERENCE_SERVER_SOCKET)
+        return RemoteModel(client, 'car'), RemoteModel(client, 'wheel')
+    car_model, wheel_model = get_models()
+    return share_model(car_model), share_model(wheel_model)
+
+
+def configure_threads():
+    """Делит ядра между процессами воркера, чтобы torch и OpenCV не конкурировали за них"""
+    cpu_count = os.cpu_count() or 1
+    threads = settings.INFERENCE_THREADS or max(cpu_count // settings.CELERY_CONCURRENCY_COUNT, 1)
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+
+    index = getattr(current_process(), 'index', None)
+    if settings.INFERENCE_PIN_CPUS and index is not None and hasattr(os, 'sched_setaffinity'):
+        first = (index * threads) % cpu_count
+        os.sched_setaffinity(0, {(first + i) % cpu_count for i in range(threads)})
+    print(f"процесс {index}: потоков {threads}")
+
+
+@worker_process_init.connect
+def warm_up_models(**kwargs):
+    """Загружает модели один раз на дочерний процесс и прогоняет пустой кадр"""
+    if not settings.PRELOAD_MODELS or settings.INFERENCE_SERVER_SOCKET:
+        return
+    configure_threads()
+    car_model, wheel_model = get_models()
+    dummy_frame = np.zeros((640, 640, 3), dtype=np.uint8)
+    car_model.predict(dummy_frame, verbose=False)
+    wheel_model.predict(dummy_frame, verbose=False)
+    print("типа прогрели модели....................")
+
+
+def make_car(x1, y1, x2, y2, wheels_list, track_id):
+    wheels_list_flatten = []
+    for xx1, yy1, xx2, yy2 in wheels_list:
+        wheels_list_flatten.append(Polygon.from_rectangle(Point(xx1, yy1), abs(xx1 - xx2), abs(yy1 - yy2)))
+
+    if wheels_list_flatten:
+        return Car(wheels=wheels_list_flatten, bounding_box=Polygon.from_rectangle(Point(x1, y1), abs(x1 - x2), abs(y1 - y2)), id=int(track_id))
+    return Car(wheels=None, bounding_box=Polygon.from_rectangle(Point(x1, y1), abs(x1 - x2), abs(y1 - y2)), id=int(track_id))
+
+
+def get_wheel_region(danger_zone, width, height):
+    """Прямоугольник вокруг опасной зоны с отступом: колеса вне него на опасность не влияют"""
+    if danger_zone is None or settings.WHEEL_STRATEGY != WHEEL_ROI:
+        return None
+    padding = settings.WHEEL_ROI_PADDING
+    xs = [point.x for point in danger_zone.points]
+    ys = [point.y for point in danger_zone.points]
+    return (
+        max(int(min(xs)) - padding, 0), max(int(min(ys)) - padding, 0),
+        min(int(max(xs)) + padding, width), min(int(max(ys)) + padding, height),
+    )
+
+
+def process_video_traffic(input_video_path, output_video_path, progress=None, metrics=None,
+                          car_model=None, wheel_model=None, frames_total=None, danger_zone=None, checkpoint=None,
+                          sink=None):
+    """
+    Args:
+        checkpoint: JobCheckpoint; состояние периодически сохраняется в него,
+            а если там уже есть сохраненное, обработка продолжается с него
+        sink: Получает детекции каждого кадра по порядку, включая кадры из чекпоинта;
+            сама функция кадры не копит
+
+    Returns:
+        Число кадров видео
+    """
+    if car_model is None or wheel_model is None:
+        car_model, wheel_model = get_job_models()
 
     cap = cv2.VideoCapture(input_video_path)
     if not cap.isOpened():
@@ -62,137 +147,480 @@ def process_video_traffic(input_video_path, output_video_path):
 
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
 
-    out = cv2.VideoWriter(output_video_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    if progress is not None:
+        # frames_total прочитан из заголовка при загрузке; без него спрашиваем сам файл
+        progress.start_stage(ProcessingStage.TRACKING, frames_total or cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if metrics is None:
+        metrics = JobMetrics()
 
     frame_count = 0
-    frames_data = []
+    wheel_region = get_wheel_region(danger_zone, width, height)
+    # Трекер свой у каждой задачи: model.track(persist=True) хранил его внутри общей модели
+    tracker = JobTracker()
+
+    state = checkpoint.load() if checkpoint is not None else None
+    if state is not None:
+        frame_count, tracker = state['frame'], state['tracker']
+        if sink is not None:
+            for frame_data in checkpoint.iter_frames(state):
+                sink(frame_data)
+        # grab() не переводит кадры в BGR, и в отличие от seek по CAP_PROP_POS_FRAMES точен для любого кодека
+        for _ in range(frame_count):
+            cap.grab()
+        print(f"Продолжаем с кадра {frame_count} по чекпоинту")
+        if progress is not None:
+            progress.advance(frame_count)
 
     while True:
+        frame_start = perf_counter()
         ret, frame = cap.read()
         if not ret:
             break
+        metrics.observe('decode', perf_counter() - frame_start)
         
         frame_count += 1
         
         frame_data = []
 
-        results = car_model.track(frame, persist=True, classes=vehicle_classes, verbose=False)
-        
-        if results[0].boxes.id is not None:
-            boxes = results[0].boxes.xyxy.cpu().numpy()
-            track_ids = results[0].boxes.id.int().cpu().numpy()
-            
-            for box, track_id in zip(boxes, track_ids):
-                x1, y1, x2, y2 = map(int, box)
-                
-                x1, y1 = max(0, x1), max(0, y1)
-                x2, y2 = min(width, x2), min(height, y2)
-
-                car_crop = frame[y1:y2, x1:x2]
-                if car_crop.size == 0:
-                    continue
-
-                wheels_list = detect_wheels(car_crop, frame, wheel_model, x1, x2, y1, y2)
-                wheels_list_flatten = []
-                for xx1, yy1, xx2, yy2 in wheels_list:
-                    wheels_list_flatten.append(Polygon.from_rectangle(Point(xx1, yy1), abs(xx1 - xx2), abs(yy1 - yy2)))
-
-                if wheels_list_flatten:
-                    car_info = Car(wheels=wheels_list_flatten, bounding_box=Polygon.from_rectangle(Point(x1, y1), abs(x1 - x2), abs(y1 - y2)), id=int(track_id))
-                else:
-                    car_info = Car(wheels=None, bounding_box=Polygon.from_rectangle(Point(x1, y1), abs(x1 - x2), abs(y1 - y2)), id=int(track_id))
-
-                frame_data.append(car_info)
-                
-
-                # cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 2)
-                # cv2.putText(frame, f"ID: {track_id}", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
+        detections, seconds = detect_cars(frame, car_model)
+        metrics.observe('car_detection', seconds)
+
+        model_start = perf_counter()
+        tracks = tracker.update(detections, frame)
+        metrics.observe('car_tracking', perf_counter() - model_start)
+
+        tracked = []
+        for track_id, box, _ in tracks:
+            x1, y1, x2, y2 = map(int, box)
+
+            x1, y1 = max(0, x1), max(0, y1)
+            x2, y2 = min(width, x2), min(height, y2)
+
+            if x2 <= x1 or y2 <= y1:
+                continue
+            tracked.append((track_id, (x1, y1, x2, y2)))
+
+        model_start = perf_counter()
+        wheels = detect_car_wheels(frame, [box for _, box in tracked], wheel_model,
+                                   settings.WHEEL_STRATEGY, wheel_region)
+        metrics.observe('wheel_detection', perf_counter() - model_start)
+
+        for (track_id, (x1, y1, x2, y2)), wheels_list in zip(tracked, wheels):
+            frame_data.append(make_car(x1, y1, x2, y2, wheels_list, track_id))
+
+            # cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 2)
+            # cv2.putText(frame, f"ID: {track_id}", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
 
         print(f"Кадр {frame_count}: Обнаружено {len(frame_data)} машин.")
-        frames_data.append(frame_data)
-        # out.write(frame)
+        if sink is not None:
+            sink(frame_data)
+        metrics.frames += 1
+        metrics.observe('frame', perf_counter() - frame_start)
+        if progress is not None:
+            progress.advance()
+        if checkpoint is not None:
+            checkpoint.record(frame_data)
+            if checkpoint.due():
+                with metrics.stage('checkpoint'):
+                    checkpoint.save({'frame': frame_count, 'tracker': tracker})
 
     cap.release()
-    # out.release()
     cv2.destroyAllWindows()
-    return frames_data
+    return frame_count
+
+def get_inference_threads(processes: int) -> int:
+    return settings.INFERENCE_THREADS or max((os.cpu_count() or 1) // processes, 1)
+
+
+def process_video_traffic_parallel(input_video_path, output_video_path, progress=None, metrics=None,
+                                   frames_total=None, processes=None, danger_zone=None, checkpoint=None, sink=None):
+    """
+    То же, что process_video_traffic, но детекция машин и колес идет в нескольких
+    процессах: кадры передаются через кольцевой буфер в разделяемой памяти
+    (file_requests.frame_ring), а трекинг по порядку кадров остается здесь.
+    Чекпоинт тот же, что у process_video_traffic, поэтому повтор задачи может
+    продолжить работу любого из двух вариантов.
+    """
+    processes = processes or settings.INFERENCE_PROCESSES
+    if metrics is None:
+        metrics = JobMetrics()
 
-def draw_rectangles(aligned_frames_data, input_video_path, output_video_path, danger_zone):
     cap = cv2.VideoCapture(input_video_path)
     if not cap.isOpened():
         print("Ошибка открытия видео")
         return
-
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    frame_count = 0
-    danger_frames = []
+    if progress is not None:
+        progress.start_stage(ProcessingStage.TRACKING, frames_total or cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
 
-    out = cv2.VideoWriter(output_video_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    tracker = JobTracker()
+    start_frame = 0
+    state = checkpoint.load() if checkpoint is not None else None
+    if state is not None:
+        start_frame, tracker = state['frame'], state['tracker']
+        if sink is not None:
+            for frame_data in checkpoint.iter_frames(state):
+                sink(frame_data)
+        print(f"Продолжаем с кадра {start_frame} по чекпоинту")
+        if progress is not None:
+            progress.advance(start_frame)
+    last_frame = [perf_counter()]
+
+    def on_frame(frame_index, frame, detections, timings):
+        for name, seconds in timings.items():
+            metrics.observe(name, seconds)
+
+        tracking_start = perf_counter()
+        tracks = tracker.update(detections, frame)
+        metrics.observe('car_tracking', perf_counter() - tracking_start)
 
-    while True:
-        ret, frame = cap.read()
+        frame_data = []
+        for track_id, box, detection_index in tracks:
+            x1, y1, x2, y2 = map(int, box)
+            x1, y1 = max(0, x1), max(0, y1)
+            x2, y2 = min(width, x2), min(height, y2)
+            if x2 <= x1 or y2 <= y1:
+                continue
+            wheels_list = detections[detection_index][6] if detection_index is not None else []
+            frame_data.append(make_car(x1, y1, x2, y2, wheels_list, track_id))
+
+        if sink is not None:
+            sink(frame_data)
+        metrics.frames += 1
+        # Кадры выходят из конвейера потоком, поэтому "кадр" — интервал между соседними
+        now = perf_counter()
+        metrics.observe('frame', now - last_frame[0])
+        last_frame[0] = now
+        if progress is not None:
+            progress.advance()
+        if checkpoint is not None:
+            checkpoint.record(frame_data)
+            if checkpoint.due():
+                with metrics.stage('checkpoint'):
+                    checkpoint.save({'frame': frame_index + 1, 'tracker': tracker})
+
+    detector = FrameDetector(
+        CAR_MODEL_PATH, WHEEL_MODEL_PATH, threads=get_inference_threads(processes),
+        wheel_strategy=settings.WHEEL_STRATEGY, wheel_region=get_wheel_region(danger_zone, width, height),
+    )
+    return run_ring_pipeline(
+        input_video_path, (height, width, 3), detector, on_frame,
+        workers=processes, slots=settings.FRAME_RING_SLOTS or None, start_frame=start_frame,
+    )
+
+
+def annotate_frame(frame, cars, danger_zone, frame_count) -> bool:
+    """Рисует машины и колеса на кадре; True, если на кадре есть машина в опасной зоне"""
+    danger = False
+    for car in cars:
+        danger_level =  car.get_danger_level(danger_zone)
+        x1, y1, x2, y2 = car.bounding_box.points[0].x, car.bounding_box.points[0].y, car.bounding_box.points[2].x, car.bounding_box.points[2].y
+        if car.wheels:
+            for wheel in car.wheels:
+                xx1, yy1, xx2, yy2 = wheel.points[0].x, wheel.points[0].y, wheel.points[2].x, wheel.points[2].y
+                cv2.rectangle(frame, (xx1, yy1), (xx2, yy2), (255, 0, 0), 2)
+        if danger_level == 2:
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
+            print("redd", frame_count)
+            danger = True
+        elif danger_level == 1:
+            print("yelow", frame_count)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 255), 2)
+        else:
+            print("green", frame_count)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+    return danger
+
+
+class StreamingRenderer:
+    """
+    Рисует выровненные кадры по мере их выхода из выравнивателя: исходное видео
+    читается своим VideoCapture в такт кадрам, и в памяти держатся только
+    детекции кадров, для которых еще не ясно, попадут ли они в результат.
+
+    Args:
+        output_mode: OUTPUT_FULL — все видео; OUTPUT_HIGHLIGHTS — только кадры не дальше
+            OUTPUT_CLIP_PADDING от опасных, одним видео; OUTPUT_CLIPS — zip с клипом
+            на каждый такой отрезок. Отрезки те же, что дает get_clip_ranges
+    """
+
+    def __init__(self, input_video_path, output_path, danger_zone, output_mode=OUTPUT_FULL):
+        self.cap = cv2.VideoCapture(input_video_path)
+        self.output_path = output_path
+        self.danger_zone = danger_zone
+        self.output_mode = output_mode
+        self.size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        # Кадр попадает в клип, если опасный кадр не дальше padding; решение ждет padding следующих кадров
+        self.padding = 0 if output_mode == OUTPUT_FULL else round(settings.OUTPUT_CLIP_PADDING * self.fps)
+        self.danger_frames = []
+        self._pending = deque()
+        self._received = 0
+        self._first_cars = None
+        self._out = None
+        self._written = 0
+        self._clips_dir = tempfile.mkdtemp() if output_mode == OUTPUT_CLIPS else None
+        self._clip_paths = []
+
+    def push(self, cars):
+        """Выровненные машины очередного кадра"""
+        frame_index = self._received
+        self._received += 1
+        if frame_index == 0:
+            self._first_cars = cars
+        if any(car.get_danger_level(self.danger_zone) == 2 for car in cars):
+            self.danger_frames.append(frame_index)
+        self._pending.append((frame_index, cars))
+        while self._pending and self._pending[0][0] + self.padding <= frame_index:
+            self._render(*self._pending.popleft())
+
+    def close(self) -> list:
+        """Конец видео: дорисовывает оставшиеся кадры и собирает результат; возвращает опасные кадры"""
+        try:
+            while self._pending:
+                self._render(*self._pending.popleft())
+            if self.output_mode == OUTPUT_HIGHLIGHTS and not self._written and self._first_cars is not None:
+                # Без событий оставляем первый кадр, чтобы результат был открываемым видео
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                self._render_frame(0, self._first_cars)
+            self._close_writer()
+            if self.output_mode == OUTPUT_CLIPS:
+                # mp4 уже сжат, поэтому ZIP_STORED
+                with zipfile.ZipFile(self.output_path, 'w', compression=zipfile.ZIP_STORED) as archive:
+                    for path in self._clip_paths:
+                        archive.write(path, os.path.basename(path))
+        finally:
+            self.release()
+        return self.danger_frames
+
+    def release(self):
+        """Освобождает видео и временные клипы; close вызывает сам, при ошибке — вызывающий код"""
+        self._close_writer()
+        self.cap.release()
+        if self._clips_dir is not None:
+            shutil.rmtree(self._clips_dir, ignore_errors=True)
+            self._clips_dir = None
+
+    def _in_output(self, frame_index) -> bool:
+        if self.output_mode == OUTPUT_FULL:
+            return True
+        position = bisect.bisect_left(self.danger_frames, frame_index - self.padding)
+        return position < len(self.danger_frames) and self.danger_frames[position] <= frame_index + self.padding
+
+    def _render(self, frame_index, cars):
+        if self._in_output(frame_index):
+            self._render_frame(frame_index, cars)
+            return
+        # grab() не переводит пропущенный кадр в BGR
+        self.cap.grab()
+        if self.output_mode == OUTPUT_CLIPS:
+            self._close_writer()
+
+    def _render_frame(self, frame_index, cars):
+        ret, frame = self.cap.read()
         if not ret:
-            break
-        
-        for car in aligned_frames_data[frame_count]:
-            danger_level =  car.get_danger_level(danger_zone)
-            x1, y1, x2, y2 = car.bounding_box.points[0].x, car.bounding_box.points[0].y, car.bounding_box.points[2].x, car.bounding_box.points[2].y
-            if car.wheels:
-                for wheel in car.wheels:
-                    xx1, yy1, xx2, yy2 = wheel.points[0].x, wheel.points[0].y, wheel.points[2].x, wheel.points[2].y
-                    cv2.rectangle(frame, (xx1, yy1), (xx2, yy2), (255, 0, 0), 2)
-            if danger_level == 2:
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
-                print("redd", frame_count)
-                danger_frames.append(frame_count)
-            elif danger_level == 1:
-                print("yelow", frame_count)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 255), 2)
-            else:
-                print("green", frame_count)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-        frame_count += 1
-        out.write(frame)
+            return
+        annotate_frame(frame, cars, self.danger_zone, frame_index)
+        if self._out is None:
+            self._out = cv2.VideoWriter(self._next_output_path(), cv2.VideoWriter_fourcc(*'mp4v'), self.fps, self.size)
+        self._out.write(frame)
+        self._written += 1
+
+    def _next_output_path(self) -> str:
+        if self.output_mode != OUTPUT_CLIPS:
+            return self.output_path
+        path = os.path.join(self._clips_dir, f"event_{len(self._clip_paths) + 1:03d}.mp4")
+        self._clip_paths.append(path)
+        return path
+
+    def _close_writer(self):
+        if self._out is not None:
+            self._out.release()
+            self._out = None
 
-    return danger_frames
 
+def draw_rectangles(aligned_frames_data, input_video_path, output_video_path, danger_zone):
+    """Отрисовка уже собранных кадров (бенчмарк этапов); пайплайн пишет кадры в StreamingRenderer сам"""
+    renderer = StreamingRenderer(input_video_path, output_video_path, danger_zone)
+    for cars in aligned_frames_data:
+        renderer.push(cars)
+    return renderer.close()
+
+
+def get_clip_ranges(intervals, padding: int, frames_total: int) -> list:
+    """Интервалы опасности с отступом padding кадров; пересекшиеся клипы склеиваются"""
+    ranges = []
+    for start, end in intervals:
+        start, end = max(start - padding, 0), min(end + padding, frames_total - 1)
+        if ranges and start <= ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def get_output_extension(output_mode: str) -> str:
+    return '.zip' if output_mode == OUTPUT_CLIPS else '.mp4'
+
+
+def get_output_name(uploaded_name: str, output_mode: str) -> str:
+    """Имя результата в архиве пачки"""
+    if output_mode == OUTPUT_FULL:
+        return uploaded_name
+    return f"{os.path.splitext(uploaded_name)[0]}_{output_mode}{get_output_extension(output_mode)}"
+
+
+class PipelineResult:
+    def __init__(self, detections_per_frame, danger_frames, intervals, danger_events, fps, detections_index=None):
+        self.detections_per_frame = detections_per_frame
+        self.frames = len(detections_per_frame)
+        self.danger_frames = danger_frames
+        self.intervals = intervals
+        self.danger_events = danger_events
+        self.fps = fps
+        self.detections_index = detections_index
+
+
+def run_pipeline(input_video_path, output_video_path, danger_zone, progress=None, metrics=None,
+                 car_model=None, wheel_model=None, frames_total=None, output_mode=OUTPUT_FULL, checkpoint=None,
+                 detections_path=None):
+    """
+    Детекция, выравнивание и отрисовка над локальными файлами, без Celery и хранилища.
+    Кадры идут потоком: детекции каждого кадра сразу уходят в выравниватель, а выровненные
+    кадры из него — в отрисовку, выгрузку и события, так что детекции всего видео не копятся.
+
+    Args:
+        output_mode: OUTPUT_FULL — все видео; OUTPUT_HIGHLIGHTS — только интервалы
+            опасности с отступом одним видео; OUTPUT_CLIPS — zip с клипом на каждый интервал
+        detections_path: Файл для выгрузки детекций (detections_export); None — не выгружать
+    """
+    if metrics is None:
+        metrics = JobMetrics()
 
-@app.task
-def task_process_video(file_id, points):
+    cap = cv2.VideoCapture(input_video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    # Пропуски длиннее ALIGN_MAX_GAP секунд не заполняются; 0 — заполняются все, как раньше,
+    # но тогда окно выравнивателя — все видео
+    max_gap = round(settings.ALIGN_MAX_GAP * fps) if settings.ALIGN_MAX_GAP > 0 else sys.maxsize
+    aligner = StreamingAligner(max_gap)
+    renderer = StreamingRenderer(input_video_path, output_video_path, danger_zone, output_mode)
+    events = DangerEventCollector(danger_zone, fps, max_gap=round(settings.DANGER_EVENT_MAX_GAP * fps))
+    encoder = DetectionsEncoder(danger_zone, fps, settings.DETECTIONS_CHUNK_FRAMES)
+    detections_file = open(detections_path, 'wb') if detections_path else None
+    detections_per_frame = []
+
+    def consume(pairs):
+        for detected, cars in pairs:
+            start = perf_counter()
+            renderer.push(cars)
+            metrics.observe('rendering', perf_counter() - start)
+            if detections_file is not None:
+                block = encoder.push(cars, detected)
+                if block is not None:
+                    detections_file.write(block)
+
+    def sink(frame_data):
+        detections_per_frame.append(len(frame_data))
+        events.push(frame_data)
+        start = perf_counter()
+        pairs = aligner.push_pairs(frame_data)
+        metrics.observe('alignment', perf_counter() - start)
+        consume(pairs)
+
+    # Параллельная детекция только с настоящими моделями: стабы из бенчмарка не передать в другие процессы
+    parallel = settings.INFERENCE_PROCESSES > 1 and car_model is None and wheel_model is None
+    try:
+        # Выравнивание и отрисовка идут внутри детекции и в ее время входят
+        with metrics.stage('detection'):
+            if parallel:
+                process_video_traffic_parallel(
+                    input_video_path, output_video_path, progress=progress, metrics=metrics, frames_total=frames_total,
+                    danger_zone=danger_zone, checkpoint=checkpoint, sink=sink,
+                )
+            else:
+                process_video_traffic(
+                    input_video_path=input_video_path,
+                    output_video_path=output_video_path,
+                    progress=progress,
+                    metrics=metrics,
+                    car_model=car_model,
+                    wheel_model=wheel_model,
+                    frames_total=frames_total,
+                    danger_zone=danger_zone,
+                    checkpoint=checkpoint,
+                    sink=sink,
+                )
+            consume(aligner.flush_pairs())
+            danger_frames = renderer.close()
+            if detections_file is not None:
+                block = encoder.flush()
+                if block is not None:
+                    detections_file.write(block)
+    finally:
+        renderer.release()
+        if detections_file is not None:
+            detections_file.close()
+
+    return PipelineResult(detections_per_frame, danger_frames, danger_frames_to_intervals(danger_frames),
+                          events.finish(), fps, encoder.index if detections_path else None)
+
+
+def delete_checkpoint(checkpoint):
+    try:
+        checkpoint.delete()
+    except Exception as e:
+        print(f"Не удалось удалить чекпоинт {checkpoint.name}: {e}")
+
+
+# acks_late + reject_on_worker_lost: если воркер умер посреди видео, сообщение
+# вернется в очередь, и повтор продолжит с последнего чекпоинта.
+# Мягкий предел — обычная ошибка задачи (повтор с чекпоинта), жесткий ограничивает
+# попытку, чтобы она успела закончиться до visibility_timeout брокера
+@app.task(bind=True, acks_late=True, reject_on_worker_lost=True, max_retries=settings.TASK_MAX_RETRIES,
+          soft_time_limit=settings.TASK_TIME_LIMIT, time_limit=settings.TASK_TIME_LIMIT + 60)
+def task_process_video(self, file_id, points, finalize=True):
+    """
+    Обрабатывает одно видео.
+
+    Args:
+        finalize: Для одиночного видео сразу выкладывает результат в запрос;
+            в пачке (False) только сохраняет EditedFile, итог соберет task_to_zip
+    """
+    checkpoint = JobCheckpoint(file_id)
     try:
         danger_zone = Polygon(list(Point(p[0], p[1]) for p in points))
         print(danger_zone)
 
         video = UploadedFile.get_by_id(file_id)
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tfile:
-            tfile.write(video.get_file_data()) # Используем ваш метод чтения байтов
-            temp_input_path = tfile.name
+        video.request.update_status_processing()
+        # Видео пачки идут параллельно, покадровый прогресс у них общий запрос бы перетирал
+        progress = ProgressReporter(video.request) if finalize else None
+        metrics = JobMetrics()
+        if progress is not None:
+            progress.start_stage(ProcessingStage.DOWNLOADING)
+
+        with metrics.stage('download'):
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tfile:
+                tfile.write(video.get_file_data()) # Используем ваш метод чтения байтов
+                temp_input_path = tfile.name
 
         print("сохранили видео, путь: ", temp_input_path)
 
         with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as out_tfile:
             temp_output_path = out_tfile.name
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".ndjson.gz") as detections_tfile:
+            temp_detections_path = detections_tfile.name
 
         # print("путь для выходного видео: ", temp_output_path)
 
-        frames_data = process_video_traffic(
-            input_video_path=temp_input_path, 
-            output_video_path=temp_output_path
-        )
-
-        print(frames_data[0:50])
-
-        aligned_frames_data = restore_missing_cars_with_interpolation(frames_data)
-        print(aligned_frames_data[0:50])
-
-        danger_frames = draw_rectangles(frames_data, temp_input_path, temp_output_path, danger_zone)
-        with open(temp_output_path, 'rb') as processed_f:
-            processed_video_bytes = processed_f.read()
+        output_mode = settings.OUTPUT_MODE
+        result = run_pipeline(temp_input_path, temp_output_path, danger_zone, progress=progress, metrics=metrics,
+                              frames_total=video.frame_count, output_mode=output_mode, checkpoint=checkpoint,
+                              detections_path=temp_detections_path)
 
         # edited_image = image_handler.edit(image.get_file_data())
 
@@ -201,58 +629,135 @@ def task_process_video(file_id, points):
         print(type(video))
         print("типа обработалось видео")
 
-        file = EditedFile.create_file(video.request, video.uploaded_name, processed_video_bytes)
-
-        example_intervals = [(1, 40), (100, 120)]
-        fancy_intervals = frame_intervals_to_string(example_intervals, file)
+        if progress is not None:
+            progress.start_stage(ProcessingStage.UPLOADING)
+        with metrics.stage('upload'):
+            with open(temp_output_path, 'rb') as processed_f:
+                processed_video_bytes = processed_f.read()
+            # Результаты пишутся под id исходного видео, поэтому повтор задачи их заменяет
+            file = EditedFile.create_file(
+                video.request, get_output_name(video.uploaded_name, output_mode), processed_video_bytes, id=video.id,
+            )
+
+            fancy_intervals = frame_intervals_to_string(result.intervals, result.fps)
+            DangerEvent.replace(video, result.danger_events)
+
+            # Выгрузка уже записана пайплайном на диск, в хранилище она уходит кусками
+            blocks = iter_stream(open(temp_detections_path, 'rb'), settings.STREAM_CHUNK_SIZE)
+            file.write_detections(os.path.splitext(video.uploaded_name)[0] + '.ndjson.gz', blocks,
+                                  result.detections_index, result.fps)
+            os.remove(temp_detections_path)
+
+            if finalize:
+                file.request.update_file(str(file.request.id) + get_output_extension(output_mode), file.get_file_data())
+
+        delete_checkpoint(checkpoint)
+        if not finalize:
+            file.update_timings(fancy_intervals)
+            file.request.advance_batch()
+            return file.id, True
 
-        file.request.update_file(str(file.request.id) + '.mp4', file.get_file_data())
         file.request.update_timings(fancy_intervals)
+        file.request.update_metrics(metrics.summary(queue_wait=video.request.get_queue_wait()))
         file.request.update_status_done()
 
     except Exception as e:
         print(e)
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=settings.TASK_RETRY_DELAY)
+        delete_checkpoint(checkpoint)
+        try:
+            request = UploadedFile.get_by_id(file_id).request
+            if finalize:
+                # Иначе запрос навсегда остался бы в ожидании
+                request.update_status_failed(str(e))
+                scheduler.finish_job(request.id)
+            else:
+                request.advance_batch()
+        except Exception as e:
+            print(e)
         return file_id, False
+    scheduler.finish_job(file.request.id)
     return file.id, True
         
 
 @app.task
 def task_to_zip(file_ids):
-    example_id = None
-
-    buffer_archive = BytesIO()
-    with zipfile.ZipFile(buffer_archive, 'w') as archive:
-        for file_id, is_edited in file_ids:
-            if not is_edited:
-                continue
-
-            example_id = file_id
-            file = EditedFile.get_by_id(file_id)
-            buffer_file = file.get_file_data()
-            archive.writestr(file.file.name, buffer_file)
-    buffer_archive.seek(0)
+    """
+    Собирает результаты пачки в один архив. Видео, которые не удалось
+    обработать, попадают в failed_files запроса и не роняют всю пачку.
+    """
+    edited_files = [EditedFile.get_by_id(file_id) for file_id, is_edited in file_ids if is_edited]
 
-    if example_id is None:
+    if not edited_files:
         request = UploadedFile.get_by_id(file_ids[0][0]).request
         request.delete()
+        scheduler.dispatch()
         return False
 
-    file_example = EditedFile.get_by_id(example_id)
-    
-    file_example.request.update_file(str(file_example.request.id) + '.zip', buffer_archive.getvalue())
-    file_example.request.update_status_done()
-    
-    file_example.request.update_expiration_date()
+    failed_files = []
+    for file_id, is_edited in file_ids:
+        if is_edited:
+            continue
+        try:
+            failed_files.append(UploadedFile.get_by_id(file_id).uploaded_name)
+        except UploadedFile.DoesNotExist:
+            failed_files.append(str(file_id))
+
+    request = edited_files[0].request
+    try:
+        name = RESULT_STORAGE.get_available_name(str(request.id) + '.zip')
+
+        # Архив пишется потоком прямо в multipart upload: mp4 уже сжат, поэтому ZIP_STORED,
+        # а каждый файл читается из хранилища блоками — память не зависит от размера пачки.
+        # При ошибке S3MultipartWriter отменяет upload, и недописанные части не остаются в MinIO
+        with S3MultipartWriter(RESULT_STORAGE, name) as stream:
+            with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+                for file in edited_files:
+                    # Тело ответа S3 держит соединение из пула, пока его не закроют
+                    with archive.open(file.file.name, 'w', force_zip64=True) as member, \
+                            contextlib.closing(file.open_stream()) as source:
+                        shutil.copyfileobj(source, member, settings.STREAM_CHUNK_SIZE)
+
+        timings = "\n".join(f"{file.get_display_name()}: {file.danger_timings or ''}" for file in edited_files)
+        request.update_batch_result(timings, failed_files)
+        request.set_file_name(name)
+        request.update_status_done()
+    except Exception as e:
+        print(f"Не удалось собрать архив запроса {request.id}: {e}")
+        # Иначе запрос навсегда остался бы в обработке
+        request.update_status_failed(str(e))
+        return False
+    finally:
+        request.update_expiration_date()
+        # Место в планировщике освобождается и при ошибке, не дожидаясь SCHEDULER_JOB_TIMEOUT
+        scheduler.finish_job(request.id)
 
     return True
 
 
 @app.task
 def task_clear_requests():
-    requests = Request.objects.all()
-    for request in requests:
-        if request.expiration_date is None:
-            request.update_expiration_date()
-        elif request.expiration_date < timezone.now():
-            request.delete()
+    deadline = monotonic() + settings.CLEAR_REQUESTS_TIME_BUDGET
+    now = timezone.now()
+
+    Request.objects.filter(expiration_date__isnull=True).update(expiration_date=now + timezone.timedelta(hours=1))
+
+    # Индекс по expiration_date: каждая пачка — один запрос, остаток доберет следующий запуск
+    while monotonic() < deadline:
+        expired_ids = list(
+            Request.objects.filter(expiration_date__lt=now)
+            .exclude(job__state__in=[JobState.QUEUED, JobState.RUNNING])
+            .order_by('expiration_date')
+            .values_list('id', flat=True)[:settings.CLEAR_REQUESTS_BATCH_SIZE]
+        )
+        if not expired_ids:
+            break
+        Request.delete_bulk(expired_ids)
     return True
+
+
+@app.task
+def task_dispatch_jobs():
+    """Страховка планировщика: подбирает задачи, которые не запустились по событиям"""
+    return scheduler.dispatch()